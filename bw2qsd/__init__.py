@@ -61,13 +61,39 @@ if 'biosphere3' not in bw2.databases:
     bw2.bw2setup()
 
 
+from ._logger import *
 from .utils import *
+from ._profiler import *
+from ._cache import *
+from ._matrices import *
+from ._bundle import *
+from ._methods import *
+from ._engine import *
+from ._index import *
+from ._inventory import *
+from ._writer import *
+from ._sources import *
+from ._linker import *
+from ._jsonld import *
 from ._db_downloader import *
 from ._cf_getter import *
 
 from . import (
     _exceptions,
     utils,
+    _logger,
+    _profiler,
+    _cache,
+    _matrices,
+    _bundle,
+    _methods,
+    _engine,
+    _index,
+    _inventory,
+    _writer,
+    _sources,
+    _linker,
+    _jsonld,
     _db_downloader,
     _cf_getter,
     )
@@ -75,6 +101,19 @@ from . import (
 __all__ = (
     'bw2_version',
     'remove_setup_pickle',
+    *_logger.__all__,
+    *_profiler.__all__,
+    *_cache.__all__,
+    *_matrices.__all__,
+    *_bundle.__all__,
+    *_methods.__all__,
+    *_engine.__all__,
+    *_index.__all__,
+    *_inventory.__all__,
+    *_writer.__all__,
+    *_sources.__all__,
+    *_linker.__all__,
+    *_jsonld.__all__,
     *_db_downloader.__all__,
     *_cf_getter.__all__,
     )
\ No newline at end of file
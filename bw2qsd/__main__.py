@@ -0,0 +1,18 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+BW2QSD: Bridging Brightway2 and QSD packages for LCA
+
+This module is developed by:
+    Yalin Li <mailto.yalin.li@gmail.com>
+
+This module is under the University of Illinois/NCSA Open Source License.
+Please refer to https://github.com/QSD-Group/BW2QSD/blob/main/LICENSE.txt
+for license details.
+'''
+
+import sys
+from ._cli import main
+
+sys.exit(main())
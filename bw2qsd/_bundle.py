@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+BW2QSD: Bridging Brightway2 and QSD packages for LCA
+
+This module is developed by:
+    Yalin Li <mailto.yalin.li@gmail.com>
+
+This module is under the University of Illinois/NCSA Open Source License.
+Please refer to https://github.com/QSD-Group/BW2QSD/blob/main/LICENSE.txt
+for license details.
+'''
+
+import os, json
+import numpy as np
+from warnings import warn
+from ._logger import get_logger
+
+__all__ = ('CFBundle', 'load_bundle',)
+
+logger = get_logger('bundle')
+
+_BUNDLE_VERSION = 1
+
+# Brightway2 units to the ones recognized by QSD packages, only units with exact equivalents
+# are included (e.g., "person kilometer" is not "km")
+_qsd_units = {
+    'kilogram': 'kg',
+    'gram': 'g',
+    'ton': 'tonne',
+    'cubic meter': 'm3',
+    'liter': 'L',
+    'square meter': 'm2',
+    'meter': 'm',
+    'kilometer': 'km',
+    'kilowatt hour': 'kWh',
+    'megajoule': 'MJ',
+    'kilojoule': 'kJ',
+    'ton kilometer': 'tonne*km',
+    'hour': 'hr',
+    'unit': 'ea',
+    }
+
+
+class CFBundle:
+    '''
+    Characterization factors with the metadata of the indicators and activities,
+    saved as one binary file (numpy npz with the metadata as JSON) that can be
+    loaded without parsing text tables, and converted to
+    :class:`qsdsan.ImpactIndicator` and :class:`qsdsan.ImpactItem` objects in bulk.
+
+    Parameters
+    ----------
+    indicators : list
+        Indicators as dicts with "ID", "alias", "unit", "method", and "description",
+        "method" being the key of the impact assessment method.
+    activities : list
+        Activities as dicts with "ID", "key", "name", "reference product", "location", and "unit".
+    CFs : :class:`numpy.ndarray`
+        Characterization factors (activities x indicators).
+
+    Tip
+    ---
+    Use :func:`CFgetter.export_bundle` to create the bundle and :func:`load_bundle` to load it.
+    '''
+
+    __slots__ = ('indicators', 'activities', 'CFs')
+
+    def __init__(self, indicators, activities, CFs):
+        CFs = np.asarray(CFs, dtype=np.float64)
+        if CFs.shape != (len(activities), len(indicators)):
+            raise ValueError(f'Shape of `CFs` {CFs.shape} does not match the number of ' \
+                             f'activities ({len(activities)}) and indicators ({len(indicators)}).')
+        self.indicators = list(indicators)
+        self.activities = list(activities)
+        self.CFs = CFs
+
+    def __repr__(self):
+        return f'<CFBundle: {len(self.activities)} activities, {len(self.indicators)} indicators>'
+
+    def save(self, path, compress=True):
+        '''
+        Save the bundle to the path (".npz" will be appended if not included).
+
+        Parameters
+        ----------
+        path : str
+            Path of the bundle file.
+        compress : bool
+            Whether to compress the file (smaller but slower to load).
+        '''
+        meta = {'version': _BUNDLE_VERSION,
+                'indicators': self.indicators, 'activities': self.activities}
+        save = np.savez_compressed if compress else np.savez
+        save(path, CFs=self.CFs, meta=np.array(json.dumps(meta)))
+        file_path, file_name = os.path.split(path)
+        logger.info(f'File "{file_name}" has been exported to "{file_path}".')
+
+    @classmethod
+    def load(cls, path):
+        '''Load the bundle from the path.'''
+        with np.load(path, allow_pickle=False) as f:
+            meta = json.loads(f['meta'].item())
+            CFs = f['CFs']
+        if meta.get('version', 0) > _BUNDLE_VERSION:
+            raise ValueError(f'Bundle version {meta["version"]} is not supported, ' \
+                             'please update BW2QSD.')
+        for act in meta['activities']:
+            act['key'] = tuple(act['key'])
+        for ind in meta['indicators']:
+            ind['method'] = tuple(ind['method'])
+        return cls(meta['indicators'], meta['activities'], CFs)
+
+    def to_frame(self):
+        '''Return the characterization factors as a :class:`pandas.DataFrame`.'''
+        import pandas as pd
+        columns = pd.MultiIndex.from_tuples(
+            [(ind['ID'], ind['unit']) for ind in self.indicators], names=('indicator', 'unit'))
+        index = pd.Index([act['ID'] for act in self.activities], name='activity')
+        return pd.DataFrame(self.CFs, index=index, columns=columns)
+
+    def to_qsdsan(self, unit_formatter=None):
+        '''
+        Create :class:`qsdsan.ImpactIndicator` and :class:`qsdsan.ImpactItem` objects
+        (requires the `qsdsan` package).
+
+        Parameters
+        ----------
+        unit_formatter : callable
+            Function to convert the units of the activities to the functional units
+            of the impact items, defaulted to converting common Brightway2 units
+            (e.g., "kilogram" to "kg"), units without exact equivalents
+            (e.g., "person kilometer") are kept as they are with a warning.
+
+        Returns
+        -------
+        indicators : list
+            The created :class:`qsdsan.ImpactIndicator` objects.
+        items : list
+            The created :class:`qsdsan.ImpactItem` objects.
+        '''
+        try:
+            from qsdsan import ImpactIndicator, ImpactItem
+        except ImportError:
+            raise ImportError('Creating impact indicators and items requires ' \
+                              'the `qsdsan` package.') from None
+        if unit_formatter is None:
+            unmapped = sorted({act['unit'] for act in self.activities}.difference(_qsd_units))
+            if unmapped:
+                warn(f'Units {unmapped} have no equivalents in QSD packages and are kept ' \
+                     'as they are, provide `unit_formatter` to convert them.')
+            unit_formatter = lambda unit: _qsd_units.get(unit, unit)
+
+        indicators = [ImpactIndicator(ID=ind['ID'], synonym=ind['alias'],
+                                      method=ind['method'][0], category=ind['method'][1],
+                                      unit=ind['unit'], description=ind['description'])
+                      for ind in self.indicators]
+        IDs = [ind['ID'] for ind in self.indicators]
+        items = [ImpactItem(ID=act['ID'], functional_unit=unit_formatter(act['unit']),
+                            **dict(zip(IDs, CFs)))
+                 for act, CFs in zip(self.activities, self.CFs.tolist())]
+        return indicators, items
+
+
+def load_bundle(path):
+    '''
+    Load the characterization factors exported through :func:`CFgetter.export_bundle`.
+
+    Parameters
+    ----------
+    path : str
+        Path of the bundle file.
+
+    Returns
+    -------
+    bundle : :class:`CFBundle`
+        The loaded bundle, use its `to_qsdsan` method to create
+        :class:`qsdsan.ImpactIndicator` and :class:`qsdsan.ImpactItem` objects.
+    '''
+    return CFBundle.load(path)
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+BW2QSD: Bridging Brightway2 and QSD packages for LCA
+
+This module is developed by:
+    Yalin Li <mailto.yalin.li@gmail.com>
+
+This module is under the University of Illinois/NCSA Open Source License.
+Please refer to https://github.com/QSD-Group/BW2QSD/blob/main/LICENSE.txt
+for license details.
+'''
+
+import os, json, time, shutil, hashlib, threading, appdirs
+from contextlib import contextmanager
+from ._logger import get_logger
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+__all__ = ('CacheManager', 'download_cache',)
+
+logger = get_logger('cache')
+
+# Maximum size of the cache in bytes, can be set through the environment variable
+_ENV_VAR = 'BW2QSD_CACHE_SIZE'
+_default_max_size = 20e9
+
+
+def _lock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError: # gives up after 10 s
+                pass
+
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _sha256(fp, chunk_size=1024*1024):
+    sha = hashlib.sha256()
+    with open(fp, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class CacheManager:
+    '''
+    Cache of the downloaded archives (e.g., ecoinvent 7z files, the FORWAST package),
+    tracked through a manifest of their content hashes, sizes, versions,
+    and last-access times.
+
+    Files are stored by their content hashes, so identical archives downloaded
+    under different names are only stored once, lookups by name only read the
+    manifest (no globbing or hashing), and the least recently used files are removed
+    when the total size exceeds `max_size`.
+
+    The cache can be shared by multiple processes, the manifest is read again
+    under a lock file for each operation and replaced atomically when changed.
+
+    Parameters
+    ----------
+    root : str
+        Directory of the cache, defaulted to the "cache" directory
+        in the user data storage directory of BW2QSD.
+    max_size : float
+        Maximum total size of the cached files in bytes, defaulted to the
+        "BW2QSD_CACHE_SIZE" environment variable or 20 GB, None for unbounded.
+    '''
+
+    __slots__ = ('root', 'max_size', '_manifest', '_lock', '_depth')
+
+    def __init__(self, root='', max_size=-1):
+        self.root = root or os.path.join(
+            appdirs.user_data_dir(appname='BW2QSD', appauthor='bw2qsd'), 'cache')
+        if max_size == -1:
+            max_size = float(os.environ.get(_ENV_VAR, _default_max_size))
+        self.max_size = max_size
+        self._manifest = None
+        self._lock = threading.RLock()
+        self._depth = 0
+
+    def __repr__(self):
+        return f'<CacheManager: {len(self)} files, {self.size/1e6:.1f} MB>'
+
+    def __len__(self):
+        with self._locked():
+            return len(self.manifest['entries'])
+
+    def __contains__(self, name):
+        return self.get(name, touch=False) is not None
+
+    @property
+    def manifest(self):
+        '''[dict] Entries (by name) and files (by content hash) of the cache.'''
+        if self._manifest is None:
+            fp = os.path.join(self.root, 'manifest.json')
+            try:
+                with open(fp) as f:
+                    self._manifest = json.load(f)
+            except (FileNotFoundError, ValueError):
+                self._manifest = {'entries': {}, 'files': {}}
+        return self._manifest
+
+    @contextmanager
+    def _locked(self):
+        # Hold the lock of the threads and the lock file of the processes,
+        # the manifest is read again when first acquired as other processes may have changed it
+        with self._lock:
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield
+                finally:
+                    self._depth -= 1
+                return
+            os.makedirs(self.root, exist_ok=True)
+            with open(os.path.join(self.root, 'manifest.lock'), 'a+') as f:
+                _lock_file(f)
+                self._depth = 1
+                try:
+                    self._manifest = None
+                    yield
+                finally:
+                    self._depth = 0
+                    _unlock_file(f)
+
+    def _save(self):
+        os.makedirs(self.root, exist_ok=True)
+        fp = os.path.join(self.root, 'manifest.json')
+        tmp = f'{fp}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, fp)
+
+    @property
+    def size(self):
+        '''[int] Total size of the cached files in bytes.'''
+        with self._locked():
+            return sum(f['size'] for f in self.manifest['files'].values())
+
+    def items(self):
+        '''Return the (name, path) of the cached files.'''
+        with self._locked():
+            files = self.manifest['files']
+            return [(name, files[e['sha256']]['path']) for name, e in self.manifest['entries'].items()]
+
+    def info(self, name):
+        '''Return the manifest entry of the cached file, None if not cached.'''
+        with self._locked():
+            entry = self.manifest['entries'].get(name)
+            return None if entry is None else {**entry, **self.manifest['files'][entry['sha256']]}
+
+    def get(self, name, touch=True):
+        '''
+        Return the path of the cached file, None if not cached.
+
+        Parameters
+        ----------
+        name : str
+            Name of the file (e.g., "cutoff38.7z").
+        touch : bool
+            Whether to update the last-access time of the file.
+        '''
+        with self._locked():
+            entry = self.manifest['entries'].get(name)
+            if entry is None:
+                return None
+            record = self.manifest['files'][entry['sha256']]
+            path = record['path']
+            try:
+                if os.path.getsize(path) != record['size']:
+                    raise FileNotFoundError(path)
+            except OSError: # removed or changed outside of the cache
+                self._drop(entry['sha256'])
+                self._save()
+                return None
+            if touch:
+                entry['last_access'] = record['last_access'] = time.time()
+                self._save()
+            return path
+
+    def put(self, name, fp, version='', move=True):
+        '''
+        Add a file to the cache and return its cached path.
+
+        Parameters
+        ----------
+        name : str
+            Name of the file.
+        fp : str
+            Path of the file.
+        version : str
+            Version of the data (e.g., "3.8"), only recorded in the manifest.
+        move : bool
+            Whether to move the file into the cache,
+            if False, the file will be tracked at its current path.
+        '''
+        size = os.path.getsize(fp)
+        sha = _sha256(fp)
+        with self._locked():
+            files, now = self.manifest['files'], time.time()
+            record = files.get(sha)
+            if record is not None and os.path.isfile(record['path']):
+                if os.path.abspath(fp) != os.path.abspath(record['path']) and move:
+                    os.remove(fp) # duplicate of a cached file
+                logger.info(f'"{name}" is identical to a cached file, not stored again.')
+            else:
+                path = fp
+                if move:
+                    path = os.path.join(self.root, 'files', sha, os.path.basename(fp))
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    shutil.move(fp, path)
+                record = files[sha] = {'path': path, 'size': size}
+            record['last_access'] = now
+            old = self.manifest['entries'].get(name)
+            self.manifest['entries'][name] = {
+                'sha256': sha, 'version': version, 'added': now, 'last_access': now}
+            if old and old['sha256'] != sha and not self._users(old['sha256']):
+                self._drop(old['sha256'])
+            self._evict(self.max_size, keep=sha)
+            self._save()
+            return record['path']
+
+    def remove(self, name):
+        '''Remove the file from the cache (the file is kept if also cached under other names).'''
+        with self._locked():
+            entry = self.manifest['entries'].pop(name, None)
+            if entry is not None and not self._users(entry['sha256']):
+                self._drop(entry['sha256'])
+            self._save()
+
+    def evict(self, max_size=None):
+        '''Remove the least recently used files until the total size is within the limit.'''
+        with self._locked():
+            self._evict(self.max_size if max_size is None else max_size)
+            self._save()
+
+    def _evict(self, max_size, keep=None):
+        if max_size is None:
+            return
+        files = self.manifest['files']
+        total = self.size
+        for sha in sorted(files, key=lambda k: files[k].get('last_access', 0)):
+            if total <= max_size:
+                break
+            if sha != keep:
+                total -= files[sha]['size']
+                logger.info(f'Removing {files[sha]["path"]} from cache (least recently used).')
+                self._drop(sha)
+
+    def clear(self):
+        '''Remove all cached files.'''
+        with self._locked():
+            for sha in list(self.manifest['files']):
+                self._drop(sha)
+            self._save()
+
+    def _users(self, sha):
+        return [n for n, e in self.manifest['entries'].items() if e['sha256'] == sha]
+
+    def _drop(self, sha):
+        record = self.manifest['files'].pop(sha, None)
+        for name in self._users(sha):
+            del self.manifest['entries'][name]
+        if record is not None:
+            try:
+                os.remove(record['path'])
+            except FileNotFoundError:
+                pass
+            folder = os.path.dirname(record['path'])
+            if os.path.basename(folder) == sha:
+                shutil.rmtree(folder, ignore_errors=True)
+
+
+download_cache = CacheManager()
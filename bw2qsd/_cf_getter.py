@@ -19,16 +19,33 @@ TODO:
 '''
 
 
-import sys, os
+import os, json, threading
+import numpy as np
 import pandas as pd
 import brightway2 as bw2
 from collections.abc import Iterable
-from warnings import warn
+from types import MappingProxyType
+from scipy import sparse
+from concurrent.futures import ThreadPoolExecutor
+from warnings import warn, catch_warnings, simplefilter
 from bw2data.backends.peewee import Activity
+from ._bundle import CFBundle
+from ._engine import LCAEngine
+from ._index import ActivityIndex, _get_activities, _query_activities, _query_exchanges
+from ._inventory import _InventoryWriter, load_inventories
+from ._logger import get_logger, progress
+from ._matrices import MatrixSet, load_cached_matrices, _fingerprint
+from ._methods import validate_methods
+from ._profiler import profiler, profiled
 from .utils import export_df, format_name
 
 __all__ = ('CFgetter',)
 
+# Version of the files saved through `CFgetter.save`
+_STATE_VERSION = 1
+
+logger = get_logger('getter')
+
 
 def _filter_inds(inds, cats, include):
     for n, cat in enumerate(cats):
@@ -50,6 +67,99 @@ def _filter_inds(inds, cats, include):
     return inds
 
 
+def _categorical(values, codes):
+    # Categorical column of values[codes] without building the Python list of the values
+    categories, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+    return pd.Categorical.from_codes(inverse[codes], categories=categories)
+
+
+def _sparse_CFs(results, threshold, names, acts, inds, ind_units):
+    # Long-format table of the characterization factors above the threshold
+    CFs = sparse.coo_matrix(np.where(np.abs(results) > threshold, results, 0.))
+    profiler.count('nonzero CFs', CFs.nnz)
+    order = np.lexsort((CFs.col, CFs.row))
+    rows, cols = CFs.row[order], CFs.col[order]
+    return pd.DataFrame({
+        'activity': _categorical([str(n) for n in names], rows),
+        'activity name': _categorical([a['name'] for a in acts], rows),
+        'functional unit': _categorical([a['unit'] for a in acts], rows),
+        'database': _categorical([a.key[0] for a in acts], rows),
+        'method': _categorical([ind[0] for ind in inds], cols),
+        'category': _categorical([ind[1] for ind in inds], cols),
+        'indicator': _categorical([ind[2] for ind in inds], cols),
+        'unit': _categorical(ind_units[:len(inds)], cols),
+        'CF': CFs.data[order],
+        })
+
+
+def _exchange_amounts(pairs):
+    # Current (type, amount) of the exchanges by (input key, output key), summed over duplicates,
+    # exchanges with the same input and output are the production exchanges
+    amounts = {}
+    pairs = set(pairs)
+    for out, inp, kind, data in _query_exchanges({out for _, out in pairs}):
+        if (inp, out) not in pairs or (kind == 'production') != (inp == out):
+            continue
+        old_kind, amount = amounts.get((inp, out), (kind, 0.))
+        if old_kind != kind:
+            raise ValueError(f'Exchanges from {inp} to {out} are of different types ' \
+                             f'("{old_kind}" and "{kind}"), the change is ambiguous.')
+        amounts[(inp, out)] = (kind, amount + data.get('amount', 0.))
+    return amounts
+
+
+def _restore_key(key):
+    # Keys of the activities saved as JSON, tuples (e.g., database keys) become lists
+    return tuple(_restore_key(k) for k in key) if isinstance(key, list) else key
+
+
+def _check_keys(keys):
+    # Keys of the activities must survive being saved as JSON
+    for key in keys:
+        try:
+            restored = _restore_key(json.loads(json.dumps(key)))
+        except TypeError:
+            restored = None
+        if restored != key or type(restored) is not type(key):
+            raise ValueError(f'Activity key {key!r} cannot be saved, only str, numbers, ' \
+                             'and tuples of them are supported.')
+    return keys
+
+
+def _per_indicator(values, inds, kind):
+    # Values aligned with the indicators, from a dict keyed by the indicators or values in order
+    if values is None:
+        return [None] * len(inds)
+    if hasattr(values, 'items'):
+        values = dict(values.items())
+        return [_bw_name(values.get(ind)) for ind in inds]
+    values = [_bw_name(v) for v in values]
+    if len(values) != len(inds):
+        raise ValueError(f'The number of {kind} values ({len(values)}) does not match ' \
+                         f'the number of indicators ({len(inds)}).')
+    return values
+
+
+def _bw_name(value):
+    # Names of Brightway2 normalizations/weightings are tuples
+    if isinstance(value, str):
+        return (value,)
+    return tuple(value) if isinstance(value, (tuple, list)) else value
+
+
+def _weighting_factor(weighting):
+    if weighting is None:
+        return 1.
+    if not isinstance(weighting, tuple):
+        return float(weighting)
+    if weighting not in bw2.weightings:
+        raise ValueError(f'Weighting {weighting} not found in `bw2.weightings`.')
+    data = bw2.Weighting(weighting).load()
+    if len(data) != 1:
+        raise ValueError(f'Weighting {weighting} should have one value, not {len(data)}.')
+    return float(data[0]['amount'] if isinstance(data[0], dict) else data[0])
+
+
 class CFgetter:
     '''
     To get environmental impact characterization factors from databases through
@@ -60,7 +170,7 @@ class CFgetter:
     ---
     Basic steps:
 
-        [1] Load database (you can only load one at a time).
+        [1] Load database (you can load multiple, the first one is the primary database).
 
         [2] Load indicators (you can load multiple).
 
@@ -71,6 +181,13 @@ class CFgetter:
 
         You need to first download the database using :class:`DataDownloader`.
 
+    .. note::
+
+        A getter can be shared by multiple threads (e.g., in a service),
+        changes of the loaded databases, indicators, and activities are made
+        under a lock by replacing (rather than mutating) the containers,
+        so calculations running in other threads keep using consistent snapshots.
+
 
     See Also
     --------
@@ -78,19 +195,25 @@ class CFgetter:
 
     '''
 
-    __slots__ = ('name', '_database', '_indicators', '_activities', '_CFs')
+    __slots__ = ('name', '_databases', '_indicators', '_activities', '_CFs', '_results',
+                 '_engines', '_index', '_lock')
 
     def __init__(self, name):
         self.name = name
-        self._database = None
+        self._databases = {}
         self._indicators = set()
         self._activities = {}
         self._CFs = None
+        self._results = None
+        self._engines = {}
+        self._index = None
+        self._lock = threading.RLock()
 
     def __repr__(self):
         return f'<CFgetter: {self.name}>'
 
-    def load_database(self, database):
+    @profiled('load_database')
+    def load_database(self, database, shared=None, cache=True, add=False):
         '''
         Load designated database.
 
@@ -98,6 +221,24 @@ class CFgetter:
         ----------
         database: str
             Name of the database.
+        shared : str
+            Name of the matrices published to shared memory through
+            :func:`publish_matrices`, if provided, the matrices will be
+            attached (read-only) instead of being loaded by this getter.
+        cache : bool
+            Whether to memory-map the processed matrices of the database from
+            the cache (built on the first load and whenever the database is processed again).
+            If False, the matrices will be built in memory when getting characterization factors.
+        add : bool
+            Whether to load the database in addition to the loaded ones
+            (e.g., to compare characterization factors across databases),
+            if False, the loaded database(s) will be replaced.
+
+        Tip
+        ---
+        When multiple databases are loaded, the first one is the primary database
+        (i.e., the `database` property), activities of the other databases are keyed by
+        "<activity name> (<database name>)" when loaded.
         '''
         db_lower = database.lower()
 
@@ -105,14 +246,35 @@ class CFgetter:
             raise ValueError(f'Database "{database}" not available. ' \
                              'Please first download the data using `DataDownloader`.')
         else:
-            self._database = db = bw2.Database(database)
-
-        print(f'Database {db} with {len(db)} inventories has been loaded.')
+            db = bw2.Database(database)
+
+        engine = None
+        if shared:
+            matrices = MatrixSet.from_shared_memory(shared)
+            if matrices.database != database:
+                raise ValueError(f'The shared matrices "{shared}" are of database ' \
+                                 f'"{matrices.database}", not "{database}".')
+            engine = LCAEngine(matrices)
+        elif cache:
+            with profiler.stage('matrix loading'):
+                engine = LCAEngine(load_cached_matrices(database))
+
+        with self._lock:
+            databases = {**self._databases} if add else {}
+            engines = {**self._engines} if add else {}
+            databases[database] = db
+            engines.pop(database, None)
+            if engine is not None:
+                engines[database] = engine
+            self._databases, self._engines, self._index = databases, engines, None
+
+        logger.info(f'Database {db} with {len(db)} inventories has been loaded.')
 
 
     def load_indicators(self, add=False, method='', method_exclude='',
                         category='', category_exclude='',
-                        indicator='', indicator_exclude=''):
+                        indicator='', indicator_exclude='',
+                        validate=False, reprocess=False, on_error='raise'):
         '''
         Select and/or load designated impact indicators.
 
@@ -134,6 +296,14 @@ class CFgetter:
             Name of the indicator (e.g., global warming).
         indicator_exclude: str or Iterable
             Strings to be excluded from the indicator field.
+        validate : bool
+            Whether to check that the processed data of the indicators exist when loading.
+        reprocess : bool
+            Whether to reprocess (in parallel) the indicators without processed data
+            when validating.
+        on_error : str
+            Handling of the invalid indicators when validating,
+            "raise" to raise an error listing all of them, "skip" to skip them with a warning.
 
         Tip
         ---
@@ -149,16 +319,34 @@ class CFgetter:
                                   False)
 
         if add:
-            self._indicators = self._indicators.union(set(indicators))
-            msg = 'indicator' if len(indicators) > 1 else 'indicators'
-            print(f'\n{len(indicators)} {msg} loaded/updated for {self.name}.')
+            if validate:
+                indicators = self._validate(indicators, reprocess, on_error)
+            with self._lock:
+                self._indicators = self._indicators.union(set(indicators))
+            msg = 'indicators' if len(indicators) > 1 else 'indicator'
+            logger.info(f'{len(indicators)} {msg} loaded/updated for {self.name}.')
 
         else:
             return indicators
 
 
+    @staticmethod
+    def _validate(inds, reprocess=False, on_error='raise'):
+        # Return the valid indicators, invalid ones are raised or skipped
+        if on_error not in ('raise', 'skip'):
+            raise ValueError(f'`on_error` can only be "raise" or "skip", not "{on_error}".')
+        invalid = validate_methods(inds, reprocess=reprocess)
+        if not invalid:
+            return list(inds)
+        details = '\n'.join(f'    {ind}: {reason}' for ind, reason in invalid.items())
+        if on_error == 'raise':
+            raise ValueError(f'{len(invalid)} indicator(s) cannot be used:\n{details}')
+        logger.warning(f'{len(invalid)} indicator(s) skipped:\n{details}')
+        return [ind for ind in inds if tuple(ind) not in invalid]
+
+    @profiled('load_activities')
     def load_activities(self, string: str, add: bool, limit=20, show=False,
-                        **kwargs):
+                        database=None, key_formatter=None, **kwargs):
         '''
         Select and/or load activities of interest.
 
@@ -174,6 +362,14 @@ class CFgetter:
             Maximum number of search results to return.
         show : bool
             Whether to print the detailed information associated with the activities.
+        database : str
+            Name of the loaded database to search in,
+            will be defaulted to the primary database if not provided.
+        key_formatter : Callable
+            Function taking the activity and returning its key in the `activities` property,
+            e.g., `lambda act: f"{act['name']} [{act['location']}]"` to keep
+            the regional variants of an activity.
+            Activities are keyed by their names if not provided.
         kwargs :
             Other keyword arguments that will be passed to `bw2data`.
 
@@ -182,21 +378,134 @@ class CFgetter:
         :func:`search` in `bw2data SQLiteBackend <https://2.docs.brightway.dev/technical/bw2data.html#default-backend-databases-stored-in-a-sqlite-database>`_
 
         '''
-        activities = self.database.search(string, limit=limit, **kwargs)
-        act_dct = {act.as_dict()['name']: act for act in activities}
+        db = self._get_database(database)
+        with profiler.stage('search'):
+            activities = db.search(string, limit=limit, **kwargs)
+        profiler.count('search results', len(activities))
+        act_dct = {self._activity_key(act, key_formatter): act for act in activities}
+
+        for act in activities:
+            if show:
+                self.show_activity(act)
+
+        if add:
+            with self._lock:
+                self._activities = {**self._activities, **act_dct}
+            msg = 'activities' if len(act_dct) > 1 else 'activity'
+            logger.info(f'{len(act_dct)} {msg} loaded/updated for {self.name}.')
+
+        else:
+            return act_dct
+
+    def load_activities_by_keys(self, keys, add: bool, show=False, key_formatter=None):
+        '''
+        Select and/or load activities by their database keys without searching.
+
+        Parameters
+        ----------
+        keys : iterable
+            Keys of the activities, each as a tuple of (database name, activity code).
+        add : bool
+            Whether to include the activities in impact assessment for characterization factors.
+            If False, a dict of the activities with the given keys will be returned.
+        show : bool
+            Whether to print the detailed information associated with the activities.
+        key_formatter : Callable
+            Function taking the activity and returning its key in the `activities` property,
+            activities are keyed by their names if not provided.
+
+        Tip
+        ---
+        The key of an activity can be found through its `key` attribute,
+        e.g., `act.key` for an activity returned from :func:`load_activities`.
+
+        '''
+        keys = [tuple(key) for key in keys]
+        found = _get_activities(keys)
+        missing = [key for key in keys if key not in found]
+        if missing:
+            from bw2data.errors import UnknownObject
+            raise UnknownObject(f'{len(missing)} activity(ies) not found, e.g., {missing[:5]}.')
+        activities = [found[key] for key in keys]
+        act_dct = {self._activity_key(act, key_formatter): act for act in activities}
 
         for act in activities:
             if show:
                 self.show_activity(act)
 
         if add:
-            self._activities.update(act_dct)
+            with self._lock:
+                self._activities = {**self._activities, **act_dct}
             msg = 'activities' if len(act_dct) > 1 else 'activity'
-            print(f'{len(act_dct)} {msg} loaded/updated for {self.name}.\n')
+            logger.info(f'{len(act_dct)} {msg} loaded/updated for {self.name}.')
 
         else:
             return act_dct
 
+    def _get_database(self, database=None):
+        if database is None:
+            if self.database is None:
+                raise ValueError('No loaded database.')
+            return self.database
+        try:
+            return self._databases[database]
+        except KeyError:
+            raise ValueError(f'Database "{database}" not loaded, ' \
+                             'use `load_database(database, add=True)` to load it.') from None
+
+    def load_activities_by_location(self, name, product=None, locations=(),
+                                    add=True, show=False):
+        '''
+        Select and/or load all regional variants of an activity through
+        the location index (i.e., without searching),
+        the activities are keyed by "<activity name> [<location>]".
+
+        Parameters
+        ----------
+        name : str
+            Exact name of the activity.
+        product : str
+            Exact reference product of the activity,
+            all reference products will be included if not provided.
+        locations : str or Iterable
+            Location(s) of the activity (e.g., "GLO", "RER", "US"),
+            all locations will be included if not provided.
+        add : bool
+            Whether to include the activities in impact assessment for characterization factors.
+            If False, a dict of the activities will be returned.
+        show : bool
+            Whether to print the detailed information associated with the activities.
+
+        See Also
+        --------
+        :func:`get_CFs_by_location`
+        '''
+        index = self.location_index
+        keys = [index.keys[n] for n in self._find_variants(name, product, locations)]
+        return self.load_activities_by_keys(keys, add=add, show=show,
+                                            key_formatter=self._location_key)
+
+    @staticmethod
+    def _location_key(act):
+        return f"{act['name']} [{act['location']}]"
+
+    def _find_variants(self, name, product, locations):
+        found = self.location_index.find(name=name, product=product, locations=locations)
+        if not found:
+            product = f' with reference product "{product}"' if product else ''
+            raise ValueError(f'No activities named "{name}"{product} ' \
+                             'in the loaded database(s).')
+        return found
+
+    def _activity_key(self, act, key_formatter=None):
+        if key_formatter is not None:
+            return key_formatter(act)
+        name = act['name']
+        database = act.key[0]
+        if self._databases and database != next(iter(self._databases)):
+            return f'{name} ({database})'
+        return name
+
     def show_activity(self, activity=None, **kwargs):
         '''
         Show detailed description about an activity.
@@ -248,6 +557,72 @@ class CFgetter:
         else:
             return dfs
 
+    @profiled('inspect_activities')
+    def inspect_activities(self, activities=(), exchanges=True, show=False, path=''):
+        '''
+        Show the information and exchanges of the loaded activities in one long-format
+        :class:`pandas.DataFrame` (one row per exchange), all activities are
+        read through a few bulk queries of the database.
+
+        Parameters
+        ----------
+        activities : iterable
+            Keys of the activities in the `activities` property.
+            Will be defaulted to all loaded activities if not provided.
+        exchanges : bool
+            Whether to include the exchanges, if False, there will be one row per activity.
+        show : bool
+            Whether to print the generated :class:`pandas.DataFrame` in the console.
+        path : str
+            If provided, the :class:`pandas.DataFrame` will be saved to the given file path.
+
+        Returns
+        -------
+        df: :class:`pandas.DataFrame`
+            Information (and exchanges) of the activities.
+
+        See Also
+        --------
+        :func:`show_activity` for all fields of one activity.
+        '''
+        if not self.activities:
+            raise ValueError('No loaded activities.')
+        names = list(activities) if activities else list(self.activities.keys())
+        keys = [self.activities[k].key for k in names]
+
+        with profiler.stage('query'):
+            info = _query_activities(keys)
+            rows = _query_exchanges(keys) if exchanges else []
+            inputs = _query_activities({row[1] for row in rows}, data=False)
+
+        columns = ['activity', 'database', 'code', 'activity name', 'reference product',
+                   'location', 'unit']
+        acts = {}
+        for name, key in zip(names, keys):
+            act_name, product, location, data = info.get(key, ('', '', '', {}))
+            acts.setdefault(key, []).append(
+                (name, *key, act_name, product, location, data.get('unit', '')))
+
+        with profiler.stage('dataframe'):
+            if exchanges:
+                columns += ['exchange type', 'amount', 'exchange unit', 'input name',
+                            'input reference product', 'input location',
+                            'input database', 'input code']
+                records = []
+                for output, inp, kind, data in rows:
+                    inp_name, inp_product, inp_location = \
+                        inputs.get(inp, (data.get('name', ''), '', ''))
+                    exchange = (kind, data.get('amount'), data.get('unit', ''),
+                                inp_name, inp_product, inp_location, *inp)
+                    records.extend((*act, *exchange) for act in acts[output])
+            else:
+                records = [act for act_list in acts.values() for act in act_list]
+            df = pd.DataFrame(records, columns=columns)
+
+        profiler.count('exchanges inspected', len(rows))
+        export_df(df, path, show)
+        return df
+
 
     def remove(self, kind, keys):
         '''
@@ -264,22 +639,28 @@ class CFgetter:
         kind_lower = kind.lower()
         num = 0
         if kind_lower in ('indicator', 'indicators'):
-            for k in keys:
-                self._indicators.remove(k)
-                num += 1
+            with self._lock:
+                indicators = set(self._indicators)
+                for k in keys:
+                    indicators.remove(k)
+                    num += 1
+                self._indicators = indicators
             msg = 'indicators' if num > 1 else 'indicator'
 
         elif kind_lower in ('activity', 'activities'):
-            for k in keys:
-                self._activities.pop(k)
-                num += 1
+            with self._lock:
+                activities = {**self._activities}
+                for k in keys:
+                    activities.pop(k)
+                    num += 1
+                self._activities = activities
             msg = 'activities' if num > 1 else 'activity'
 
         else:
             raise ValueError('kind can only be "indicator" or "activity", ' \
                              f'not "{kind}".')
 
-        print(f'Successfully removed {num} {msg} from {self.name}.')
+        logger.info(f'Successfully removed {num} {msg} from {self.name}.')
 
     def export_indicators(self, indicators=(), aliases={}, descriptions={},
                           name_formatter=None, alias_formatter=None,
@@ -340,8 +721,75 @@ class CFgetter:
 
         return df
 
+    @profiled('export_bundle')
+    def export_bundle(self, path='', indicators=(), activities=(), aliases={}, descriptions={},
+                      name_formatter=None, alias_formatter=None, compress=True):
+        '''
+        Export the impact indicators, the activities, and their characterization factors
+        as one binary :class:`CFBundle` file, so that QSD packages can create
+        :class:`ImpactIndicator` and :class:`ImpactItem` objects without parsing text files.
 
-    def get_CFs(self, indicators=(), activities=(), show=False, path=''):
+        Parameters
+        ----------
+        path : str
+            If provided, the bundle will be saved to the given file path (".npz").
+        indicators : iterable
+            Keys of the indicators in the `indicators` property.
+            Will be defaulted to all loaded indicators if not provided.
+        activities : iterable
+            Keys of the activities in the `activities` property.
+            Will be defaulted to all loaded activities if not provided.
+        aliases : dict
+            Keys should be the keys of the indicators in the `indicators` property,
+            values should be the aliases of the indicators.
+        descriptions : dict
+            Keys should be the keys of the indicators in the `indicators` property,
+            values should be the descriptions of the indicators.
+        compress : bool
+            Whether to compress the file.
+
+        Returns
+        -------
+        bundle: :class:`CFBundle`
+            Indicators, activities, and characterization factors.
+
+        Tip
+        ---
+        Load the bundle through :func:`load_bundle` and use its `to_qsdsan` method
+        to create the :class:`ImpactIndicator` and :class:`ImpactItem` objects.
+
+        '''
+        if not self.indicators:
+            raise ValueError('No loaded indicators.')
+        elif not self.activities:
+            raise ValueError('No loaded activities.')
+        if not set(indicators).issubset(self.indicators):
+            raise ValueError('Provided indicator(s) not all loaded.')
+
+        inds = list(indicators) if indicators else self.indicators
+        name_formatter = name_formatter or format_name
+        alias_formatter = alias_formatter or (lambda ind: aliases.get(ind, ''))
+        names = list(activities) if activities else list(self.activities.keys())
+        acts = [self.activities[k] for k in names]
+        results = self._calculate([a.key for a in acts], inds)
+
+        bundle = CFBundle(
+            indicators=[{'ID': name_formatter(ind[2]), 'alias': alias_formatter(ind),
+                         'unit': bw2.methods.get(ind)['unit'], 'method': ind,
+                         'description': descriptions.get(ind, '')} for ind in inds],
+            activities=[{'ID': str(name), 'key': act.key, 'name': act['name'],
+                         'reference product': act.get('reference product', ''),
+                         'location': act.get('location', ''), 'unit': act.get('unit', '')}
+                        for name, act in zip(names, acts)],
+            CFs=results)
+        if path:
+            bundle.save(path, compress=compress)
+        return bundle
+
+
+    @profiled('get_CFs')
+    def get_CFs(self, indicators=(), activities=(), show=False, path='', *,
+                sparse=False, threshold=0., validate=True, reprocess=False, on_error='raise'):
         '''
         Get impact characterization factors.
 
@@ -356,7 +804,24 @@ class CFgetter:
         show : bool
             Whether to print all characterization factors in the console.
         path : str
-            If provided, the :class:`pandas.DataFrame` will be saved to the given file path.
+            If provided, the :class:`pandas.DataFrame` will be saved to the given file path,
+            ".npz" files are the most compact for the sparse mode.
+        sparse : bool
+            Whether to only return the nonzero characterization factors
+            in the long format (one row per activity and indicator).
+        threshold : float
+            Characterization factors with absolute values not larger than the threshold
+            are dropped in the sparse mode.
+        validate : bool
+            Whether to check that the processed data of all indicators exist
+            before calculating.
+        reprocess : bool
+            Whether to reprocess (in parallel) the indicators without processed data
+            when validating.
+        on_error : str
+            Handling of the invalid indicators when validating,
+            "raise" to raise an error listing all of them,
+            "skip" to leave them out of the results with a warning.
 
         Returns
         -------
@@ -368,55 +833,621 @@ class CFgetter:
         [1] Use `show_activity` to see the functional unit of the activity.
         The quantity will be 1.
 
-        [2] If you run into an "FileNotFoundError", most likely there are some
-        indicators that do not acutally have corresponding impact assessment methods,
-        try to load indicators one at a time to look for the culprit.
+        [2] If the activities are from multiple databases, they will be calculated
+        in parallel with the matrices of their own databases,
+        and a "database" column will be added.
+
+        [3] Indicators without processed impact assessment data are listed in the error
+        raised by the validation, set `reprocess` to True to reprocess them,
+        or `on_error` to "skip" to calculate the remaining ones.
 
         '''
+        loaded_inds, loaded_acts = self.indicators, self.activities # snapshots
+        if not loaded_inds:
+            raise ValueError('No loaded indicators.')
+        elif not loaded_acts:
+            raise ValueError('No loaded activities.')
+
+        if not set(indicators).issubset(loaded_inds):
+            raise ValueError('Provided indicator(s) not all loaded.')
+
+        inds = indicators if indicators else loaded_inds
+        if validate:
+            inds = self._validate(inds, reprocess, on_error)
+            if not inds:
+                raise ValueError('No valid indicators.')
+        names = list(activities) if activities else list(loaded_acts.keys())
+        acts = [loaded_acts[k] for k in names]
+
+        inds = list(inds)
+        results = self._calculate([a.key for a in acts], inds)
+        df = self._frame(inds, acts, names, results, sparse, threshold)
+
+        export_df(df, path, show)
+        with self._lock:
+            self._CFs = df
+            self._results = {'indicators': inds, 'activities': names, 'CFs': results,
+                             'sparse': sparse, 'threshold': threshold}
+
+        return df
+
+    @staticmethod
+    def _frame(inds, acts, names, results, sparse=False, threshold=0.):
+        # Table of the characterization factors (activities x indicators)
+        ind_units = [bw2.methods.get(i)['unit'] for i in inds] + ['-', '-']
+        databases = [a.key[0] for a in acts]
+        with profiler.stage('dataframe'):
+            if sparse:
+                df = _sparse_CFs(results, threshold, names, acts, inds, ind_units)
+                if len(set(databases)) == 1:
+                    df.drop(columns='database', inplace=True)
+                return df
+
+            # pd_indices = [a['name'] for a in acts]
+            pd_cols = pd.MultiIndex.from_tuples(inds, names=('method', 'category', 'indicator'))
+            cf_df = pd.DataFrame(data=results, columns=pd_cols)
+            unit_df = pd.DataFrame(data={k: v for k, v in zip(cf_df.columns, ind_units)},
+                                   index=[-1,], dtype='object')
+            # cf_df = pd.DataFrame(data=results, index=pd_indices, columns=pd_cols)
+            cf_df[('-', '-', 'activity name')] = [a['name'] for a in acts]
+            cf_df[('-', '-', 'functional unit')] = [a['unit'] for a in acts]
+            if len(set(databases)) > 1:
+                cf_df[('-', '-', 'database')] = databases
+
+            df = pd.concat((unit_df, cf_df))
+            df.sort_index(axis=1, inplace=True)
+            df.reset_index(drop=True, inplace=True)
+        return df
+
+    @profiled('get_single_scores')
+    def get_single_scores(self, normalization=None, weighting=None, indicators=(), activities=(),
+                          show=False, path=''):
+        '''
+        Get normalized and/or weighted impacts of the activities and their sums as single scores.
+
+        Normalization and weighting factors are applied to the matrix of
+        characterization factors (activities x indicators) at once,
+        i.e., the weighted impact of an indicator is CF * normalization * weighting,
+        and the single score is the sum over all indicators.
+
+        Parameters
+        ----------
+        normalization : dict or Iterable
+            Normalization of each indicator, as a dict keyed by the indicators
+            (indicators not included are not normalized) or values in the order of the indicators.
+            Each value can be a number (the normalization factor, e.g., 1/reference impact),
+            the name of a Brightway2 normalization (applied to the characterized
+            biosphere flows, as in `bw2calc`), or None (not normalized).
+        weighting : dict or Iterable
+            Weighting of each indicator, in the same format as `normalization`,
+            with each value being a number (the weighting factor), the name of a Brightway2 weighting,
+            or None (weighting factor of 1).
+        indicators : iterable
+            Keys of the indicators in the `indicators` property.
+            Will be defaulted to all loaded indicators if not provided.
+        activities : iterable
+            Keys of the activities in the `activities` property.
+            Will be defaulted to all loaded activities if not provided.
+        show : bool
+            Whether to print the results in the console.
+        path : str
+            If provided, the :class:`pandas.DataFrame` will be saved to the given file path.
+
+        Returns
+        -------
+        df: :class:`pandas.DataFrame`
+            Normalized and weighted impacts of one unit of each activity,
+            with the single scores in the "single score" column.
+
+        '''
+        loaded_inds, loaded_acts = self.indicators, self.activities
+        if not loaded_inds:
+            raise ValueError('No loaded indicators.')
+        elif not loaded_acts:
+            raise ValueError('No loaded activities.')
+        if not set(indicators).issubset(loaded_inds):
+            raise ValueError('Provided indicator(s) not all loaded.')
+
+        inds = list(indicators) if indicators else loaded_inds
+        names = list(activities) if activities else list(loaded_acts.keys())
+        acts = [loaded_acts[k] for k in names]
+
+        normalization = _per_indicator(normalization, inds, 'normalization')
+        weighting = _per_indicator(weighting, inds, 'weighting')
+        bw_normalizations = [n if isinstance(n, tuple) else None for n in normalization]
+        missing = [n for n in bw_normalizations if n is not None and n not in bw2.normalizations]
+        if missing:
+            raise ValueError(f'Normalization(s) {missing} not found in `bw2.normalizations`.')
+        factors = np.array([1. if n is None or isinstance(n, tuple) else float(n)
+                            for n in normalization])
+        weights = np.array([_weighting_factor(w) for w in weighting])
+
+        results = self._calculate([a.key for a in acts], inds,
+                                  bw_normalizations if any(bw_normalizations) else None)
+        weighted = results * (factors * weights)
+        single_scores = weighted.sum(axis=1)
+
+        with profiler.stage('dataframe'):
+            columns = pd.MultiIndex.from_tuples(inds, names=('method', 'category', 'indicator'))
+            df = pd.DataFrame(weighted, index=pd.Index(names, name='activity'), columns=columns)
+            df[('-', '-', 'activity name')] = [a['name'] for a in acts]
+            df[('-', '-', 'functional unit')] = [a['unit'] for a in acts]
+            df[('-', '-', 'single score')] = single_scores
+            df.sort_index(axis=1, inplace=True)
 
+        export_df(df, path, show)
+        return df
+
+    @profiled('get_scenario_CFs')
+    def get_scenario_CFs(self, scenarios, indicators=(), activities=(), show=False, path=''):
+        '''
+        Get impact characterization factors of the activities under scenarios
+        with changed exchange amounts (e.g., different electricity mixes or efficiencies).
+
+        All scenarios are calculated in one batch with the factorization of the
+        original technosphere matrix (through low-rank updates), instead of
+        factorizing the changed matrix of each scenario.
+
+        Parameters
+        ----------
+        scenarios : dict or :class:`pandas.DataFrame`
+            If dict, keys should be the names of the scenarios, values should be
+            dicts with the (input key, output key) of the exchanges as keys
+            and the new exchange amounts as values.
+            If :class:`pandas.DataFrame`, it should have the columns of
+            "scenario", "input", "output", and "amount".
+        indicators : iterable
+            Keys of the indicators in the `indicators` property.
+            Will be defaulted to all loaded indicators if not provided.
+        activities : iterable
+            Keys of the activities in the `activities` property.
+            Will be defaulted to all loaded activities if not provided.
+        show : bool
+            Whether to print all characterization factors in the console.
+        path : str
+            If provided, the :class:`pandas.DataFrame` will be saved to the given file path.
+
+        Returns
+        -------
+        df: :class:`pandas.DataFrame`
+            Characterization factors with the scenarios and activities as the index.
+
+        Tip
+        ---
+        [1] Amounts are the exchange amounts as in the datasets, i.e., positive for inputs,
+        the amount of a production exchange (input is the same as the output) is
+        the production amount. Only the exchange is changed, other exchanges adding up
+        to the same matrix entry (e.g., an input of the activity's own product) are kept.
+        As in `bw2calc`, only "technosphere" exchanges are negated in the technosphere matrix,
+        "production" and "substitution" ones are not. Exchanges not in the datasets
+        are added as "technosphere" (or "biosphere") exchanges.
+
+        [2] Use an empty dict for the scenario without any changes.
+        '''
         if not self.indicators:
             raise ValueError('No loaded indicators.')
         elif not self.activities:
             raise ValueError('No loaded activities.')
+        if not set(indicators).issubset(self.indicators):
+            raise ValueError('Provided indicator(s) not all loaded.')
+
+        inds = list(indicators) if indicators else self.indicators
+        names = list(activities) if activities else list(self.activities.keys())
+        acts = [self.activities[k] for k in names]
+        databases = {a.key[0] for a in acts}
+        if len(databases) > 1:
+            raise ValueError('Scenario characterization factors can only be calculated ' \
+                             'for activities of one database at a time, ' \
+                             f'not {sorted(databases)}.')
+        engine = self._get_engine(databases.pop())
+
+        if isinstance(scenarios, pd.DataFrame):
+            grouped = {}
+            for scenario, inp, out, amount in scenarios[['scenario', 'input', 'output', 'amount']].itertuples(index=False):
+                grouped.setdefault(scenario, {})[(tuple(inp), tuple(out))] = amount
+            scenarios = grouped
+
+        scenarios = {scenario: {(tuple(i), tuple(o)): v for (i, o), v in exchanges.items()}
+                     for scenario, exchanges in scenarios.items()}
+        old = _exchange_amounts({pair for exchanges in scenarios.values() for pair in exchanges})
+
+        # A matrix entry can be the sum of several exchanges (e.g., the production amount
+        # and an input of the same product), so only the change of the exchange is applied
+        changes = []
+        for scenario, exchanges in scenarios.items():
+            tech, bio = [], []
+            if exchanges:
+                inputs, outputs = zip(*exchanges.keys())
+                kinds, rows, cols = engine.exchange_positions(inputs, outputs)
+                for kind, row, col, (inp, out), amount in zip(kinds, rows, cols, exchanges, exchanges.values()):
+                    default = 'production' if inp == out else kind
+                    exc_type, old_amount = old.get((inp, out), (default, 0.))
+                    delta = amount - old_amount
+                    if kind == 'biosphere':
+                        bio.append((row, col, delta))
+                    else: # only technosphere inputs are negative in the technosphere matrix
+                        tech.append((row, col, -delta if exc_type == 'technosphere' else delta))
+            changes.append((tech, bio))
+
+        results = engine.scenario_scores([a.key for a in acts], inds, changes)
+
+        with profiler.stage('dataframe'):
+            index = pd.MultiIndex.from_product((list(scenarios.keys()), names),
+                                               names=('scenario', 'activity name'))
+            columns = pd.MultiIndex.from_tuples(inds, names=('method', 'category', 'indicator'))
+            df = pd.DataFrame(results.reshape(-1, len(inds)), index=index, columns=columns)
+            df.sort_index(axis=1, inplace=True)
 
+        export_df(df, path, show)
+        return df
+
+    @profiled('get_CFs_by_location')
+    def get_CFs_by_location(self, name, product=None, locations=(), indicators=(),
+                            pivot=True, show=False, path=''):
+        '''
+        Get impact characterization factors of all regional variants of an activity
+        (e.g., the "GLO", "RER", and "US" variants) in one batch.
+
+        Activities are found through the location index of the loaded database(s),
+        so the variants do not need to be loaded as activities.
+
+        Parameters
+        ----------
+        name : str
+            Exact name of the activity.
+        product : str
+            Exact reference product of the activity,
+            all reference products will be included if not provided.
+        locations : str or Iterable
+            Location(s) of the activity, all locations will be included if not provided.
+        indicators : iterable
+            Keys of the indicators in the `indicators` property.
+            Will be defaulted to all loaded indicators if not provided.
+        pivot : bool
+            Whether to pivot the results with the locations as the innermost column level,
+            if False, each variant will be a row.
+        show : bool
+            Whether to print all characterization factors in the console.
+        path : str
+            If provided, the :class:`pandas.DataFrame` will be saved to the given file path.
+
+        Returns
+        -------
+        df: :class:`pandas.DataFrame`
+            Characterization factors with the (activity name, reference product, location)
+            as the index, the locations will be moved to the columns if pivoted.
+
+        '''
+        if not self.indicators:
+            raise ValueError('No loaded indicators.')
         if not set(indicators).issubset(self.indicators):
             raise ValueError('Provided indicator(s) not all loaded.')
 
-        inds = indicators if indicators else self.indicators
-        ind_units = [bw2.methods.get(i)['unit'] for i in inds] + ['-', '-']
-        acts = [self.activities[k] for k in activities] if activities \
-            else [v for v in self.activities.values()]
-
-        bw2.calculation_setups['multiLCA'] = {'inv': [{a:1} for a in acts],
-                                              'ia': inds}
-
-        # This is to prevent bw2 from printing in the console
-        stdout = sys.stdout
-        sys.stdout = open(os.devnull, 'w')
-        mlca = bw2.MultiLCA('multiLCA')
-        sys.stdout = stdout
-
-        # pd_indices = [a['name'] for a in acts]
-        pd_cols = pd.MultiIndex.from_tuples(inds, names=('method', 'category', 'indicator'))
-        cf_df = pd.DataFrame(data=mlca.results, columns=pd_cols)
-        unit_df = pd.DataFrame(data={k: v for k, v in zip(cf_df.columns, ind_units)},
-                               index=[-1,], dtype='object')
-        # cf_df = pd.DataFrame(data=mlca.results, index=pd_indices, columns=pd_cols)
-        cf_df[('-', '-', 'activity name')] = [a['name'] for a in acts]
-        cf_df[('-', '-', 'functional unit')] = [a['unit'] for a in acts]
-
-        df = pd.concat((unit_df, cf_df))
-        df.sort_index(axis=1, inplace=True)
-        df.reset_index(drop=True, inplace=True)
-
-        if show:
-            print(df)
+        inds = list(indicators) if indicators else self.indicators
+        index = self.location_index
+        found = self._find_variants(name, product, locations)
+        keys = [index.keys[n] for n in found]
+        results = self._calculate(keys, inds)
+
+        with profiler.stage('dataframe'):
+            entries = [index.entry(n) for n in found]
+            names = ('activity name', 'reference product', 'location')
+            if len({key[0] for key in keys}) > 1: # keep variants of different databases apart
+                entries = [(key[0], *entry) for key, entry in zip(keys, entries)]
+                names = ('database', *names)
+            rows = pd.MultiIndex.from_tuples(entries, names=names)
+            columns = pd.MultiIndex.from_tuples(inds, names=('method', 'category', 'indicator'))
+            df = pd.DataFrame(results, index=rows, columns=columns)
+            if pivot:
+                df = df.unstack('location')
+            df.sort_index(axis=1, inplace=True)
 
         export_df(df, path, show)
-        self._CFs = df
+        return df
 
+    @profiled('compare_databases')
+    def compare_databases(self, old, new, indicators=(), activities=(), rtol=0.01,
+                          show=False, path=''):
+        '''
+        Compare the characterization factors of the activities in two versions
+        of a database (e.g., ecoinvent 3.7.1 and 3.9).
+
+        Activities are matched by (name, reference product, location, unit)
+        rather than by their codes or keys in the `activities` property,
+        and the characterization factors of all matched activities are
+        calculated in one batch for each database.
+
+        Parameters
+        ----------
+        old : str
+            Name of the old database, needs to be loaded.
+        new : str
+            Name of the new database, needs to be loaded.
+        indicators : iterable
+            Keys of the indicators in the `indicators` property.
+            Will be defaulted to all loaded indicators if not provided.
+        activities : iterable
+            Keys of the activities (of the old database) in the `activities` property,
+            all activities in the old database will be compared if not provided.
+        rtol : float
+            Relative change above which the characterization factors are counted as changed
+            in the statistics.
+        show : bool
+            Whether to print the statistics in the console.
+        path : str
+            If provided, the comparison will be saved to the given file path.
+
+        Returns
+        -------
+        df: :class:`pandas.DataFrame`
+            Characterization factors of the matched activities in the old and new
+            databases, their differences (new - old), and relative changes
+            (differences over the absolute old values, NaN if the old values are zero).
+        stats: :class:`pandas.DataFrame`
+            Statistics of the relative changes for each indicator.
+
+        Tip
+        ---
+        Use `load_database(database, add=True)` to load both databases.
+        '''
+        if not self.indicators:
+            raise ValueError('No loaded indicators.')
+        if not set(indicators).issubset(self.indicators):
+            raise ValueError('Provided indicator(s) not all loaded.')
+        for database in (old, new):
+            self._get_database(database)
+
+        inds = list(indicators) if indicators else self.indicators
+        with profiler.stage('matching'):
+            old_index = ActivityIndex.from_databases(old, unit=True)
+            new_index = ActivityIndex.from_databases(new, unit=True)
+            old_pos, new_pos = old_index.match(new_index)
+            if activities:
+                keys = {self.activities[k].key for k in activities}
+                not_old = [k for k in keys if k[0] != old]
+                if not_old:
+                    raise ValueError(f'Activities {not_old[:5]} are not of the database "{old}".')
+                pairs = [(o, n) for o, n in zip(old_pos, new_pos) if old_index.keys[o] in keys]
+                old_pos, new_pos = [p[0] for p in pairs], [p[1] for p in pairs]
+                unmatched = len(keys) - len(pairs)
+            else:
+                unmatched = len(old_index) - len(old_pos)
+        if not old_pos:
+            raise ValueError(f'No activities matched between "{old}" and "{new}".')
+        if unmatched:
+            logger.warning(f'{unmatched} activity(ies) of "{old}" not matched in "{new}".')
+        profiler.count('matched activities', len(old_pos))
+
+        old_CFs = self._calculate([old_index.keys[n] for n in old_pos], inds)
+        new_CFs = self._calculate([new_index.keys[n] for n in new_pos], inds)
+
+        with profiler.stage('dataframe'):
+            delta = new_CFs - old_CFs
+            with np.errstate(divide='ignore', invalid='ignore'):
+                relative = np.where(old_CFs != 0, delta/np.abs(old_CFs), np.nan)
+            rows = pd.MultiIndex.from_tuples(
+                [old_index.entry(n, unit=True) for n in old_pos],
+                names=('activity name', 'reference product', 'location', 'unit'))
+            values = ('old', 'new', 'delta', 'relative change')
+            columns = pd.MultiIndex.from_tuples(
+                [(*ind, v) for v in values for ind in inds],
+                names=('method', 'category', 'indicator', 'value'))
+            df = pd.DataFrame(np.hstack((old_CFs, new_CFs, delta, relative)),
+                              index=rows, columns=columns)
+            df.sort_index(axis=1, inplace=True)
+
+            magnitude = np.abs(relative)
+            changed = (magnitude > rtol) | ((old_CFs == 0) & (new_CFs != 0))
+            largest = np.argmax(np.nan_to_num(magnitude, nan=-1.), axis=0)
+            with catch_warnings(): # indicators with all-zero old values
+                simplefilter('ignore', RuntimeWarning)
+                stats = pd.DataFrame({
+                    'unit': [bw2.methods.get(ind)['unit'] for ind in inds],
+                    'matched': len(old_pos),
+                    'changed': changed.sum(axis=0),
+                    'mean relative change': np.nanmean(relative, axis=0),
+                    'median absolute relative change': np.nanmedian(magnitude, axis=0),
+                    'max absolute relative change': np.nanmax(magnitude, axis=0),
+                    'activity of max change': [rows[n][0] for n in largest],
+                    }, index=pd.MultiIndex.from_tuples(inds, names=('method', 'category', 'indicator')))
+
+        export_df(stats, '', show)
+        export_df(df, path)
+        return df, stats
+
+    @profiled('export_inventories')
+    def export_inventories(self, path, activities=(), block_size=256, threshold=0.):
+        '''
+        Export the life cycle inventories (i.e., the amounts of the biosphere flows)
+        of one unit of each activity as a sparse matrix on disk.
+
+        Inventories are calculated block by block with the same factorization
+        of the technosphere matrix as `get_CFs`, and each block is appended to the files
+        of a compressed sparse column (CSC) matrix (biosphere flows x activities)
+        before the next one is calculated, so the memory use does not grow
+        with the number of activities.
+
+        Parameters
+        ----------
+        path : str
+            Directory of the exported files (data.bin, indices.bin, indptr.bin, and meta.json).
+        activities : iterable
+            Keys of the activities in the `activities` property.
+            Will be defaulted to all loaded activities if not provided.
+        block_size : int
+            Number of activities calculated together.
+        threshold : float
+            Inventory amounts with absolute values not larger than the threshold are dropped.
+
+        Returns
+        -------
+        inventories : :class:`scipy.sparse.csc_matrix`
+            Inventories (biosphere flows x activities), memory-mapped from the files.
+        flows : :class:`pandas.DataFrame`
+            Metadata of the biosphere flows (rows).
+        activities : :class:`pandas.DataFrame`
+            Keys of the activities (columns).
+
+        Tip
+        ---
+        Use :func:`load_inventories` to load the exported inventories.
+        '''
+        loaded_acts = self.activities
+        if not loaded_acts:
+            raise ValueError('No loaded activities.')
+        names = list(activities) if activities else list(loaded_acts.keys())
+        keys = [loaded_acts[k].key for k in names]
+        groups = {}
+        for n, key in enumerate(keys):
+            groups.setdefault(key[0], []).append(n)
+        engines = {db: self._get_engine(db) for db in groups}
+
+        # Rows are the union of the biosphere flows of all databases
+        flow_ids = np.unique(np.concatenate([e.matrices.biosphere_ids for e in engines.values()]))
+        flow_keys = next(iter(engines.values())).keys(flow_ids)
+        info = _query_activities(flow_keys, data=True)
+        flows = [[*key, info[key][0], info[key][3].get('categories', ()), info[key][3].get('unit', '')]
+                 for key in flow_keys]
+
+        writer = _InventoryWriter(path, len(flow_ids))
+        order = []
+        with progress(total=len(keys), desc='Exporting inventories',
+                      unit='activities', log=logger) as bar:
+            for db, positions in groups.items():
+                engine = engines[db]
+                rows = np.searchsorted(flow_ids, engine.matrices.biosphere_ids)
+                blocks = engine.inventory_blocks([keys[n] for n in positions], block_size)
+                with profiler.stage('writing'):
+                    for block in blocks:
+                        writer.add(block, rows, threshold)
+                        bar.update(block.shape[1])
+                order.extend(positions)
+        writer.close(flows=flows, activities=[[str(names[n]), *keys[n]] for n in order])
+        profiler.count('inventory nonzeros', writer.nnz)
+
+        logger.info(f'Inventories of {len(keys)} activities have been exported to "{path}".')
+        return load_inventories(path)
+
+    @profiled('get_supply_chains')
+    def get_supply_chains(self, indicator=None, activities=(), cutoff=0.01, max_calc=1000,
+                          show=False, path=''):
+        '''
+        Get the upstream supply chains of the activities that contribute to the impact.
+
+        The supply chain of each activity is expanded best-first (i.e., the upstream
+        activity with the largest cumulative impact is expanded first) from the
+        factorization of the technosphere matrix that is shared with `get_CFs`,
+        and branches below the `cutoff` are pruned.
+
+        Parameters
+        ----------
+        indicator : tuple
+            Key of the indicator in the `indicators` property,
+            can be omitted if only one indicator is loaded.
+        activities : iterable
+            Keys of the activities in the `activities` property.
+            Will be defaulted to all loaded activities if not provided.
+        cutoff : float
+            Fraction of the impact of the activity below which branches are pruned.
+        max_calc : int
+            Maximum number of nodes expanded for each activity.
+        show : bool
+            Whether to print the supply chains in the console.
+        path : str
+            If provided, the :class:`pandas.DataFrame` will be saved to the given file path.
+
+        Returns
+        -------
+        df: :class:`pandas.DataFrame`
+            One row per node of the supply chains, with the "parent" column being
+            the node the upstream activity supplies to (-1 for the activity itself),
+            "amount" being the amount of the upstream activity (relative to its
+            reference product) for one unit of the activity,
+            and "share" being the fraction of the cumulative impact of the activity.
+
+        '''
+        if not self.indicators:
+            raise ValueError('No loaded indicators.')
+        elif not self.activities:
+            raise ValueError('No loaded activities.')
+
+        if indicator is None:
+            if len(self.indicators) > 1:
+                raise ValueError('More than one indicators loaded, please provide `indicator`.')
+            indicator = self.indicators[0]
+        elif tuple(indicator) not in self.indicators:
+            raise ValueError(f'Indicator {indicator} not loaded.')
+
+        names = list(activities) if activities else list(self.activities.keys())
+        keys = [self.activities[k].key for k in names]
+        groups = {}
+        for n, key in enumerate(keys):
+            groups.setdefault(key[0], []).append(n)
+
+        records = []
+        for db, rows in groups.items():
+            engine = self._get_engine(db)
+            nodes = engine.traverse([keys[n] for n in rows], tuple(indicator), cutoff, max_calc)
+            node_keys = engine.keys(engine.matrices.activity_ids[[node[4] for node in nodes]])
+            records.extend((rows[node[0]], *node[1:4], key, *node[5:])
+                           for node, key in zip(nodes, node_keys))
+
+        with profiler.stage('dataframe'):
+            records.sort(key=lambda r: (r[0], r[1]))
+            info = _query_activities({r[4] for r in records}, data=True)
+            df = pd.DataFrame(records, columns=('activity', 'node', 'parent', 'depth', 'key',
+                                                'amount', 'cumulative score', 'direct score'))
+            totals = df.groupby('activity')['cumulative score'].transform('first')
+            df['share'] = df['cumulative score'] / totals.where(totals != 0)
+            df['activity'] = [names[n] for n in df['activity']]
+            df.insert(4, 'activity name', [info[k][0] for k in df['key']])
+            df.insert(5, 'reference product', [info[k][1] for k in df['key']])
+            df.insert(6, 'location', [info[k][2] for k in df['key']])
+            df.insert(7, 'unit', [info[k][3].get('unit', '') for k in df['key']])
+            df.insert(8, 'database', [k[0] for k in df['key']])
+            df.insert(9, 'code', [k[1] for k in df['key']])
+            df.drop(columns='key', inplace=True)
+
+        export_df(df, path, show)
         return df
 
+    def _get_engine(self, database=None):
+        if database is None:
+            database = self._get_database().name
+        engine = self._engines.get(database)
+        if engine is None:
+            with self._lock: # only build the matrices once if requested by multiple threads
+                engine = self._engines.get(database)
+                if engine is None:
+                    with profiler.stage('matrix building'):
+                        matrices = MatrixSet.from_database(database)
+                    engine = LCAEngine(matrices)
+                    self._engines = {**self._engines, database: engine}
+        return engine
+
+    def _calculate(self, keys, inds, normalizations=None):
+        # Group the activities by database, each group is solved by the engine
+        # of its own database, and groups are solved in parallel
+        groups = {}
+        for n, key in enumerate(keys):
+            groups.setdefault(key[0], []).append(n)
+        engines = {db: self._get_engine(db) for db in groups}
+
+        results = np.empty((len(keys), len(inds)))
+        with progress(total=len(keys), desc='Calculating activities',
+                      unit='activities', log=logger) as bar:
+            def calculate(db):
+                rows = groups[db]
+                results[rows] = engines[db].scores([keys[n] for n in rows], inds, bar=bar,
+                                                   normalizations=normalizations)
+
+            if len(groups) == 1:
+                calculate(*groups)
+            else:
+                with ThreadPoolExecutor(max_workers=len(groups)) as executor:
+                    list(executor.map(calculate, groups))
+        return results
+
     def get_CF(self, indicators=(), activities=(), show=False, path=''):
         '''Has been deprecated, use :func:`get_CF` instead.'''
         warn('`get_CF` has been deprecated, please use `get_CFs` instead.')
@@ -443,22 +1474,131 @@ class CFgetter:
         '''
         new = self.__class__.__new__(self.__class__)
         new.name = name
-        new._CFs = None
+        new._CFs = new._results = None
+        new._databases, new._engines, new._index = {}, {}, None
+        new._lock = threading.RLock()
         if isinstance(omit, str):
             omit = (omit,)
-        omit = (*(f'_{o}' for o in omit), 'name', '_CFs')
+        omit = (*(f'_{o}' for o in omit), 'name', '_CFs', '_results', '_index', '_lock')
+        if '_database' in omit or '_databases' in omit: # engines are of the databases
+            omit = (*omit, '_databases', '_engines')
 
         for s in self.__slots__:
             if not s in omit:
-                if s == '_database':
-                    new._database = self._database
-                else:
-                    setattr(new, s, getattr(self, s).copy())
+                setattr(new, s, getattr(self, s).copy())
 
         return new
 
     __copy__ = copy
 
+    def save(self, path):
+        '''
+        Save the loaded databases, indicators, activities, and the results of the last
+        :func:`get_CFs` to one binary file (".npz"), so that the getter can be restored through
+        :func:`CFgetter.load` without searching for the activities or recalculating.
+
+        Parameters
+        ----------
+        path : str
+            Path of the file.
+
+        Tip
+        ---
+        Keys of the activities (i.e., from the `key_formatter`) can be str, numbers,
+        or tuples of them (e.g., the database keys).
+
+        Fingerprints of the processed databases are saved as well,
+        the getter will not be restored if the databases have been changed
+        (e.g., reimported or processed again) since saved.
+        '''
+        with self._lock: # consistent state in case other threads are loading
+            databases, results = list(self._databases), self._results
+            indicators, activities = self.indicators, self._activities
+        _check_keys(activities)
+        fingerprint = {}
+        for database in databases:
+            fingerprint.update(_fingerprint(database))
+
+        meta = {
+            'version': _STATE_VERSION,
+            'name': self.name,
+            'databases': databases,
+            'fingerprint': fingerprint,
+            'indicators': indicators,
+            'activities': [[name, *act.key] for name, act in activities.items()],
+            }
+        arrays = {}
+        if results is not None:
+            meta['results'] = {k: v for k, v in results.items() if k != 'CFs'}
+            arrays['CFs'] = results['CFs']
+        np.savez_compressed(path, meta=np.array(json.dumps(meta)), **arrays)
+        file_path, file_name = os.path.split(path)
+        logger.info(f'File "{file_name}" has been exported to "{file_path}".')
+
+    @classmethod
+    @profiled('load_getter')
+    def load(cls, path, check=True, cache=True):
+        '''
+        Restore the getter saved through :func:`CFgetter.save`.
+
+        Parameters
+        ----------
+        path : str
+            Path of the file.
+        check : bool
+            Whether to raise an error if the databases have been changed since saved,
+            if False, the getter will be restored with a warning but without the results.
+        cache : bool
+            Whether to memory-map the processed matrices of the databases from the cache,
+            passed to :func:`load_database`.
+        '''
+        with np.load(path, allow_pickle=False) as f:
+            meta = json.loads(f['meta'].item())
+            CFs = f['CFs'] if 'CFs' in f else None
+        if meta.get('version', 0) > _STATE_VERSION:
+            raise ValueError(f'Saved getter version {meta["version"]} is not supported, ' \
+                             'please update BW2QSD.')
+
+        missing = [db for db in meta['databases'] if db not in bw2.databases]
+        if missing:
+            raise ValueError(f'Database(s) {missing} of the saved getter not available.')
+        changed = [db for db, fingerprint in meta['fingerprint'].items()
+                   if db not in bw2.databases or _fingerprint(db).get(db) != fingerprint]
+        if changed:
+            if check:
+                raise ValueError(f'Database(s) {changed} have been changed since the getter ' \
+                                 'was saved, set `check` to False to restore it without the results.')
+            logger.warning(f'Database(s) {changed} have been changed since the getter ' \
+                           'was saved, results not restored.')
+            CFs = None
+
+        getter = cls(meta['name'])
+        for n, database in enumerate(meta['databases']):
+            getter.load_database(database, cache=cache, add=bool(n))
+        getter._indicators = {tuple(ind) for ind in meta['indicators']}
+
+        with profiler.stage('activities'):
+            found = _get_activities([(db, code) for _, db, code in meta['activities']])
+        activities = {_restore_key(name): found.get((db, code)) for name, db, code in meta['activities']}
+        missing = [name for name, act in activities.items() if act is None]
+        if missing:
+            raise ValueError(f'{len(missing)} activity(ies) of the saved getter not found, ' \
+                             f'e.g., {missing[:5]}.')
+        getter._activities = activities
+
+        results = meta.get('results')
+        names = [_restore_key(name) for name in results['activities']] if results else ()
+        if CFs is not None and results and set(names).issubset(activities):
+            inds = [tuple(ind) for ind in results['indicators']]
+            acts = [activities[name] for name in names]
+            getter._results = {**results, 'indicators': inds, 'activities': names, 'CFs': CFs}
+            getter._CFs = getter._frame(inds, acts, names, CFs,
+                                        results['sparse'], results['threshold'])
+
+        logger.info(f'{getter} restored with {len(getter._indicators)} indicator(s) ' \
+                    f'and {len(activities)} activity(ies).')
+        return getter
+
     @property
     def available_databases(self):
         '''All databases that have been loaded into `Brightway2`.'''
@@ -466,12 +1606,36 @@ class CFgetter:
 
     @property
     def database(self):
-        '''Loaded database.'''
-        return self._database
+        '''Loaded (primary) database.'''
+        return next(iter(self._databases.values()), None)
     @database.setter
     def database(self, i):
         raise AttributeError('Use `load_database` to load/switch database.')
 
+    @property
+    def databases(self):
+        '''[list] All loaded databases, the first one is the primary database.'''
+        return list(self._databases.values())
+    @databases.setter
+    def databases(self, i):
+        raise AttributeError('Use `load_database` to load/switch databases.')
+
+    @property
+    def location_index(self):
+        '''
+        [:class:`ActivityIndex`] Index of the activities in the loaded database(s)
+        by (name, reference product, location), built when first used.
+        '''
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    if not self._databases:
+                        raise ValueError('No loaded database.')
+                    self._index = ActivityIndex.from_databases(list(self._databases))
+                index = self._index
+        return index
+
     @property
     def indicators(self):
         '''[list] Loaded impact indicators.'''
@@ -482,8 +1646,8 @@ class CFgetter:
 
     @property
     def activities(self):
-        '''[dict] Loaded activities.'''
-        return self._activities
+        '''[dict] Loaded activities (read-only view).'''
+        return MappingProxyType(self._activities)
     @activities.setter
     def activities(self, i):
         raise AttributeError('Use `load_activities`/`remove` to add/remove activities.')
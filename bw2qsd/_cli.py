@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+BW2QSD: Bridging Brightway2 and QSD packages for LCA
+
+This module is developed by:
+    Yalin Li <mailto.yalin.li@gmail.com>
+
+This module is under the University of Illinois/NCSA Open Source License.
+Please refer to https://github.com/QSD-Group/BW2QSD/blob/main/LICENSE.txt
+for license details.
+'''
+
+'''
+Command-line driver for extracting characterization factors in batch mode.
+
+Example spec file (JSON or YAML):
+
+.. code:: yaml
+
+    name: ei
+    project: default
+    database: ecoinvent_apos371 # or a list, the first one is the primary database
+    indicators:
+      - method: TRACI
+        indicator_exclude: obsolete
+    activities:
+      keys:
+        - [ecoinvent_apos371, 0a1b2c3d4e5f...]
+      searches:
+        - string: building
+          limit: 10
+          database: ecoinvent_apos371 # defaulted to the primary database
+    output: CFs.csv
+    chunk_size: 200
+    processes: 4
+
+'''
+
+import os, sys, json, argparse
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from ._logger import configure_logging, get_logger
+from ._profiler import profile
+from .utils import export_df
+
+__all__ = ('load_spec', 'run_spec', 'main',)
+
+_formats = ('csv', 'tsv', 'xlsx', 'xls', 'npz')
+
+logger = get_logger('cli')
+
+
+def load_spec(path):
+    '''
+    Load the extraction spec from a JSON (.json) or YAML (.yaml/.yml) file.
+
+    Parameters
+    ----------
+    path : str
+        Path of the spec file.
+    '''
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.endswith('.json'):
+            spec = json.load(f)
+        elif path.endswith('.yaml') or path.endswith('.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError('Reading YAML spec files requires the `pyyaml` package, ' \
+                                  'please install it or use a JSON spec file.')
+            spec = yaml.safe_load(f)
+        else:
+            extension = path.split('.')[-1]
+            raise ValueError('Only "json", "yaml", or "yml" spec files are supported, ' \
+                             f'not {extension}.')
+
+    if not isinstance(spec, dict):
+        raise TypeError(f'The spec file "{path}" should contain a mapping, ' \
+                        f'not {type(spec).__name__}.')
+    if not spec.get('database'):
+        raise ValueError(f'No database provided in the spec file "{path}".')
+
+    return spec
+
+
+def _indicator_filters(spec):
+    filters = spec.get('indicators') or [{}]
+    if isinstance(filters, dict):
+        filters = [filters]
+    return [{k: v for k, v in f.items() if k != 'add'} for f in filters]
+
+
+def _set_project(spec):
+    project = spec.get('project')
+    if project:
+        import brightway2 as bw2
+        bw2.projects.set_current(project)
+
+
+def _make_getter(spec):
+    from ._cf_getter import CFgetter
+    getter = CFgetter(spec.get('name', 'bw2qsd'))
+    databases = spec['database']
+    for n, database in enumerate([databases] if isinstance(databases, str) else databases):
+        getter.load_database(database, add=bool(n))
+    for kwargs in _indicator_filters(spec):
+        getter.load_indicators(add=True, **kwargs)
+    return getter
+
+
+def _resolve_keys(getter, spec):
+    '''Resolve the activity keys and searches in the spec into a list of keys.'''
+    activities = spec.get('activities') or {}
+    keys = [tuple(k) for k in activities.get('keys', ())]
+    for search in activities.get('searches', ()):
+        if isinstance(search, str):
+            search = {'string': search}
+        act_dct = getter.load_activities(add=False, **search)
+        keys.extend(act.key for act in act_dct.values())
+
+    # Remove duplicates while keeping the order
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        raise ValueError('No activities found from the keys and searches in the spec.')
+    return keys
+
+
+def _key_formatter(act):
+    # Activities are keyed by their database keys, as regional variants share the same name
+    return act.key
+
+
+def _get_CFs(getter):
+    # Characterization factors of the loaded activities, with the columns
+    # identifying the activities as regional variants share the same name
+    acts = list(getter.activities.values())
+    df = getter.get_CFs()
+    identifiers = {'database': lambda act: act.key[0],
+                   'code': lambda act: act.key[1],
+                   'location': lambda act: act.get('location', ''),
+                   'reference product': lambda act: act.get('reference product', '')}
+    for column, get in identifiers.items():
+        # The first row is the units
+        df[('-', '-', column)] = [None, *(get(act) for act in acts)]
+    df.sort_index(axis=1, inplace=True)
+    return df
+
+
+def _run_chunk(spec, keys):
+    _set_project(spec)
+    getter = _make_getter(spec)
+    getter.load_activities_by_keys(keys, add=True, key_formatter=_key_formatter)
+    return _get_CFs(getter)
+
+
+def _combine(dfs):
+    # All but the first table have the unit row removed before stacking
+    dfs = [dfs[0], *(df.iloc[1:] for df in dfs[1:])]
+    return pd.concat(dfs, ignore_index=True)
+
+
+def run_spec(spec, chunk_size=None, processes=None, output=None):
+    '''
+    Get characterization factors in batch mode as described by the spec.
+
+    Parameters
+    ----------
+    spec : dict
+        Spec of the extraction, see the module docstring for an example.
+    chunk_size : int
+        Number of activities to be calculated in one chunk,
+        will be defaulted to the "chunk_size" in the spec or all activities in one chunk.
+    processes : int
+        Number of processes used for calculating the chunks,
+        will be defaulted to the "processes" in the spec or 1.
+    output : str
+        If provided, the :class:`pandas.DataFrame` will be saved to the given file path,
+        will be defaulted to the "output" in the spec.
+
+    Returns
+    -------
+    df: :class:`pandas.DataFrame`
+        Characterization factors, with the database, code, location, and reference product
+        of the activities to tell the regional variants apart.
+    '''
+    _set_project(spec)
+    getter = _make_getter(spec)
+    keys = _resolve_keys(getter, spec)
+
+    chunk_size = int(chunk_size or spec.get('chunk_size') or len(keys))
+    processes = int(processes or spec.get('processes') or 1)
+    output = output if output is not None else spec.get('output', '')
+    chunks = [keys[i:i+chunk_size] for i in range(0, len(keys), chunk_size)]
+
+    logger.info(f'Getting characterization factors for {len(keys)} activities ' \
+                f'in {len(chunks)} chunk(s) with {processes} process(es).')
+
+    if processes == 1:
+        dfs = []
+        for chunk in chunks:
+            getter.load_activities_by_keys(chunk, add=True, key_formatter=_key_formatter)
+            dfs.append(_get_CFs(getter))
+            getter.remove('activity', list(getter.activities.keys()))
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            dfs = list(executor.map(_run_chunk, [spec]*len(chunks), chunks))
+
+    df = _combine(dfs)
+    n_rows = len(df) - 1 # the first row is the units
+    if n_rows != len(keys):
+        raise RuntimeError(f'Characterization factors of {n_rows} activities calculated, ' \
+                           f'but {len(keys)} activities were resolved from the spec.')
+    export_df(df, output)
+
+    return df
+
+
+def main(argv=None):
+    '''Entry point of the `bw2qsd` command.'''
+    parser = argparse.ArgumentParser(
+        prog='bw2qsd',
+        description='Get characterization factors in batch mode from a JSON/YAML spec file.')
+    parser.add_argument('spec', help='path of the JSON/YAML spec file')
+    parser.add_argument('-o', '--output', default=None,
+                        help='path of the output file, overrides the "output" in the spec')
+    parser.add_argument('-f', '--format', default=None, choices=_formats,
+                        help='format of the output file, overrides the file extension')
+    parser.add_argument('-c', '--chunk-size', type=int, default=None,
+                        help='number of activities to be calculated in one chunk')
+    parser.add_argument('-p', '--processes', type=int, default=None,
+                        help='number of processes used for calculating the chunks')
+    parser.add_argument('--project', default=None,
+                        help='Brightway2 project, overrides the "project" in the spec')
+    parser.add_argument('--profile', action='store_true',
+                        help='print the timings of each stage after the extraction')
+    parser.add_argument('--log-level', default='INFO',
+                        help='logging level, e.g., "INFO" or "WARNING"')
+    parser.add_argument('--json-log', action='store_true',
+                        help='log messages and progress as JSON events (one per line)')
+    args = parser.parse_args(argv)
+    configure_logging(level=args.log_level.upper(), json=args.json_log,
+                      stream=sys.stderr, progress_bars=not args.json_log)
+
+    spec = load_spec(args.spec)
+    if args.project:
+        spec['project'] = args.project
+
+    output = args.output if args.output is not None else spec.get('output', '')
+    if args.format:
+        if not output:
+            output = os.path.splitext(os.path.basename(args.spec))[0] + '_CFs'
+        output = f'{os.path.splitext(output)[0]}.{args.format}'
+
+    if args.profile:
+        with profile() as report:
+            run_spec(spec, chunk_size=args.chunk_size, processes=args.processes, output=output)
+        report.show(stats=0)
+    else:
+        run_spec(spec, chunk_size=args.chunk_size, processes=args.processes, output=output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -15,20 +15,23 @@ Please refer to https://github.com/QSD-Group/BW2QSD/blob/main/LICENSE.txt
 for license details.
 '''
 
-import os, appdirs, subprocess, shutil, requests, functools
+import os, json, time, pickle, appdirs, subprocess, shutil, requests, multiprocessing
 import brightway2 as bw2
 from . import eidl
 from zipfile import ZipFile
 from bw2io import importers, strategies
-
-'''
-TODO:
-    JSON conversion, then add USLCI, etc.
-'''
-
+from bw2io.extractors import Ecospold2DataExtractor
+from ._logger import get_logger, log_event, progress
+from ._profiler import profiler, profiled
+from ._cache import download_cache
+from ._sources import ForwastSource, import_sources
+from ._writer import bulk_write
+from ._jsonld import import_jsonld
 
 __all__ = ('DataDownloader',)
 
+logger = get_logger('downloader')
+
 
 def _check_db(name, force_skipping=False):
     dbs = []
@@ -37,7 +40,7 @@ def _check_db(name, force_skipping=False):
             dbs.append(k)
     
     if dbs:
-        print(f'\nThe following {name} database(s) {dbs} exist(s).')
+        logger.info(f'The following {name} database(s) {dbs} exist(s).')
 
         if force_skipping:
             return False
@@ -54,16 +57,196 @@ def _make_dir(path, end_dir=''):
         path = fp = appdirs.user_data_dir(appname='BW2QSD', appauthor='bw2qsd')
         if not os.path.isdir(fp):
             os.makedirs(fp)
-            print (f'\nDirectory {fp} created for storing database.')
+            logger.info(f'Directory {fp} created for storing database.')
 
     full_path = os.path.join(path, end_dir) if end_dir else path
     if not os.path.isdir(full_path):
         os.makedirs(full_path)
-        print (f'\nDirectory {full_path} created for storing database.')
+        logger.info(f'Directory {full_path} created for storing database.')
 
     return full_path
 
 
+def _download(url, fp, desc='Downloading', **kwargs):
+    r = requests.get(url, stream=True, **kwargs)
+    if r.status_code != 200:
+        raise ConnectionError(f'URL "{url}" returns status code "{r.status_code}".')
+
+    total = int(r.headers.get('content-length', 0)) or None
+    # From BioSTEAM-LCA:
+    # use the following code instead of ``r.raw.read`` to save what is being streamed to a file.
+    with open(fp, 'wb') as fd, progress(total=total, desc=desc, unit='B', log=logger) as bar:
+        for chunk in r.iter_content(chunk_size=128*1024):
+            fd.write(chunk)
+            bar.update(len(chunk))
+
+
+def _extract_zip(fp, path, desc='Extracting'):
+    with ZipFile(fp) as zf:
+        for member in progress(zf.infolist(), desc=desc, unit='files', log=logger):
+            zf.extract(member, path)
+
+
+def _extract_7z(fp, path, desc='Extracting'):
+    try:
+        import py7zr
+        from py7zr.callbacks import ExtractCallback
+    except ImportError: # old code, not sure if Mac needs this
+        subprocess.run(['7za', 'x', fp, f'-o{path}'], check=True)
+        return
+
+    class Callback(ExtractCallback):
+        def report_start_preparation(self): pass
+        def report_start(self, processing_file_path, processing_bytes): pass
+        def report_update(self, decompressed_bytes): pass
+        def report_end(self, processing_file_path, wrote_bytes): bar.update()
+        def report_warning(self, message): logger.warning(message)
+        def report_postprocess(self): pass
+
+    with py7zr.SevenZipFile(fp, 'r') as archive:
+        total = len(archive.getnames())
+        with progress(total=total, desc=desc, unit='files', log=logger) as bar:
+            archive.extractall(path, callback=Callback())
+
+
+def _extract_activity(args):
+    return Ecospold2DataExtractor.extract_activity(*args)
+
+
+class _Ecospold2Extractor(Ecospold2DataExtractor):
+    ''':class:`bw2io.extractors.Ecospold2DataExtractor` with progress reporting.'''
+
+    @classmethod
+    def extract(cls, dirpath, db_name, use_mp=True):
+        filelist = [fn for fn in os.listdir(dirpath)
+                    if fn.lower().endswith('.spold') and os.path.isfile(os.path.join(dirpath, fn))]
+        args = [(dirpath, fn, db_name) for fn in filelist]
+        with progress(total=len(args), desc='Parsing datasets', unit='datasets', log=logger) as bar:
+            data = []
+            if use_mp:
+                with multiprocessing.Pool(processes=multiprocessing.cpu_count()) as pool:
+                    for ds in pool.imap(_extract_activity, args, chunksize=32):
+                        data.append(ds)
+                        bar.update()
+            else:
+                for arg in args:
+                    data.append(_extract_activity(arg))
+                    bar.update()
+        return data
+
+
+
+class _PickledExtractor:
+    '''Extractor returning the datasets saved by :class:`_Checkpoint` instead of parsing.'''
+
+    def __init__(self, data):
+        self.data = data
+
+    def extract(self, dirpath, db_name, use_mp=True):
+        return self.data
+
+
+# Stages of an import, in order
+_stages = ('downloaded', 'extracted', 'parsed', 'strategies applied', 'written')
+
+class _Checkpoint:
+    '''
+    Record of the completed stages of an import, saved (with the intermediate datasets
+    of the last stage that has them) under the cache directory so that a failed import
+    can be resumed at the last completed stage.
+    '''
+
+    __slots__ = ('path', 'manifest')
+
+    def __init__(self, path, manifest=None):
+        self.path = path
+        self.manifest = manifest or {'stage': None}
+
+    def __repr__(self):
+        return f'<_Checkpoint: {self.manifest.get("database")}, {self.stage}>'
+
+    @classmethod
+    def open(cls, root, name):
+        '''Return the checkpoint of the import, a new one if not saved before.'''
+        path = os.path.join(root, '.checkpoints', name)
+        try:
+            with open(os.path.join(path, 'manifest.json')) as f:
+                return cls(path, json.load(f))
+        except (FileNotFoundError, ValueError):
+            return cls(path)
+
+    def matches(self, **info):
+        '''Whether the checkpoint was saved for the import with the info (e.g., version).'''
+        return all(self.manifest.get(k) == v for k, v in info.items())
+
+    @property
+    def stage(self):
+        '''[str] Last completed stage.'''
+        return self.manifest.get('stage')
+
+    def done(self, stage):
+        '''Whether the stage has been completed.'''
+        return self.stage is not None and _stages.index(self.stage) >= _stages.index(stage)
+
+    def save(self, stage, data=None, **info):
+        '''
+        Mark the stage as completed, `data` (datasets) will be saved if provided,
+        replacing the datasets of the earlier stage.
+        '''
+        os.makedirs(self.path, exist_ok=True)
+        if data is not None:
+            fp = os.path.join(self.path, 'data.pickle')
+            try:
+                with open(fp+'.tmp', 'wb') as f:
+                    pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(fp+'.tmp', fp)
+            finally:
+                if os.path.isfile(fp+'.tmp'):
+                    os.remove(fp+'.tmp')
+            info['data'] = stage
+        self.manifest.update(info, stage=stage, time=time.time())
+        fp = os.path.join(self.path, 'manifest.json')
+        with open(fp+'.tmp', 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(fp+'.tmp', fp)
+        log_event(logger, 'checkpoint', f'Checkpoint saved: {stage}.',
+                  database=self.manifest.get('database'), stage=stage)
+
+    def load(self):
+        '''Return the saved datasets.'''
+        if self.manifest.get('data') != self.stage:
+            raise RuntimeError(f'No datasets saved for the "{self.stage}" stage.')
+        with open(os.path.join(self.path, 'data.pickle'), 'rb') as f:
+            return pickle.load(f)
+
+    def clear(self):
+        '''Remove the saved datasets and the checkpoint.'''
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def _ecoinvent_checkpoint(root, version, system_model, resume=True):
+    # Checkpoint of the import of the ecoinvent version and system model,
+    # saved checkpoints not matching the import are discarded rather than resumed
+    db_append = f'{system_model}{str(version).replace(".", "")}'
+    info = {'version': str(version), 'system_model': system_model,
+            'database': 'ecoinvent_'+db_append}
+    checkpoint = _Checkpoint.open(root, db_append)
+    if checkpoint.stage is None:
+        return checkpoint
+    if resume and checkpoint.stage != 'written' and checkpoint.matches(**info):
+        logger.info(f'Resuming the import of {info["database"]} ' \
+                    f'after the "{checkpoint.stage}" stage.')
+        return checkpoint
+    reason = 'resuming is disabled' if not resume \
+        else 'the import was completed' if checkpoint.stage == 'written' \
+        else 'it does not match the import'
+    log_event(logger, 'checkpoint_discarded',
+              f'Checkpoint of {checkpoint.manifest.get("database")} ' \
+              f'("{checkpoint.stage}" stage) discarded as {reason}.',
+              database=checkpoint.manifest.get('database'), stage=checkpoint.stage)
+    checkpoint.clear()
+    return _Checkpoint(checkpoint.path)
+
 
 class DataDownloader:
     '''
@@ -72,12 +255,17 @@ class DataDownloader:
     Currently support:
         - `ecoinvent <https://www.ecoinvent.org/>`_, version 3+, (license and login credentials required)
         - `FORWAST <https://lca-net.com/projects/show/forwast/>`_
-        - `USLCI <>`_ (NOT YET READY)
+        - `USLCI <https://www.lcacommons.gov/lca-collaboration/>`_ (JSON-LD archive)
+
+    Use :func:`download` to import multiple sources concurrently,
+    new sources can be added through :func:`register_source`.
     
     '''
         
+    @profiled('download_ecoinvent')
     def download_ecoinvent(self, path='', remove_download=False,
-                           remove_cache_data=False):
+                           remove_cache_data=False, resume=True,
+                           version=None, system_model=None):
         '''
         Download ecoinvent database using the ``eidl`` package.
         You will be prompted to enter ecoinvent license and login credentials.
@@ -99,15 +287,27 @@ class DataDownloader:
             
             .. note::
             
-                Downloaded files are stored under the "EcoInventDownLoader" directory
-                in the user data storage directory.
+                Downloaded files are kept in the download cache
+                (see :class:`CacheManager`) for later imports.
 
 
         remove_download : bool
-            Whether to remove the downloaded zipfile after extracting.
+            Whether to remove the downloaded zipfile (from the download cache) after extracting.
         remove_cache_data : bool
             Whether to remove the raw database files (i.e., unzipped zipfile)
             after importing.
+        resume : bool
+            Whether to resume the unfinished import (if any) of the same version and
+            system model at its last completed stage (downloaded, extracted, parsed,
+            or strategies applied), intermediate results are saved under the
+            "ecoinvent/.checkpoints" directory and removed once the database is written.
+            Checkpoints of other imports (or all of them if False) are discarded.
+        version : str
+            Version of ecoinvent (e.g., "3.7.1"), will be prompted if not provided.
+        system_model : str
+            System model of ecoinvent (e.g., "cutoff"), will be prompted if not provided.
+            If both `version` and `system_model` are provided, a resumed import
+            will not require downloading (or logging in) again.
         
         Tip
         ---
@@ -134,43 +334,64 @@ class DataDownloader:
         
         
         '''
-        if not _check_db('ecoinvent'):
-            return
-
         path = path or _make_dir(path, 'ecoinvent')
-        downloader = eidl.EcoinventDownloader(outdir=path)
-        downloader.run()
+        checkpoint = None
+        if version and system_model:
+            checkpoint = _ecoinvent_checkpoint(path, version, system_model, resume)
+        if checkpoint is not None and (checkpoint.done('extracted') or \
+            (checkpoint.done('downloaded') and os.path.isfile(checkpoint.manifest['archive']))):
+            out_path = checkpoint.manifest['archive']
+        else:
+            if (checkpoint is None or checkpoint.stage is None) and not _check_db('ecoinvent'):
+                return
+            downloader = eidl.EcoinventDownloader(version=version, system_model=system_model,
+                                                  outdir=path)
+            with profiler.stage('download'):
+                downloader.run()
+            out_path = downloader.out_path
+            version, system_model = str(downloader.version), downloader.system_model
+            if checkpoint is None:
+                checkpoint = _ecoinvent_checkpoint(path, version, system_model, resume)
+            if checkpoint.stage is None:
+                checkpoint.save('downloaded', database='ecoinvent_'+downloader.file_name.replace('.7z', ''),
+                                version=version, system_model=system_model, archive=out_path)
+        db_append = checkpoint.manifest['database'].replace('ecoinvent_', '', 1)
 
-        print('\nUnzipping data...')
-        
-        db_append = downloader.file_name.replace('.7z', '')
-        
         extracted_path = os.path.join(path, db_append)
-        try: # remove previous extracted cache
-            os.rmdir(extracted_path)
-        except FileNotFoundError:
-            pass
-
-        try:
-            extract_cmd = ['py7zr', 'x', downloader.out_path, extracted_path]
-            self.extraction_process = subprocess.Popen(extract_cmd)
-        except: # Old code, not sure if Mac needs this
-            extract_cmd = ['7za', 'x', downloader.out_path, f'-o{extracted_path}']
-            self.extraction_process = subprocess.Popen(extract_cmd)
-            
-        self.extraction_process.wait()
+        datasets_path = os.path.join(extracted_path, 'datasets')
+        if not checkpoint.done('extracted'):
+            logger.info('Unzipping data...')
+            shutil.rmtree(extracted_path, ignore_errors=True) # remove previous extracted cache
+            with profiler.stage('extraction'):
+                _extract_7z(out_path, extracted_path)
+            checkpoint.save('extracted', extracted=extracted_path)
 
         db_name = 'ecoinvent_' + db_append
-        datasets_path = os.path.join(extracted_path, 'datasets') 
-                
-        ecospold_import = importers.SingleOutputEcospold2Importer(datasets_path, db_name)
-        ecospold_import.apply_strategies()
-        
-        print('\nInspecting data...')
+        if checkpoint.done('parsed'):
+            extractor = _PickledExtractor(checkpoint.load())
+        else:
+            extractor = _Ecospold2Extractor
+        with profiler.stage('parsing'):
+            ecospold_import = importers.SingleOutputEcospold2Importer(
+                datasets_path, db_name, extractor=extractor)
+        profiler.count('datasets parsed', len(ecospold_import.data))
+        if not checkpoint.done('parsed'):
+            checkpoint.save('parsed', ecospold_import.data)
+
+        if not checkpoint.done('strategies applied'):
+            with profiler.stage('strategies'):
+                ecospold_import.apply_strategies()
+            checkpoint.save('strategies applied', ecospold_import.data)
+        
+        logger.info('Inspecting data...')
         self.inspect(ecospold_import, db_name)
+        checkpoint.save('written')
+        checkpoint.clear()
         
         if remove_download:
-            os.remove(downloader.out_path)
+            eidl.eidlstorage.remove(os.path.basename(out_path))
+            if os.path.isfile(out_path): # not cached
+                os.remove(out_path)
 
         if remove_cache_data:
             shutil.rmtree(extracted_path)
@@ -179,7 +400,9 @@ class DataDownloader:
             except OSError:
                 pass
                 
-        print(f'\nSuccessfully imported ecoinvent database as "ecoinvent_{db_append}".')
+        log_event(logger, 'database_imported',
+                  f'Successfully imported ecoinvent database as "{db_name}".',
+                  database=db_name)
 
 
     def download_forwast(self, path='',
@@ -199,7 +422,7 @@ class DataDownloader:
             You may need to update the url according to the FORWAST website
             if the default one is not working.       
         remove_download : bool
-            Whether to remove the downloaded zipfile after extracting.
+            Whether to remove the downloaded zipfile (from the download cache) after extracting.
         remove_cache_data : bool
             Whether to remove the raw database files (i.e., unzipped zipfile)
             after importing.
@@ -213,96 +436,87 @@ class DataDownloader:
             return
         
         path = _make_dir(path, 'forwast')
-        fp = os.path.join(path, 'forwast.package.zip')
-        fp_extracted = os.path.join(path, 'forwast.bw2package')
-        if os.path.exists(fp_extracted):
-            print('\nUsing previously extracted FORWAST package in directory ' \
-                  f'"{path}".')
-        
-        else:            
-            if os.path.exists(fp):
-                print('\nUsing previously downloaded FORWAST package in directory ' \
-                      f'"{path}".')
-    
-            else:
-                print('\nDownloading data...\n')
-                r = requests.get(url, stream=True)
-                if r.status_code != 200:
-                    raise (f'URL "{url}" returns status code "{r.status_code}".')
-               
-                # From BioSTEAM-LCA:
-                # use the following code instead of ``r.raw.read`` to save what is being streamed to a file.
-                # with open(filename, 'wb') as fd:
-                with open(fp, 'wb') as fd:
-                    for chunk in r.iter_content(chunk_size=128): # chunk = 128 * 1024
-                        fd.write(chunk)
-            
-            print('\nExtracting data...')
-            ZipFile(fp).extractall(path)         
-        bw2.BW2Package.import_file(os.path.join(path, 'forwast.bw2package'))
+        import_sources([ForwastSource(path, url)], skip_existing=False)
         
         if remove_download:
-            os.remove(fp)
+            download_cache.remove(ForwastSource.cache_name)
 
         if remove_cache_data:
             shutil.rmtree(path)
-    
-        print('\nSuccessfully imported FORWAST database as "forwast".')
 
 
 
-    def download_USLCI(self, db_path):
+    @profiled('download_USLCI')
+    def download_USLCI(self, db_path, db_name='us_lci', unlinked='add'):
         '''
-        NOT READY YET
-        
-        
-        Import the pre-downloaded and pre-converted (from JSON to ecoSpold1 or ecoSpold2)
-        U.S. Life Cycle Inventory (USLCI) database from
-        `Federal LCA Commons repository <https://www.lcacommons.gov/lca-collaboration/>`.
-        
+        Import the pre-downloaded U.S. Life Cycle Inventory (USLCI) database from
+        `Federal LCA Commons repository <https://www.lcacommons.gov/lca-collaboration/>`
+        directly from its JSON-LD archive (i.e., without conversion to ecoSpold).
+
         .. note::
-            
-            The files in the `Federal LCA Commons repository <https://www.lcacommons.gov/lca-collaboration/>`
-            are in JSON file, and need to be converted to ecoSpold1 (`outdated <https://www.ecoinvent.org/data-provider/data-provider-toolkit/ecospold2/changes-from-ecospold1-to-ecospold2/changes-from-ecospold1-to-ecospold2.html>`_)
-            or ecoSpold2 before using.
-            
+
+            The JSON-LD zip archive needs to be downloaded from the
+            `Federal LCA Commons repository <https://www.lcacommons.gov/lca-collaboration/>`
+            first (login not required).
+
         Parameters
         ----------
         db_path : str
-            Directory to the sown
-        
-        
+            Path of the downloaded JSON-LD zip archive.
+        db_name : str
+            Name of the database.
+        unlinked : str
+            Handling of the elementary flows not found in the biosphere database,
+            "add" to write them into a new "<db_name> biosphere" database,
+            "drop" to drop the exchanges.
+
+        See Also
+        --------
+        :func:`import_jsonld`
         '''
-        db_name = 'us_lci'
-        
-        
-        from warnings import warn
-        warn('This function is not ready yet.')
-        return
-    
-        #!!! Look into brightway2 for direct importing from JSON
-    
-        lci_import = importers.SingleOutputEcospold2Importer(
-            os.path.join(self.dirpath, 'US_LCI'), db_name)
-        lci_import.apply_strategies()
-        
-        lci_import.migrate('unusual-units')
-        lci_import.migrate('default-units')
-        
-        # Link the biosphere flows by their names, units, and categories
-        link_iter = functools.partial(strategies.link_iterable_by_fields, 
-                                      other= bw2.Database(bw2.config.biosphere),
-                                      kind='biosphere')
-        lci_import.apply_strategy(link_iter)
-        
-        print('\nInspecting data...\n')        
-        self.inspect(lci_import, db_name)
+        if not _check_db(db_name, True):
+            return
+
+        import_jsonld(db_path, db_name, unlinked=unlinked)
+
+        log_event(logger, 'database_imported',
+                  f'Successfully imported U.S. Life Cycle Inventory database as "{db_name}".',
+                  database=db_name)
+
+
+    @profiled('download')
+    def download(self, *sources, threads=None, processes=None, skip_existing=True):
+        '''
+        Download and import the databases of multiple sources concurrently,
+        so the total time is roughly that of the slowest source.
 
-        print('\nSuccessfully imported U.S. Life Cycle Inventory database as "us_lci".')
+        Parameters
+        ----------
+        sources : str or :class:`Source`
+            Names of the registered sources (e.g., "forwast", "ecoinvent")
+            or :class:`Source` objects (e.g., with credentials or paths).
+        threads : int
+            Maximum number of threads for downloading and extraction.
+        processes : int
+            Maximum number of processes for parsing.
+        skip_existing : bool
+            Whether to skip the sources whose databases already exist in the project.
 
+        Returns
+        -------
+        databases : list
+            Names of the imported databases.
+
+        See Also
+        --------
+        :func:`import_sources`, :func:`register_source`
+        '''
+        return import_sources(sources, threads=threads, processes=processes,
+                              skip_existing=skip_existing)
 
     @staticmethod
-    def inspect(sp, db_name):
+    @profiled('inspect')
+    def inspect(sp, db_name, bulk=True):
         '''
         Check for unlinked exchanges in a given database. 
         If found, it will be the user's decision to if or not continue writing to 
@@ -314,6 +528,9 @@ class DataDownloader:
             The initialized database to be inspected.
         db_name : obj
             Name of the database being inspected.
+        bulk : bool
+            Whether to write the database through :func:`bulk_write`
+            (much faster for large databases) instead of `sp.write_database`.
         
         Returns
         -------
@@ -325,10 +542,14 @@ class DataDownloader:
              The total number of unlinked exchanges.
         '''
         
-        datasets, exchanges, unlinked = sp.statistics(print_stats=False)
+        with profiler.stage('statistics'):
+            datasets, exchanges, unlinked = sp.statistics(print_stats=False)
+        profiler.count('exchanges inspected', exchanges)
+        profiler.count('unlinked exchanges', unlinked)
         
         if not unlinked:
-            sp.write_database()
+            with profiler.stage('writing'):
+                DataDownloader._write(sp, bulk)
         else:
             print(f'\nThere are {unlinked} unlinked exchanges, would you like to show all unlinked exchanges?')
             if input('[y]/[n]: ') in ('y', 'yes', 'Y', 'Yes', 'YES'):
@@ -337,7 +558,7 @@ class DataDownloader:
 
             print(f'\nContinue to write database {db_name}?')            
             if input('[y]/[n]: ') in ('y', 'yes', 'Y', 'Yes', 'YES'):
-                print ('Deleting exchanges with zero amount...')
+                logger.info('Deleting exchanges with zero amount...')
                 for ds in sp.data:
                     ds['exchanges'] = [exc for exc in ds['exchanges'] if (exc['amount'] or exc['uncertainty type'] != 0)]
                 
@@ -346,13 +567,22 @@ class DataDownloader:
                     try:
                         sp.apply_strategies([strategies.generic.drop_unlinked])  #sp.drop_unlinked(i_am_reckless=True)
                         sp.statistics()
-                        sp.write_database()
+                        with profiler.stage('writing'):
+                            DataDownloader._write(sp, bulk)
                     except:
-                        print ('\nDropping unlinked exchanges failed')
+                        logger.exception('Dropping unlinked exchanges failed.')
             else:
                 raise Warning ('\nStopped writing to backend SQLite3 database')      
         return datasets, exchanges
 
+    @staticmethod
+    def _write(sp, bulk=True):
+        if not bulk:
+            return sp.write_database()
+        metadata = dict(getattr(sp, 'metadata', None) or {})
+        metadata.setdefault('format', getattr(sp, 'format', ''))
+        return bulk_write(sp.data, sp.db_name, **metadata)
+
 
     @property
     def available_databases(self):
@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+BW2QSD: Bridging Brightway2 and QSD packages for LCA
+
+This module is developed by:
+    Yalin Li <mailto.yalin.li@gmail.com>
+
+This module is under the University of Illinois/NCSA Open Source License.
+Please refer to https://github.com/QSD-Group/BW2QSD/blob/main/LICENSE.txt
+for license details.
+'''
+
+import heapq, threading
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import splu
+from ._profiler import profiler
+
+__all__ = ('LCAEngine',)
+
+
+class LCAEngine:
+    '''
+    Calculation engine of a database, the technosphere matrix is factorized
+    only once and the characterization factors of the methods are cached,
+    so repeated calculations only need (batched) back substitutions.
+
+    The calculation is the same as :class:`bw2calc.LCA`, i.e.,
+    the score of a demand `f` is `c @ B @ inv(A) @ f`, with `A` being
+    the technosphere matrix, `B` the biosphere matrix, and `c` the
+    characterization factors of the biosphere flows.
+
+    Parameters
+    ----------
+    matrices : :class:`MatrixSet`
+        Processed matrices of the database.
+    '''
+
+    __slots__ = ('matrices', '_lu', '_vectors', '_lock', '_keys')
+
+    def __init__(self, matrices):
+        self.matrices = matrices
+        self._lu = None
+        self._vectors = {}
+        self._lock = threading.RLock()
+        self._keys = None
+
+    def __repr__(self):
+        return f'<LCAEngine: {self.database}>'
+
+    @property
+    def database(self):
+        '''[str] Name of the database.'''
+        return self.matrices.database
+
+    def factorize(self):
+        '''Factorize the technosphere matrix (if not already done).'''
+        with self._lock:
+            if self._lu is None:
+                A = self.matrices.technosphere
+                if A.shape[0] != A.shape[1]:
+                    raise ValueError(f'The technosphere matrix of {self.database} is not square ' \
+                                     f'({A.shape[0]} products x {A.shape[1]} activities).')
+                with profiler.stage('factorization'):
+                    self._lu = splu(sparse.csc_matrix(A, dtype=np.float64))
+        return self._lu
+
+    def solve(self, rhs, trans='N'):
+        '''
+        Solve the technosphere system for the right-hand side(s)
+        (products x n array), set `trans` to "T" to solve the transposed system.
+        '''
+        lu = self._lu or self.factorize()
+        rhs = np.asarray(rhs, dtype=np.float64)
+        with self._lock: # the SuperLU object is not safe to be solved from multiple threads at once
+            return lu.solve(rhs, trans=trans)
+
+    def ids(self, keys):
+        '''Return the mapping ids of the activity keys.'''
+        from bw2data import mapping
+        try:
+            return np.array([mapping[tuple(key)] for key in keys], dtype=np.int64)
+        except KeyError as e:
+            raise KeyError(f'Activity {e.args[0]} not found in mapping, ' \
+                           'the database may need to be processed.') from None
+
+    def keys(self, ids):
+        '''Return the activity keys of the mapping ids.'''
+        with self._lock:
+            if self._keys is None:
+                from bw2data import mapping
+                self._keys = {v: k for k, v in mapping.items()}
+        return [self._keys[int(i)] for i in ids]
+
+    def product_rows(self, keys):
+        '''Return the technosphere rows of the reference products of the activities.'''
+        return self.matrices.index('product', self.ids(keys))
+
+    def characterization(self, methods):
+        '''
+        Return the characterization factors of the methods
+        as a sparse matrix (methods x biosphere flows), results are cached.
+        '''
+        methods = [tuple(m) for m in methods]
+        with self._lock:
+            missing = [m for m in dict.fromkeys(methods) if m not in self._vectors]
+            if missing:
+                with profiler.stage('characterization'):
+                    vectors = self.matrices.method_vectors(missing)
+                    for method, vector in zip(missing, vectors):
+                        self._vectors[method] = sparse.csr_matrix(vector)
+            return sparse.vstack([self._vectors[m] for m in methods], format='csr')
+
+    def normalization(self, normalizations):
+        '''
+        Return the normalization factors (normalizations x biosphere flows)
+        of the Brightway2 normalizations as a dense array, None for no normalization
+        (i.e., factors of 1), results are cached.
+        '''
+        n_flows = self.matrices.biosphere_ids.size
+        rows = []
+        with self._lock:
+            for normalization in normalizations:
+                if normalization is None:
+                    rows.append(np.ones(n_flows))
+                    continue
+                normalization = ('normalization', tuple(normalization))
+                if normalization not in self._vectors:
+                    with profiler.stage('normalization'):
+                        self._vectors[normalization] = \
+                            self.matrices.normalization_vector(normalization[1])
+                rows.append(self._vectors[normalization])
+        return np.vstack(rows) if rows else np.zeros((0, n_flows))
+
+    def _demand(self, rows, amounts=None):
+        rhs = np.zeros((self.matrices.technosphere.shape[0], len(rows)))
+        rhs[rows, np.arange(len(rows))] = 1. if amounts is None else amounts
+        return rhs
+
+    def supply(self, keys, amounts=None):
+        '''
+        Return the supply arrays (activities x n) of the demands,
+        each column is the demand of one activity (1 unit if `amounts` not given).
+        '''
+        return self.solve(self._demand(self.product_rows(keys), amounts))
+
+    def inventory(self, keys, amounts=None):
+        '''Return the life cycle inventories (biosphere flows x n) of the demands.'''
+        return self.matrices.biosphere @ self.supply(keys, amounts)
+
+    def scores(self, keys, methods, block_size=256, bar=None, normalizations=None):
+        '''
+        Return the impact scores (activities x methods) of one unit of each activity.
+
+        Parameters
+        ----------
+        keys : Iterable
+            Keys of the activities.
+        methods : Iterable
+            Impact assessment methods.
+        block_size : int
+            Number of activities solved together,
+            larger blocks are faster but take more memory.
+        bar : obj
+            Progress bar with an `update` method.
+        normalizations : Iterable
+            Brightway2 normalizations of the flows (one for each method, None for no normalization)
+            applied to the characterized inventories, as in `bw2calc`.
+        '''
+        keys = list(keys)
+        rows = self.product_rows(keys)
+        C = self.characterization(methods)
+        if normalizations is not None:
+            C = C.multiply(self.normalization(normalizations)).tocsr()
+        B = self.matrices.biosphere
+        self.factorize()
+
+        results = np.empty((len(keys), C.shape[0]))
+        lci_stage, lcia_stage = profiler.stage('lci'), profiler.stage('lcia')
+        for start in range(0, len(keys), block_size):
+            block = rows[start:start+block_size]
+            with lci_stage:
+                inventory = B @ self.solve(self._demand(block))
+            with lcia_stage:
+                results[start:start+len(block)] = (C @ inventory).T
+            if bar is not None:
+                bar.update(len(block))
+
+        profiler.count('activities calculated', len(keys))
+        profiler.count('indicators calculated', C.shape[0])
+        return results
+
+    def inventory_blocks(self, keys, block_size=256):
+        '''
+        Yield the life cycle inventories (biosphere flows x n) of one unit of each activity
+        block by block, so that the inventories of many activities can be written out
+        without holding all of them in memory.
+        '''
+        rows = self.product_rows(keys)
+        B = self.matrices.biosphere
+        self.factorize()
+        for start in range(0, len(rows), block_size):
+            with profiler.stage('lci'):
+                inventory = B @ self.solve(self._demand(rows[start:start+block_size]))
+            yield inventory
+
+    def cumulative_scores(self, method):
+        '''
+        Return the direct scores of one unit of each activity (i.e., the characterized
+        biosphere vector `c @ B`) and the cumulative scores of one unit of each product,
+        the latter is from one solve of the transposed system `A.T @ u = (c @ B).T`.
+        '''
+        h = np.asarray((self.characterization([method]) @ self.matrices.biosphere).todense()).ravel()
+        with profiler.stage('lci'):
+            u = self.solve(h, trans='T')
+        return h, u
+
+    def traverse(self, keys, method, cutoff=0.01, max_calc=1000):
+        '''
+        Walk the supply chains of the activities upstream with best-first expansion,
+        i.e., the node with the largest (absolute) cumulative score is expanded first,
+        and nodes below `cutoff` (as a fraction of the score of the activity) are pruned.
+
+        Parameters
+        ----------
+        keys : Iterable
+            Keys of the activities.
+        method : tuple
+            Impact assessment method.
+        cutoff : float
+            Fraction of the score of the activity below which the nodes are not included.
+        max_calc : int
+            Maximum number of nodes expanded for each activity.
+
+        Returns
+        -------
+        nodes : list
+            Each node as (activity position in `keys`, node id, parent node id (-1 for the root),
+            depth, activity column, amount (scaling of the activity), cumulative score, direct score).
+        '''
+        A = sparse.csc_matrix(self.matrices.technosphere)
+        h, u = self.cumulative_scores(method)
+        try: # rows of the products to columns of the activities producing them
+            producers = self.matrices.index('activity', self.matrices.product_ids)
+        except KeyError:
+            producers = np.arange(A.shape[1])
+        own_rows = np.empty(A.shape[1], dtype=np.int64)
+        own_rows[producers] = np.arange(A.shape[0])
+        production = np.asarray(A[np.arange(A.shape[0]), producers]).ravel()
+
+        nodes = []
+        with profiler.stage('traversal'):
+            for n, row in enumerate(self.product_rows(keys)):
+                root = len(nodes)
+                total = u[row]
+                threshold = abs(total)*cutoff
+                nodes.append((n, 0, -1, 0, producers[row], 1./production[row], total,
+                              h[producers[row]]/production[row]))
+                heap = [(-abs(total), root)]
+                for _ in range(max_calc):
+                    if not heap:
+                        break
+                    nid = heapq.heappop(heap)[1]
+                    depth, col, scale = nodes[nid][3:6]
+                    start, end = A.indptr[col], A.indptr[col+1]
+                    rows, values = A.indices[start:end], A.data[start:end]
+                    keep = rows != own_rows[col]
+                    rows, amounts = rows[keep], -values[keep]*scale
+                    scores = amounts*u[rows]
+                    keep = (np.abs(scores) >= threshold) & (amounts != 0)
+                    for r, amount, score in zip(rows[keep], amounts[keep], scores[keep]):
+                        child = len(nodes)
+                        child_scale = amount/production[r]
+                        nodes.append((n, child-root, nid-root, depth+1, producers[r],
+                                      child_scale, score, child_scale*h[producers[r]]))
+                        heapq.heappush(heap, (-abs(score), child))
+        profiler.count('supply chain nodes', len(nodes))
+        return nodes
+
+    def exchange_positions(self, inputs, outputs):
+        '''
+        Return the kinds ("technosphere" or "biosphere"), rows, and columns
+        of the exchanges given as the keys of their inputs and outputs.
+        '''
+        matrices = self.matrices
+        cols = matrices.index('activity', self.ids(outputs))
+        input_ids = self.ids(inputs)
+        kinds, rows = [], []
+        for i in input_ids:
+            try:
+                rows.append(int(matrices.index('product', [i])[0]))
+                kinds.append('technosphere')
+            except KeyError:
+                rows.append(int(matrices.index('biosphere', [i])[0]))
+                kinds.append('biosphere')
+        return kinds, np.array(rows, dtype=np.int64), cols
+
+    def scenario_scores(self, keys, methods, scenarios):
+        '''
+        Return the impact scores (scenarios x activities x methods) of one unit of each activity
+        when the matrix values are changed as in the scenarios.
+
+        Changes to the technosphere matrix are handled through the Woodbury identity
+        with the factorization of the original matrix, i.e., only the columns of
+        `inv(A)` for the changed rows (shared by all scenarios) need to be solved,
+        then each scenario only requires a small dense solve.
+
+        Parameters
+        ----------
+        keys : Iterable
+            Keys of the activities.
+        methods : Iterable
+            Impact assessment methods.
+        scenarios : Iterable
+            Each scenario is a pair of the technosphere changes and the biosphere changes,
+            each as an Iterable of (row, column, change in value) in the matrices,
+            changes of the same entry are added up.
+        '''
+        keys = list(keys)
+        A, B = self.matrices.technosphere, self.matrices.biosphere
+        C = self.characterization(methods)
+        self.factorize()
+
+        scenarios = [(self._deltas(A, tech), self._deltas(B, bio)) for tech, bio in scenarios]
+        changed_rows = np.unique(np.concatenate(
+            [np.zeros(0, dtype=np.int64)] + [tech[0] for tech, bio in scenarios]))
+
+        with profiler.stage('lci'):
+            X0 = self.solve(self._demand(self.product_rows(keys)))
+            Z = self.solve(self._demand(changed_rows)) if changed_rows.size \
+                else np.zeros((A.shape[0], 0))
+        with profiler.stage('lcia'):
+            H = (C @ B).toarray()
+            base = H @ X0
+            HZ = H @ Z
+
+        results = np.empty((len(scenarios), len(keys), C.shape[0]))
+        with profiler.stage('scenarios'):
+            for n, ((r, c, d), (br, bc, bd)) in enumerate(scenarios):
+                if d.size:
+                    j = np.searchsorted(changed_rows, r)
+                    S = np.eye(d.size) + Z[np.ix_(c, j)]*d
+                    try:
+                        Y = np.linalg.solve(S, X0[c])
+                    except np.linalg.LinAlgError:
+                        results[n] = self._scenario_fallback(keys, C, (r, c, d), (br, bc, bd))
+                        continue
+                    scores = base - (HZ[:, j]*d) @ Y
+                    supply = lambda cols: X0[cols] - (Z[np.ix_(cols, j)]*d) @ Y
+                else:
+                    scores = base.copy()
+                    supply = lambda cols: X0[cols]
+                if bd.size:
+                    scores += (C[:, br].toarray()*bd) @ supply(bc)
+                results[n] = scores.T
+
+        profiler.count('scenarios calculated', len(scenarios))
+        return results
+
+    @staticmethod
+    def _deltas(matrix, changes):
+        # Convert (row, column, change in value) to (rows, columns, changes),
+        # changes of the same entry (e.g., of two exchanges summed into it) are added up
+        deltas = {}
+        for r, c, v in changes:
+            deltas[(int(r), int(c))] = deltas.get((int(r), int(c)), 0.) + float(v)
+        deltas = {k: v for k, v in deltas.items() if v}
+        if not deltas:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, np.zeros(0)
+        rows, cols = (np.array(i, dtype=np.int64) for i in zip(*deltas.keys()))
+        return rows, cols, np.fromiter(deltas.values(), dtype=np.float64)
+
+    def _scenario_fallback(self, keys, C, tech, bio):
+        # Refactorize the changed matrices when the Woodbury update is singular
+        A = sparse.csc_matrix(self.matrices.technosphere, dtype=np.float64, copy=True)
+        B = sparse.csr_matrix(self.matrices.biosphere, dtype=np.float64, copy=True)
+        for matrix, (rows, cols, deltas) in ((A, tech), (B, bio)):
+            if deltas.size:
+                matrix[rows, cols] = np.asarray(matrix[rows, cols]).ravel() + deltas
+        supply = splu(A.tocsc()).solve(self._demand(self.product_rows(keys)))
+        return (C @ (B @ supply)).T
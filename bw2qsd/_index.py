@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+BW2QSD: Bridging Brightway2 and QSD packages for LCA
+
+This module is developed by:
+    Yalin Li <mailto.yalin.li@gmail.com>
+
+This module is under the University of Illinois/NCSA Open Source License.
+Please refer to https://github.com/QSD-Group/BW2QSD/blob/main/LICENSE.txt
+for license details.
+'''
+
+from ._profiler import profiler
+
+__all__ = ('ActivityIndex',)
+
+# Maximum number of codes in one query (SQLite limits the number of variables)
+_MAX_VARIABLES = 900
+
+
+def _chunks(keys):
+    codes = {}
+    for database, code in keys:
+        codes.setdefault(database, []).append(code)
+    for database, db_codes in codes.items():
+        for start in range(0, len(db_codes), _MAX_VARIABLES):
+            yield database, db_codes[start:start+_MAX_VARIABLES]
+
+
+def _query_activities(keys, data=True):
+    # Return {key: (name, product, location[, data])} of the activities through bulk queries
+    from bw2data.backends.peewee import ActivityDataset as AD
+    fields = [AD.database, AD.code, AD.name, AD.product, AD.location]
+    if data:
+        fields.append(AD.data)
+    found = {}
+    for database, codes in _chunks(dict.fromkeys(keys)):
+        query = AD.select(*fields).where((AD.database == database) & (AD.code << codes))
+        for row in query.tuples():
+            found[(row[0], row[1])] = row[2:]
+    return found
+
+
+def _get_activities(keys):
+    # Return {key: Activity} of the activities through bulk queries instead of one query per key
+    from bw2data.backends.peewee import Activity, ActivityDataset as AD
+    found = {}
+    for database, codes in _chunks(dict.fromkeys(keys)):
+        for doc in AD.select().where((AD.database == database) & (AD.code << codes)):
+            found[(doc.database, doc.code)] = Activity(doc)
+    return found
+
+
+def _query_exchanges(keys):
+    # Return [(output key, input key, type, data)] of the exchanges of the activities
+    from bw2data.backends.peewee import ExchangeDataset as ED
+    fields = (ED.output_database, ED.output_code, ED.input_database, ED.input_code, ED.type, ED.data)
+    rows = []
+    for database, codes in _chunks(dict.fromkeys(keys)):
+        query = ED.select(*fields).where((ED.output_database == database) & (ED.output_code << codes))
+        rows.extend(((r[0], r[1]), (r[2], r[3]), r[4], r[5]) for r in query.tuples())
+    return rows
+
+
+class ActivityIndex:
+    '''
+    Index of the activities in databases by their
+    (name, reference product, location), built through one bulk SQL query
+    rather than through searches.
+
+    Parameters
+    ----------
+    keys : list
+        Keys of the activities, each as (database name, activity code).
+    names : list
+        Names of the activities.
+    products : list
+        Reference products of the activities.
+    locations : list
+        Locations of the activities.
+    units : list
+        Units of the activities, only included if requested when building the index.
+    '''
+
+    __slots__ = ('keys', 'names', 'products', 'locations', 'units',
+                 '_lookup', '_by_name', '_by_location')
+
+    def __init__(self, keys, names, products, locations, units=None):
+        self.keys = list(keys)
+        self.names = list(names)
+        self.products = list(products)
+        self.locations = list(locations)
+        self.units = list(units) if units is not None else None
+        # Positions bucketed by (name, product, location), name, and (name, location)
+        self._lookup = {}
+        self._by_name = {}
+        self._by_location = {}
+        for n, entry in enumerate(zip(self.names, self.products, self.locations)):
+            self._lookup.setdefault(entry, []).append(n)
+            self._by_name.setdefault(entry[0], []).append(n)
+            self._by_location.setdefault((entry[0], entry[2]), []).append(n)
+
+    def __repr__(self):
+        return f'<ActivityIndex: {len(self)} activities>'
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_databases(cls, databases, unit=False):
+        '''
+        Build the index of the activities (i.e., processes) in the databases.
+
+        Parameters
+        ----------
+        databases : str or Iterable
+            Name(s) of the database(s).
+        unit : bool
+            Whether to include the units of the activities,
+            this requires loading the full data of the activities (slower).
+        '''
+        from bw2data.backends.peewee import ActivityDataset as AD
+        if isinstance(databases, str):
+            databases = (databases,)
+
+        fields = [AD.database, AD.code, AD.name, AD.product, AD.location]
+        if unit:
+            fields.append(AD.data)
+        with profiler.stage('activity index'):
+            rows = list(AD.select(*fields)
+                        .where((AD.database << list(databases)) & (AD.type == 'process'))
+                        .tuples())
+
+        units = [row[5].get('unit', '') for row in rows] if unit else None
+        return cls(keys=[(row[0], row[1]) for row in rows],
+                   names=[row[2] or '' for row in rows],
+                   products=[row[3] or '' for row in rows],
+                   locations=[row[4] or '' for row in rows],
+                   units=units)
+
+    def get(self, name, product, location):
+        '''
+        Return the keys of the activities with the exact (name, reference product, location).
+        '''
+        return [self.keys[n] for n in self._lookup.get((name, product, location), ())]
+
+    def find(self, name=None, product=None, locations=(), unit=None):
+        '''
+        Return the positions of the activities that match all of the given fields
+        exactly (fields that are not provided will not be checked).
+
+        Parameters
+        ----------
+        name : str
+            Name of the activities.
+        product : str
+            Reference product of the activities.
+        locations : str or Iterable
+            Location(s) of the activities.
+        unit : str
+            Unit of the activities, requires the index to be built with units.
+        '''
+        if isinstance(locations, str):
+            locations = (locations,)
+        locations = set(locations)
+        if unit is not None and self.units is None:
+            raise ValueError('Units are not included in the index.')
+        if name is None:
+            candidates = range(len(self))
+        elif locations:
+            candidates = sorted(n for loc in locations for n in self._by_location.get((name, loc), ()))
+        else:
+            candidates = self._by_name.get(name, ())
+        return [n for n in candidates
+                if (name is None or self.names[n] == name)
+                and (product is None or self.products[n] == product)
+                and (not locations or self.locations[n] in locations)
+                and (unit is None or self.units[n] == unit)]
+
+    def entry(self, n, unit=False):
+        '''Return the (name, reference product, location[, unit]) of the activity at the position.'''
+        entry = (self.names[n], self.products[n], self.locations[n])
+        return (*entry, self.units[n]) if unit else entry
+
+    def match(self, other, unit=True):
+        '''
+        Match the activities to those of another index (e.g., of a different version
+        of the database) by (name, reference product, location[, unit]),
+        activities with duplicated entries in either index are not matched.
+
+        Parameters
+        ----------
+        other : :class:`ActivityIndex`
+            The other index.
+        unit : bool
+            Whether to also match the units, requires both indices to be built with units.
+
+        Returns
+        -------
+        positions : list
+            Positions of the matched activities in this index.
+        other_positions : list
+            Positions of the matched activities in the other index.
+        '''
+        for index in (self, other):
+            if unit and index.units is None:
+                raise ValueError('Units are not included in the index.')
+
+        def unique(index, ns):
+            # Position of the only activity in the bucket (with the unit), None if duplicated
+            if not unit:
+                return {None: ns[0]} if len(ns) == 1 else {}
+            positions = {}
+            for n in ns:
+                positions[index.units[n]] = None if index.units[n] in positions else n
+            return positions
+
+        pairs = []
+        for entry, ns in self._lookup.items():
+            others = other._lookup.get(entry)
+            if not others:
+                continue
+            theirs = unique(other, others)
+            pairs.extend((n, theirs[u]) for u, n in unique(self, ns).items()
+                         if n is not None and theirs.get(u) is not None)
+        return [p[0] for p in pairs], [p[1] for p in pairs]
+
+    def to_frame(self):
+        '''Return the index as a :class:`pandas.DataFrame`.'''
+        import pandas as pd
+        data = {'key': self.keys, 'name': self.names,
+                'product': self.products, 'location': self.locations}
+        if self.units is not None:
+            data['unit'] = self.units
+        return pd.DataFrame(data)
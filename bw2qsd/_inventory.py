@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+BW2QSD: Bridging Brightway2 and QSD packages for LCA
+
+This module is developed by:
+    Yalin Li <mailto.yalin.li@gmail.com>
+
+This module is under the University of Illinois/NCSA Open Source License.
+Please refer to https://github.com/QSD-Group/BW2QSD/blob/main/LICENSE.txt
+for license details.
+'''
+
+import os, json
+import numpy as np
+from scipy import sparse
+from ._logger import get_logger
+
+__all__ = ('load_inventories',)
+
+logger = get_logger('inventory')
+
+_INVENTORY_VERSION = 1
+
+# Files of the compressed sparse column (CSC) layout
+_files = {'data': np.float64, 'indices': np.int32, 'indptr': np.int64}
+
+
+class _InventoryWriter:
+    '''
+    Append blocks of inventories (biosphere flows x activities) as columns of
+    a CSC matrix stored in raw binary files, only one block is held in memory.
+    '''
+
+    __slots__ = ('path', 'n_rows', 'n_columns', 'nnz', '_files')
+
+    def __init__(self, path, n_rows):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.n_rows = n_rows
+        self.n_columns = 0
+        self.nnz = 0
+        self._files = {k: open(os.path.join(path, f'{k}.bin'), 'wb') for k in _files}
+        self._write('indptr', [0])
+
+    def _write(self, kind, array):
+        self._files[kind].write(np.ascontiguousarray(array, dtype=_files[kind]).tobytes())
+
+    def add(self, block, rows=None, threshold=0.):
+        '''
+        Add the block (dense, flows x n) as columns,
+        with `rows` being the rows of the block's flows in the stored matrix.
+        '''
+        block = np.where(np.abs(block) > threshold, block, 0.)
+        csc = sparse.csc_matrix(block)
+        if rows is not None: # reorder the rows within each column
+            csc = sparse.csc_matrix((csc.data, np.asarray(rows)[csc.indices], csc.indptr),
+                                    shape=(self.n_rows, csc.shape[1]))
+            csc.sort_indices()
+        self._write('data', csc.data)
+        self._write('indices', csc.indices)
+        self._write('indptr', csc.indptr[1:] + self.nnz)
+        self.nnz += csc.nnz
+        self.n_columns += csc.shape[1]
+
+    def close(self, **meta):
+        '''Close the files and write the metadata.'''
+        for f in self._files.values():
+            f.close()
+        meta = {'version': _INVENTORY_VERSION, 'shape': [self.n_rows, self.n_columns],
+                'nnz': self.nnz, 'dtypes': {k: np.dtype(v).name for k, v in _files.items()},
+                **meta}
+        with open(os.path.join(self.path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+
+def load_inventories(path, mmap=True):
+    '''
+    Load the life cycle inventories exported through :func:`CFgetter.export_inventories`.
+
+    Parameters
+    ----------
+    path : str
+        Directory of the exported inventories.
+    mmap : bool
+        Whether to memory-map the arrays instead of reading them into memory.
+
+    Returns
+    -------
+    inventories : :class:`scipy.sparse.csc_matrix`
+        Inventories (biosphere flows x activities) of one unit of each activity.
+    flows : :class:`pandas.DataFrame`
+        Database, code, name, categories, and unit of the biosphere flows (rows).
+    activities : :class:`pandas.DataFrame`
+        Key in the getter, database, and code of the activities (columns).
+    '''
+    import pandas as pd
+    with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta.get('version', 0) > _INVENTORY_VERSION:
+        raise ValueError(f'Inventory version {meta["version"]} is not supported, ' \
+                         'please update BW2QSD.')
+
+    read = (lambda fp, dtype: np.memmap(fp, dtype=dtype, mode='r')) if mmap else np.fromfile
+    arrays = {}
+    for kind, dtype in meta['dtypes'].items():
+        fp = os.path.join(path, f'{kind}.bin')
+        # Empty files cannot be memory-mapped
+        arrays[kind] = read(fp, dtype) if os.path.getsize(fp) else np.zeros(0, dtype=dtype)
+    inventories = sparse.csc_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                                    shape=tuple(meta['shape']), copy=False)
+
+    flows = pd.DataFrame(meta['flows'], columns=('database', 'code', 'name', 'categories', 'unit'))
+    flows['categories'] = flows['categories'].map(tuple)
+    activities = pd.DataFrame(meta['activities'], columns=('activity', 'database', 'code'))
+    return inventories, flows, activities
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+BW2QSD: Bridging Brightway2 and QSD packages for LCA
+
+This module is developed by:
+    Yalin Li <mailto.yalin.li@gmail.com>
+
+This module is under the University of Illinois/NCSA Open Source License.
+Please refer to https://github.com/QSD-Group/BW2QSD/blob/main/LICENSE.txt
+for license details.
+'''
+
+import os, json
+from zipfile import ZipFile
+from ._linker import BiosphereLinker
+from ._logger import get_logger, progress
+from ._profiler import profiler
+from ._sources import Source, register_source
+from ._writer import bulk_write
+
+__all__ = ('import_jsonld',)
+
+logger = get_logger('jsonld')
+
+# Folders of the JSON-LD archive that are read, in the order of reading
+_folders = ('categories', 'locations', 'flows', 'processes')
+
+# Keywords in openLCA category paths to Brightway2 (biosphere3) compartments,
+# resources first as they can be "in water", etc.
+_compartments = (
+    ('resource', 'natural resource'),
+    ('air', 'air'),
+    ('water', 'water'),
+    ('soil', 'soil'),
+    ('ground', 'soil'),
+    )
+
+_subcompartments = {
+    'low population density': 'non-urban air or from high stacks',
+    'high population density': 'urban air close to ground',
+    'lower stratosphere + upper troposphere': 'lower stratosphere + upper troposphere',
+    'low population density, long-term': 'low population density, long-term',
+    'ground water': 'ground-',
+    'ground water, long-term': 'ground-, long-term',
+    'surface water': 'surface water',
+    'fresh water': 'surface water',
+    'sea water': 'ocean',
+    'ocean': 'ocean',
+    'agricultural': 'agricultural',
+    'industrial': 'industrial',
+    'forestry': 'forestry',
+    'in ground': 'in ground',
+    'in water': 'in water',
+    'in air': 'in air',
+    'biotic': 'biotic',
+    'land': 'land',
+    }
+
+
+def _read_archive(fp):
+    '''
+    Yield the (folder, entry) of the JSON-LD archive, each entry is
+    parsed on its own straight from the zip, so memory only holds one entry at a time.
+    '''
+    with ZipFile(fp) as zf:
+        infos = {folder: [] for folder in _folders}
+        for info in zf.infolist():
+            folder = info.filename.split('/', 1)[0]
+            if folder in infos and info.filename.endswith('.json'):
+                infos[folder].append(info)
+        total = sum(len(v) for v in infos.values())
+        with progress(total=total, desc='Parsing JSON-LD', unit='entries', log=logger) as bar:
+            for folder in _folders:
+                for info in infos[folder]:
+                    with zf.open(info) as f:
+                        yield folder, json.load(f)
+                    bar.update()
+
+
+def _category_path(category, categories):
+    # openLCA 2 uses category paths as str, openLCA 1 uses references to category entries
+    if not category:
+        return ()
+    if isinstance(category, str):
+        return tuple(category.split('/'))
+    if category.get('categoryPath'):
+        return (*category['categoryPath'], category.get('name', ''))
+    path, ref, seen = [], category.get('@id'), set()
+    while ref in categories and ref not in seen:
+        seen.add(ref)
+        name, ref = categories[ref]
+        path.append(name)
+    return tuple(reversed(path)) or (category.get('name', ''),)
+
+
+def _biosphere_categories(path):
+    '''Convert an openLCA category path of an elementary flow to Brightway2 categories.'''
+    parts = [p.strip().lower() for p in path if p.strip()]
+    if parts and parts[0] == 'elementary flows':
+        parts = parts[1:]
+    compartment = next((bw for keyword, bw in _compartments
+                        if any(keyword in p for p in parts[:2])), None)
+    if compartment is None:
+        return tuple(parts)
+    sub = _subcompartments.get(parts[-1]) if len(parts) > 1 else None
+    return (compartment, sub) if sub else (compartment,)
+
+
+def _unit(exchange, flow):
+    from bw2io.units import normalize_units
+    unit = (exchange.get('unit') or {}).get('name') or flow.get('unit') or ''
+    return normalize_units(unit)
+
+
+class _Reader:
+    # Convert the entries of a JSON-LD archive to Brightway2 datasets
+    __slots__ = ('db_name', 'categories', 'locations', 'flows',
+                 'datasets', 'providers', 'elementary', 'unlinked')
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.categories = {} # id: (name, parent id)
+        self.locations = {} # id: code
+        self.flows = {} # id: compact flow info
+        self.datasets = []
+        self.providers = {} # product flow id: process id
+        self.elementary = {} # elementary flow id: (name, unit, categories)
+        self.unlinked = {} # product name: number of unlinked exchanges
+
+    def read(self, folder, entry):
+        if folder == 'categories':
+            parent = entry.get('category')
+            parent = parent.get('@id') if isinstance(parent, dict) else None
+            self.categories[entry['@id']] = (entry.get('name', ''), parent)
+        elif folder == 'locations':
+            self.locations[entry['@id']] = entry.get('code') or entry.get('name', '')
+        elif folder == 'flows':
+            unit = ''
+            for prop in entry.get('flowProperties', ()):
+                if prop.get('referenceFlowProperty'):
+                    unit = (prop.get('flowProperty') or {}).get('refUnit', '')
+            self.flows[entry['@id']] = {
+                'name': entry.get('name', ''),
+                'type': entry.get('flowType', ''),
+                'unit': unit,
+                'categories': _category_path(entry.get('category'), self.categories),
+                }
+        else:
+            self.datasets.append(self._dataset(entry))
+
+    def _flow(self, exchange):
+        ref = exchange.get('flow') or {}
+        flow = self.flows.get(ref.get('@id'))
+        if flow is None:
+            flow = {'name': ref.get('name', ''), 'type': ref.get('flowType', ''),
+                    'unit': ref.get('refUnit', ''),
+                    'categories': _category_path(ref.get('category'), self.categories)}
+        return ref.get('@id'), flow
+
+    def _dataset(self, process):
+        code = process['@id']
+        location = process.get('location') or {}
+        if isinstance(location, dict):
+            location = self.locations.get(location.get('@id')) \
+                or location.get('code') or location.get('name', '')
+
+        ds = {
+            'database': self.db_name,
+            'code': code,
+            'name': process.get('name', ''),
+            'location': location or 'GLO',
+            'comment': (process.get('processDocumentation') or {}).get('technologyDescription', '') \
+                or process.get('description', ''),
+            'categories': _category_path(process.get('category'), self.categories),
+            'type': 'process',
+            'exchanges': [],
+            }
+        for exc in process.get('exchanges', ()):
+            flow_id, flow = self._flow(exc)
+            amount = float(exc.get('amount', 0.))
+            unit = _unit(exc, flow)
+            if exc.get('quantitativeReference'):
+                ds['reference product'] = flow['name']
+                ds['unit'] = unit
+                ds['production amount'] = -amount if exc.get('input') else amount
+                ds['exchanges'].append({
+                    'input': (self.db_name, code), 'amount': ds['production amount'],
+                    'type': 'production', 'name': flow['name'], 'unit': unit,
+                    })
+                self.providers.setdefault(flow_id, code)
+            elif flow['type'] == 'ELEMENTARY_FLOW':
+                self.elementary[flow_id] = (flow['name'], unit, _biosphere_categories(flow['categories']))
+                ds['exchanges'].append({
+                    'flow': flow_id, 'amount': amount, 'type': 'biosphere',
+                    'name': flow['name'], 'unit': unit,
+                    })
+            else: # product and waste flows, inputs are positive as in Brightway2
+                provider = (exc.get('defaultProvider') or {}).get('@id')
+                ds['exchanges'].append({
+                    'flow': flow_id, 'provider': provider,
+                    'amount': amount if exc.get('input') else -amount,
+                    'type': 'technosphere', 'name': flow['name'], 'unit': unit,
+                    })
+        ds.setdefault('unit', '')
+        return ds
+
+    def link(self, linker, unlinked='add'):
+        '''Link the exchanges, return the datasets of the elementary flows not in the biosphere.'''
+        processes = {ds['code'] for ds in self.datasets}
+        new_db = f'{self.db_name} biosphere'
+        new_flows, dropped = {}, 0
+        for flow_id, (name, unit, categories) in self.elementary.items():
+            key = linker.find(name, unit, categories)
+            if key is None and unlinked == 'add':
+                key = (new_db, flow_id)
+                new_flows[flow_id] = {
+                    'database': new_db, 'code': flow_id, 'name': name, 'unit': unit,
+                    'categories': categories, 'exchanges': [],
+                    'type': 'natural resource' if categories[:1] == ('natural resource',) else 'emission',
+                    }
+            self.elementary[flow_id] = key
+
+        for ds in self.datasets:
+            exchanges = []
+            for exc in ds['exchanges']:
+                if exc['type'] == 'biosphere':
+                    exc['input'] = self.elementary[exc.pop('flow')]
+                elif exc['type'] == 'technosphere':
+                    flow_id, provider = exc.pop('flow'), exc.pop('provider')
+                    code = provider if provider in processes else self.providers.get(flow_id)
+                    exc['input'] = (self.db_name, code) if code else None
+                    if code is None:
+                        self.unlinked[exc['name']] = self.unlinked.get(exc['name'], 0) + 1
+                if exc.get('input') is None:
+                    dropped += 1
+                else:
+                    exchanges.append(exc)
+            ds['exchanges'] = exchanges
+
+        if dropped:
+            logger.warning(f'{dropped} unlinked exchanges dropped, ' \
+                           f'including {len(self.unlinked)} unlinked products.')
+        return list(new_flows.values())
+
+
+def import_jsonld(fp, db_name, biosphere='biosphere3', unlinked='add', write=True):
+    '''
+    Import an openLCA JSON-LD archive (e.g., USLCI from the
+    `Federal LCA Commons <https://www.lcacommons.gov/lca-collaboration/>`_)
+    as a Brightway2 database without conversion to ecoSpold.
+
+    Entries of the "processes" and "flows" folders are parsed one at a time
+    straight from the zip, elementary flows are linked through :class:`BiosphereLinker`
+    (i.e., hash indices of the biosphere database), and the database
+    is written through :func:`bulk_write`.
+
+    Parameters
+    ----------
+    fp : str
+        Path of the JSON-LD zip archive.
+    db_name : str
+        Name of the database.
+    biosphere : str
+        Name of the biosphere database to link the elementary flows to.
+    unlinked : str
+        Handling of the elementary flows not found in the biosphere database,
+        "add" to write them into a new "<db_name> biosphere" database,
+        "drop" to drop the exchanges.
+    write : bool
+        Whether to write the database, if False, the datasets will be returned.
+
+    Returns
+    -------
+    db : :class:`bw2data.Database` or list
+        The written database, or the datasets if `write` is False.
+    '''
+    if unlinked not in ('add', 'drop'):
+        raise ValueError(f'`unlinked` can only be "add" or "drop", not "{unlinked}".')
+
+    reader = _Reader(db_name)
+    with profiler.stage('parsing'):
+        for folder, entry in _read_archive(fp):
+            reader.read(folder, entry)
+    profiler.count('datasets parsed', len(reader.datasets))
+
+    with profiler.stage('linking'):
+        new_flows = reader.link(BiosphereLinker(biosphere), unlinked)
+
+    if not write:
+        return reader.datasets + new_flows
+    if new_flows:
+        logger.info(f'{len(new_flows)} elementary flows not in {biosphere}, ' \
+                    f'written to "{db_name} biosphere".')
+        bulk_write(new_flows, f'{db_name} biosphere', format='openLCA JSON-LD')
+    return bulk_write(reader.datasets, db_name, format='openLCA JSON-LD')
+
+
+@register_source
+class USLCISource(Source):
+    '''
+    U.S. Life Cycle Inventory (USLCI) database from a JSON-LD archive
+    downloaded from the `Federal LCA Commons <https://www.lcacommons.gov/lca-collaboration/>`_.
+
+    Parameters
+    ----------
+    archive : str
+        Path of the JSON-LD zip archive.
+    database : str
+        Name of the database.
+    '''
+
+    name = 'uslci'
+    database = 'us_lci'
+
+    def __init__(self, archive='', database='us_lci'):
+        super().__init__(os.path.dirname(archive))
+        self.archive = archive
+        self.database = database
+
+    def fetch(self):
+        if not os.path.isfile(self.archive):
+            raise FileNotFoundError(f'JSON-LD archive "{self.archive}" not found, ' \
+                                    'please first download it from the Federal LCA Commons.')
+        return self.archive
+
+    def parse(self, extracted):
+        return import_jsonld(extracted, self.database, write=False)
+
+    def write(self, parsed):
+        db_name = f'{self.database} biosphere'
+        new_flows = [ds for ds in parsed if ds['database'] == db_name]
+        if new_flows:
+            bulk_write(new_flows, db_name, format='openLCA JSON-LD')
+        bulk_write([ds for ds in parsed if ds['database'] != db_name],
+                   self.database, format='openLCA JSON-LD')
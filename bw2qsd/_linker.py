@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+BW2QSD: Bridging Brightway2 and QSD packages for LCA
+
+This module is developed by:
+    Yalin Li <mailto.yalin.li@gmail.com>
+
+This module is under the University of Illinois/NCSA Open Source License.
+Please refer to https://github.com/QSD-Group/BW2QSD/blob/main/LICENSE.txt
+for license details.
+'''
+
+import re
+from ._logger import get_logger
+from ._profiler import profiler
+
+__all__ = ('BiosphereLinker',)
+
+logger = get_logger('linker')
+
+_non_alphanumeric = re.compile(r'[^a-z0-9]+')
+
+
+def _normalize_name(name):
+    # e.g., "Carbon dioxide, fossil" to "carbon dioxide fossil"
+    return _non_alphanumeric.sub(' ', name.lower()).strip()
+
+
+class BiosphereLinker:
+    '''
+    Link biosphere exchanges to the flows of a biosphere database through
+    hash indices, rather than scanning the database for each exchange.
+
+    Two indices are built once: an exact one by (name, unit, categories)
+    and a fuzzy one by the normalized name (lowercased, with punctuation and
+    spaces collapsed), unit, and categories.
+    A flow is first looked up exactly, then fuzzily, both with the full categories
+    and then with the top-level compartment only (e.g., "air").
+    The top-level entries are kept separately from the full ones and only include
+    the flows categorized by the compartment alone (e.g., ("air",)), so that an exchange
+    is never linked to a flow of another subcompartment (which may have different
+    characterization factors). Exchanges linked through the top-level compartment
+    are recorded in the `fallback` attribute.
+
+    Parameters
+    ----------
+    database : str
+        Name of the biosphere database.
+    flows : Iterable
+        Flows as dicts with "code", "name", "unit", and "categories",
+        will be loaded from the database if not provided.
+
+    Examples
+    --------
+    >>> from bw2qsd import BiosphereLinker
+    >>> linker = BiosphereLinker('biosphere', flows=[
+    ...     {'code': 'co2', 'name': 'Carbon dioxide, fossil', 'unit': 'kilogram', 'categories': ('air',)}])
+    >>> linker.find('carbon dioxide fossil', 'kilogram', ('air', 'urban air close to ground'))
+    ('biosphere', 'co2')
+
+    Tip
+    ---
+    The linker can be used as a strategy of `bw2io` importers,
+    e.g., `importer.apply_strategy(BiosphereLinker())`.
+    '''
+
+    __slots__ = ('database', '_exact', '_fuzzy', '_top_level', '_fuzzy_top_level',
+                 'unmatched', 'fallback')
+
+    def __init__(self, database='biosphere3', flows=None):
+        self.database = database
+        self._exact = {}
+        self._fuzzy = {}
+        self._top_level = {}
+        self._fuzzy_top_level = {}
+        self.unmatched = {}
+        self.fallback = {}
+        if flows is None:
+            flows = self._load_flows(database)
+        with profiler.stage('biosphere indexing'):
+            for flow in flows:
+                key = (database, flow['code'])
+                name, unit = flow['name'], flow.get('unit')
+                categories = tuple(flow.get('categories', ()))
+                self._exact.setdefault((name.lower(), unit, categories), key)
+                self._fuzzy.setdefault((_normalize_name(name), unit, categories), key)
+                if len(categories) == 1:
+                    self._top_level.setdefault((name.lower(), unit, categories), key)
+                    self._fuzzy_top_level.setdefault((_normalize_name(name), unit, categories), key)
+
+    def __repr__(self):
+        return f'<BiosphereLinker: {self.database}>'
+
+    def __call__(self, data):
+        '''Link the datasets as a `bw2io` strategy.'''
+        self.link(data)
+        return data
+
+    @staticmethod
+    def _load_flows(database):
+        from bw2data.backends.peewee import ActivityDataset as AD
+        query = AD.select(AD.code, AD.data).where(AD.database == database).tuples()
+        return [{'code': code, **data} for code, data in query]
+
+    def find(self, name, unit, categories=(), fuzzy=True):
+        '''
+        Return the key of the flow, None if not found.
+
+        Parameters
+        ----------
+        name : str
+            Name of the flow.
+        unit : str
+            Unit of the flow (as in Brightway2, e.g., "kilogram").
+        categories : Iterable
+            Categories of the flow, e.g., ("air", "urban air close to ground").
+        fuzzy : bool
+            Whether to look up the normalized name if there is no exact match.
+        '''
+        return self._find(name, unit, categories, fuzzy)[0]
+
+    def _find(self, name, unit, categories, fuzzy):
+        # Return the key and whether it is found through the top-level compartment
+        categories = tuple(categories)
+        indices = ((self._exact, self._top_level),)
+        if fuzzy:
+            indices += ((self._fuzzy, self._fuzzy_top_level),)
+        for normalize, (full, top_level) in zip((str.lower, _normalize_name), indices):
+            flow = normalize(name)
+            key = full.get((flow, unit, categories))
+            if key is not None:
+                return key, False
+            key = top_level.get((flow, unit, categories[:1]))
+            if key is not None:
+                return key, len(categories) > 1
+        return None, False
+
+    def link(self, data, fuzzy=True, kind='biosphere'):
+        '''
+        Link the unlinked exchanges (i.e., without "input") of the datasets in place.
+
+        Parameters
+        ----------
+        data : Iterable
+            Datasets as dicts with "exchanges".
+        fuzzy : bool
+            Whether to look up the normalized names if there are no exact matches.
+        kind : str
+            Type of the exchanges to link.
+
+        Returns
+        -------
+        unmatched : dict
+            Numbers of the unmatched exchanges, keyed by the (name, unit, categories) of the flows,
+            also stored as the `unmatched` attribute.
+
+        Tip
+        ---
+        Exchanges linked to the flow of the top-level compartment (e.g., ("air",))
+        as their subcompartments are not found are counted in the `fallback` attribute,
+        keyed by the (name, unit, categories) of the exchanges.
+        '''
+        self.unmatched = unmatched = {}
+        self.fallback = fallback = {}
+        found = {} # each distinct flow is only looked up once
+        with profiler.stage('linking'):
+            for ds in data:
+                for exc in ds.get('exchanges', ()):
+                    if exc.get('type') != kind or exc.get('input'):
+                        continue
+                    flow = (exc['name'], exc.get('unit'), tuple(exc.get('categories', ())))
+                    try:
+                        key, top_level = found[flow]
+                    except KeyError:
+                        key, top_level = found[flow] = self._find(*flow, fuzzy=fuzzy)
+                    if key is None:
+                        unmatched[flow] = unmatched.get(flow, 0) + 1
+                    else:
+                        exc['input'] = key
+                        if top_level:
+                            fallback[flow] = fallback.get(flow, 0) + 1
+        if fallback:
+            logger.info(f'{sum(fallback.values())} exchanges of {len(fallback)} flows ' \
+                        'linked to the flows of their top-level compartments.')
+        if unmatched:
+            logger.warning(f'{sum(unmatched.values())} exchanges of {len(unmatched)} flows ' \
+                           f'not found in {self.database}.')
+        return unmatched
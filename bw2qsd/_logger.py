@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+BW2QSD: Bridging Brightway2 and QSD packages for LCA
+
+This module is developed by:
+    Yalin Li <mailto.yalin.li@gmail.com>
+
+This module is under the University of Illinois/NCSA Open Source License.
+Please refer to https://github.com/QSD-Group/BW2QSD/blob/main/LICENSE.txt
+for license details.
+'''
+
+import sys, time, json, logging, threading
+
+__all__ = ('JSONFormatter', 'configure_logging', 'get_logger', 'progress',)
+
+logger = logging.getLogger('bw2qsd')
+
+# Whether to show tqdm progress bars (if tqdm is installed)
+_settings = {'progress_bars': True}
+
+
+class JSONFormatter(logging.Formatter):
+    '''
+    Format log records as one JSON object per line, fields of the event
+    (e.g., progress of a download) are included as top-level keys.
+    '''
+
+    def format(self, record):
+        event = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            }
+        event.update(getattr(record, 'event', None) or {})
+        if record.exc_info:
+            event['exception'] = self.formatException(record.exc_info)
+        return json.dumps(event, default=str)
+
+
+def _root_unconfigured(record):
+    # Only print to the console if the application has not configured the root logger,
+    # otherwise the messages are handled by the root logger's handlers
+    return not logging.getLogger().handlers
+
+
+def configure_logging(level=logging.INFO, json=False, stream=None,
+                      progress_bars=True, propagate=None):
+    '''
+    Configure the output of the "bw2qsd" logger (and its children, e.g., "bw2qsd.eidl").
+
+    By default, messages are printed to the console as plain text,
+    set `json` to True for machine-readable output (one JSON event per line).
+
+    Parameters
+    ----------
+    level : int or str
+        Logging level, e.g., "INFO" or "WARNING".
+    json : bool
+        Whether to format the messages as JSON events.
+    stream : file-like
+        Stream to write the messages to, defaulted to `sys.stdout`.
+    progress_bars : bool
+        Whether to show progress bars through `tqdm` (if installed),
+        progress is logged as messages/events if False or `tqdm` is not installed.
+    propagate : bool
+        Whether to pass the messages to the handlers of the root logger
+        (e.g., the production logging set up by the application),
+        if True, no handler will be added to the "bw2qsd" logger,
+        if False, the messages will only be printed by the "bw2qsd" logger.
+        If None (default, also used when importing BW2QSD), messages are printed
+        only while the root logger has no handlers and are passed to it otherwise.
+    '''
+    for handler in logger.handlers[:]:
+        if getattr(handler, '_bw2qsd', False):
+            logger.removeHandler(handler)
+
+    logger.setLevel(level)
+    logger.propagate = propagate is not False
+    if not propagate:
+        handler = logging.StreamHandler(stream or sys.stdout)
+        handler.setFormatter(JSONFormatter() if json else logging.Formatter('%(message)s'))
+        if propagate is None:
+            handler.addFilter(_root_unconfigured)
+        handler._bw2qsd = True
+        logger.addHandler(handler)
+    _settings['progress_bars'] = progress_bars
+
+
+def get_logger(name=''):
+    '''Return the "bw2qsd" logger or its child logger.'''
+    return logging.getLogger(f'bw2qsd.{name}') if name else logger
+
+
+def log_event(log, event, msg='', level=logging.INFO, **data):
+    '''Log a message with the event name and data attached for JSON output.'''
+    log.log(level, msg or event, extra={'event': {'event': event, **data}})
+
+
+class _Progress:
+    __slots__ = ('desc', 'total', 'unit', 'log', 'interval',
+                 'n', 'start', '_last', '_bar', '_lock')
+
+    def __init__(self, desc, total, unit, log, interval):
+        self.desc = desc
+        self.total = total
+        self.unit = unit
+        self.log = log
+        self.interval = interval
+        self.n = 0
+        self.start = self._last = time.perf_counter()
+        self._lock = threading.Lock()
+        self._bar = None
+        if _settings['progress_bars'] and log.isEnabledFor(logging.INFO):
+            try:
+                from tqdm.auto import tqdm
+                self._bar = tqdm(total=total, desc=desc, unit=unit,
+                                 unit_scale=(unit=='B'), leave=False)
+            except ImportError:
+                pass
+
+    def _event(self, event, msg):
+        elapsed = time.perf_counter() - self.start
+        rate = self.n/elapsed if elapsed else 0.
+        log_event(self.log, event, msg, task=self.desc, n=self.n, total=self.total,
+                  unit=self.unit, elapsed=round(elapsed, 3), rate=round(rate, 3))
+
+    def update(self, n=1):
+        with self._lock:
+            self.n += n
+            if self._bar is not None:
+                self._bar.update(n)
+                return
+            now = time.perf_counter()
+            if now - self._last < self.interval:
+                return
+            self._last = now
+        total = f'/{self.total}' if self.total else ''
+        self._event('progress', f'{self.desc}: {self.n}{total} {self.unit}')
+
+    def close(self):
+        if self._bar is not None:
+            self._bar.close()
+            self._bar = None
+        self._event('progress_end', f'{self.desc}: {self.n} {self.unit} done.')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def progress(iterable=None, total=None, desc='', unit='it', log=None, interval=5.):
+    '''
+    Report the progress of a task through a `tqdm` progress bar (if installed and enabled)
+    or through periodic log messages/JSON events.
+
+    Parameters
+    ----------
+    iterable : iterable
+        If provided, a generator yielding from the iterable and updating the progress
+        will be returned, otherwise an object with `update` and `close` methods
+        (can be used as a context manager).
+    total : int
+        Total number of units, will be inferred from `iterable` if possible.
+    desc : str
+        Description of the task.
+    unit : str
+        Unit of the progress, "B" for bytes.
+    log : :class:`logging.Logger`
+        Logger for the progress messages, defaulted to the "bw2qsd" logger.
+    interval : float
+        Minimum interval (in seconds) between the progress messages
+        when not using `tqdm`.
+    '''
+    if total is None and iterable is not None:
+        try:
+            total = len(iterable)
+        except TypeError:
+            pass
+    bar = _Progress(desc, total, unit, log or logger, interval)
+    if iterable is None:
+        return bar
+
+    def _wrap():
+        with bar:
+            for i in iterable:
+                yield i
+                bar.update()
+    return _wrap()
+
+
+if not logger.handlers:
+    configure_logging()
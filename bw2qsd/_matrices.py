@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+BW2QSD: Bridging Brightway2 and QSD packages for LCA
+
+This module is developed by:
+    Yalin Li <mailto.yalin.li@gmail.com>
+
+This module is under the University of Illinois/NCSA Open Source License.
+Please refer to https://github.com/QSD-Group/BW2QSD/blob/main/LICENSE.txt
+for license details.
+'''
+
+import os, json, uuid, shutil
+import numpy as np
+from scipy import sparse
+from multiprocessing import shared_memory
+from ._cache import _lock_file, _unlock_file
+
+__all__ = ('MatrixSet', 'SharedMatrices', 'publish_matrices', 'load_cached_matrices',)
+
+# Fields of the sparse matrices that are stored as raw arrays
+_sparse_fields = ('data', 'indices', 'indptr')
+# Align arrays in the shared memory block to 64 bytes (cache line)
+_align = 64
+
+
+def _method_vector(method, sorted_ids, sorter, store='Method'):
+    # Factors of the biosphere flows from the processed array of
+    # the method (or the normalization if `store` is "Normalization")
+    import brightway2 as bw2
+    array = np.load(getattr(bw2, store)(method).filepath_processed())
+    flows = array['flow'].astype(np.int64)
+    n = sorted_ids.size
+    if not n:
+        return np.zeros(0)
+    pos = np.clip(np.searchsorted(sorted_ids, flows), 0, n-1)
+    found = sorted_ids[pos] == flows
+    rows = sorter[pos[found]]
+    return np.bincount(rows, weights=array['amount'][found].astype(np.float64), minlength=n)
+
+
+class MatrixSet:
+    '''
+    Processed technosphere and biosphere matrices of a database
+    (and optionally the characterization matrix of some methods),
+    with the row/column dictionaries stored as compact arrays of
+    `bw2data` mapping ids.
+
+    The technosphere matrix is stored as CSC (columns are activities,
+    the format used for factorization) and the biosphere/characterization matrices
+    are stored as CSR, all of them can be backed by shared memory
+    (see :func:`publish_matrices`).
+
+    Parameters
+    ----------
+    database : str
+        Name of the database.
+    technosphere : :class:`scipy.sparse.csc_matrix`
+        Technosphere matrix (products x activities).
+    biosphere : :class:`scipy.sparse.csr_matrix`
+        Biosphere matrix (biosphere flows x activities).
+    activity_ids : :class:`numpy.ndarray`
+        Mapping ids of the activities (columns).
+    product_ids : :class:`numpy.ndarray`
+        Mapping ids of the products (rows of the technosphere matrix).
+    biosphere_ids : :class:`numpy.ndarray`
+        Mapping ids of the biosphere flows (rows of the biosphere matrix).
+    methods : Iterable
+        Methods included in the characterization matrix.
+    characterization : :class:`scipy.sparse.csr_matrix`
+        Characterization matrix (methods x biosphere flows).
+    '''
+
+    __slots__ = ('database', 'technosphere', 'biosphere',
+                 'activity_ids', 'product_ids', 'biosphere_ids',
+                 'methods', 'characterization', '_sorters')
+
+    def __init__(self, database, technosphere, biosphere,
+                 activity_ids, product_ids, biosphere_ids,
+                 methods=(), characterization=None):
+        self.database = database
+        self.technosphere = sparse.csc_matrix(technosphere)
+        self.biosphere = sparse.csr_matrix(biosphere)
+        self.activity_ids = np.asarray(activity_ids, dtype=np.int64)
+        self.product_ids = np.asarray(product_ids, dtype=np.int64)
+        self.biosphere_ids = np.asarray(biosphere_ids, dtype=np.int64)
+        self.methods = [tuple(m) for m in methods]
+        if characterization is None:
+            characterization = sparse.csr_matrix((len(self.methods), self.biosphere_ids.size))
+        self.characterization = sparse.csr_matrix(characterization)
+        self._sorters = {}
+
+    def __repr__(self):
+        shape = self.technosphere.shape
+        return f'<MatrixSet: {self.database}, {shape[0]} products x {shape[1]} activities>'
+
+    @classmethod
+    def from_database(cls, database, methods=()):
+        '''
+        Build the matrices from the processed arrays of the database
+        (and the databases it links to) through `bw2calc`.
+
+        Parameters
+        ----------
+        database : str
+            Name of the database.
+        methods : Iterable
+            Methods to be included in the characterization matrix.
+        '''
+        import brightway2 as bw2
+        act = bw2.Database(database).random()
+        if act is None:
+            raise ValueError(f'Database "{database}" has no activities.')
+        lca = bw2.LCA({act.key: 1})
+        lca.load_lci_data(fix_dictionaries=False)
+
+        def to_array(dct):
+            ids = np.empty(len(dct), dtype=np.int64)
+            ids[list(dct.values())] = list(dct.keys())
+            return ids
+
+        matrices = cls(database, lca.technosphere_matrix, lca.biosphere_matrix,
+                       to_array(lca.activity_dict), to_array(lca.product_dict),
+                       to_array(lca.biosphere_dict))
+        if methods:
+            matrices.add_methods(methods)
+        return matrices
+
+    def sorted_ids(self, kind):
+        '''
+        Return the sorted ids and the sorter (i.e., the positions of the sorted ids
+        in the original array) of "activity", "product", or "biosphere".
+        '''
+        try:
+            return self._sorters[kind]
+        except KeyError:
+            ids = getattr(self, f'{kind}_ids')
+            sorter = np.argsort(ids, kind='stable')
+            self._sorters[kind] = sorted_and_sorter = (ids[sorter], sorter)
+            return sorted_and_sorter
+
+    def index(self, kind, ids):
+        '''
+        Return the positions of the ids in the rows/columns of "activity",
+        "product", or "biosphere", ids that cannot be found will raise a KeyError.
+        '''
+        sorted_ids, sorter = self.sorted_ids(kind)
+        ids = np.asarray(ids, dtype=np.int64)
+        if not sorted_ids.size:
+            raise KeyError(f'No {kind} in {self.database}.')
+        pos = np.clip(np.searchsorted(sorted_ids, ids), 0, sorted_ids.size-1)
+        missing = sorted_ids[pos] != ids
+        if missing.any():
+            raise KeyError(f'{int(missing.sum())} {kind} id(s) not found in {self.database}, ' \
+                           f'e.g., {ids[missing][:5].tolist()}.')
+        return sorter[pos]
+
+    def method_vectors(self, methods):
+        '''
+        Return the characterization factors (methods x biosphere flows) of the methods
+        as a dense array, methods in the characterization matrix will be reused.
+        '''
+        included = {m: n for n, m in enumerate(self.methods)}
+        sorted_ids, sorter = self.sorted_ids('biosphere')
+        vectors = np.zeros((len(methods), self.biosphere_ids.size))
+        for n, method in enumerate(methods):
+            method = tuple(method)
+            if method in included:
+                vectors[n] = self.characterization[included[method]].toarray().ravel()
+            else:
+                vectors[n] = _method_vector(method, sorted_ids, sorter)
+        return vectors
+
+    def normalization_vector(self, normalization):
+        '''
+        Return the normalization factors of the biosphere flows
+        from a Brightway2 normalization (flows not included are 0, as in `bw2calc`).
+        '''
+        sorted_ids, sorter = self.sorted_ids('biosphere')
+        return _method_vector(tuple(normalization), sorted_ids, sorter, store='Normalization')
+
+    def add_methods(self, methods):
+        '''Add the methods to the characterization matrix.'''
+        methods = [m for m in dict.fromkeys(tuple(m) for m in methods) if m not in self.methods]
+        if not methods:
+            return
+        vectors = sparse.csr_matrix(self.method_vectors(methods))
+        self.characterization = sparse.vstack((self.characterization, vectors), format='csr')
+        self.methods.extend(methods)
+
+    # Flat representation shared by the shared memory and file-backed storage
+    def _arrays(self):
+        arrays = {
+            'activity_ids': self.activity_ids,
+            'product_ids': self.product_ids,
+            'biosphere_ids': self.biosphere_ids,
+            }
+        for name in ('technosphere', 'biosphere', 'characterization'):
+            matrix = getattr(self, name)
+            for field in _sparse_fields:
+                arrays[f'{name}_{field}'] = getattr(matrix, field)
+        return arrays
+
+    def _meta(self):
+        return {
+            'database': self.database,
+            'methods': [list(m) for m in self.methods],
+            'shapes': {name: list(getattr(self, name).shape)
+                       for name in ('technosphere', 'biosphere', 'characterization')},
+            }
+
+    @classmethod
+    def _from_arrays(cls, meta, arrays):
+        matrices = {}
+        for name, fmt in (('technosphere', sparse.csc_matrix),
+                          ('biosphere', sparse.csr_matrix),
+                          ('characterization', sparse.csr_matrix)):
+            data, indices, indptr = (arrays[f'{name}_{f}'] for f in _sparse_fields)
+            matrices[name] = fmt((data, indices, indptr),
+                                 shape=tuple(meta['shapes'][name]), copy=False)
+        new = cls.__new__(cls)
+        new.database = meta['database']
+        new.technosphere = matrices['technosphere']
+        new.biosphere = matrices['biosphere']
+        new.characterization = matrices['characterization']
+        new.activity_ids = arrays['activity_ids']
+        new.product_ids = arrays['product_ids']
+        new.biosphere_ids = arrays['biosphere_ids']
+        new.methods = [tuple(m) for m in meta['methods']]
+        new._sorters = {}
+        return new
+
+    def save(self, path, fingerprint=None):
+        '''
+        Save the matrices as uncompressed .npy arrays (and a "meta.json" file)
+        in the directory, so that they can be memory-mapped by :func:`load`.
+
+        Parameters
+        ----------
+        path : str
+            Directory to save the matrices, existing files will be replaced.
+        fingerprint : dict
+            Fingerprint of the processed database, used to check whether
+            the saved matrices are outdated.
+        '''
+        tmp = f'{path.rstrip(os.sep)}.tmp-{uuid.uuid4().hex[:8]}'
+        try:
+            os.makedirs(tmp)
+            for k, array in self._arrays().items():
+                np.save(os.path.join(tmp, f'{k}.npy'), np.ascontiguousarray(array))
+            meta = self._meta()
+            meta['fingerprint'] = fingerprint
+            with open(os.path.join(tmp, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+
+            # Replace the previous files (if any) in one step
+            old = f'{path.rstrip(os.sep)}.old-{uuid.uuid4().hex[:8]}'
+            try:
+                os.replace(path, old)
+            except FileNotFoundError: # not saved before
+                old = None
+            os.replace(tmp, path)
+            if old:
+                shutil.rmtree(old, ignore_errors=True)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True) # only left if failed
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        '''
+        Load the matrices saved through :func:`save`.
+
+        Parameters
+        ----------
+        path : str
+            Directory of the saved matrices.
+        mmap_mode : str
+            Memory-map mode passed to :func:`numpy.load`, the default "r" maps
+            the arrays read-only so that they can be shared by processes
+            through the page cache, use None to read the arrays into memory.
+        '''
+        with open(os.path.join(path, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        arrays = {}
+        for fn in os.listdir(path):
+            if fn.endswith('.npy'):
+                arrays[fn[:-4]] = np.load(os.path.join(path, fn), mmap_mode=mmap_mode)
+        return cls._from_arrays(meta, arrays)
+
+    @classmethod
+    def from_shared_memory(cls, name):
+        '''
+        Attach (read-only) to the matrices published through :func:`publish_matrices`.
+
+        Parameters
+        ----------
+        name : str
+            Name of the published matrices.
+        '''
+        block = _attach(name)
+        size = int(np.frombuffer(block.buf, dtype=np.int64, count=1)[0])
+        meta = json.loads(bytes(block.buf[8:8+size]).decode('utf-8'))
+        arrays = {}
+        for k, (dtype, shape, offset) in meta['arrays'].items():
+            array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf, offset=offset)
+            array.flags.writeable = False
+            arrays[k] = array
+        matrices = cls._from_arrays(meta, arrays)
+        # Keep the block alive as long as the matrices are used
+        _attached[name] = block
+        return matrices
+
+
+class SharedMatrices:
+    '''
+    Handle of the matrices published to shared memory through :func:`publish_matrices`,
+    the shared memory is released when the handle is closed (or unlinked).
+
+    Parameters
+    ----------
+    name : str
+        Name of the shared memory block.
+    block : :class:`multiprocessing.shared_memory.SharedMemory`
+        The shared memory block.
+    matrices : :class:`MatrixSet`
+        The published matrices.
+    '''
+
+    __slots__ = ('name', 'block', 'matrices')
+
+    def __init__(self, name, block, matrices):
+        self.name = name
+        self.block = block
+        self.matrices = matrices
+
+    def __repr__(self):
+        return f'<SharedMatrices: {self.name} ({self.block.size/1e6:.1f} MB)>'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.unlink()
+        return False
+
+    def close(self):
+        '''Close the handle without removing the shared memory block.'''
+        _attached.pop(self.name, None)
+        self.block.close()
+
+    def unlink(self):
+        '''Close the handle and remove the shared memory block.'''
+        self.close()
+        try:
+            # Workers of the same resource tracker (Python < 3.13) may have unregistered it
+            from multiprocessing import resource_tracker
+            resource_tracker.register(self.block._name, 'shared_memory')
+        except Exception:
+            pass
+        try:
+            self.block.unlink()
+        except FileNotFoundError:
+            pass
+
+
+# Shared memory blocks attached by this process
+_attached = {}
+
+def _attach(name):
+    try:
+        return _attached[name]
+    except KeyError:
+        pass
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError: # Python < 3.13
+        block = shared_memory.SharedMemory(name=name)
+        # Otherwise the block will be removed when this (worker) process exits
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(block._name, 'shared_memory')
+        except Exception:
+            pass
+        return block
+
+
+def publish_matrices(matrices, methods=(), name=None):
+    '''
+    Publish the processed matrices of a database to shared memory once,
+    so that multiple :class:`CFgetter` (e.g., in worker processes) can attach
+    to them read-only through `load_database(database, shared=name)`
+    without each keeping a copy of the matrices.
+
+    Parameters
+    ----------
+    matrices : str or :class:`MatrixSet`
+        Name of the database or its processed matrices.
+    methods : Iterable
+        Methods to be included in the shared characterization matrix.
+    name : str
+        Name of the shared memory block, will be randomly generated if not provided.
+
+    Returns
+    -------
+    handle : :class:`SharedMatrices`
+        Handle of the shared memory, the publishing process needs to keep the handle
+        and call its `unlink` method when the workers are done.
+
+    Examples
+    --------
+    >>> from bw2qsd import publish_matrices, CFgetter
+    >>> handle = publish_matrices('ecoinvent_apos371', name='ei_apos371') # doctest: +SKIP
+    >>> # In the worker processes
+    >>> ei = CFgetter('ei') # doctest: +SKIP
+    >>> ei.load_database('ecoinvent_apos371', shared='ei_apos371') # doctest: +SKIP
+    >>> # When all workers are done
+    >>> handle.unlink() # doctest: +SKIP
+    '''
+    if isinstance(matrices, str):
+        matrices = MatrixSet.from_database(matrices, methods=methods)
+    elif methods:
+        matrices.add_methods(methods)
+
+    arrays = matrices._arrays()
+    meta = matrices._meta()
+    # The header (8-byte length + JSON meta with the array offsets) goes first,
+    # grow the room for the header until it fits
+    start = 8
+    while True:
+        offset, entries = start, {}
+        for k, array in arrays.items():
+            offset = -(-offset//_align)*_align
+            entries[k] = (array.dtype.str, list(array.shape), offset)
+            offset += array.nbytes
+        meta['arrays'] = entries
+        header = json.dumps(meta).encode('utf-8')
+        if 8 + len(header) <= start: break
+        start = 8 + len(header)
+
+    name = name or f'bw2qsd_{uuid.uuid4().hex[:16]}'
+    block = shared_memory.SharedMemory(name=name, create=True, size=max(offset, 1))
+    buf = block.buf
+    buf[:8] = np.array([len(header)], dtype=np.int64).tobytes()
+    buf[8:8+len(header)] = header
+    for k, array in arrays.items():
+        dtype, shape, offset = entries[k]
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=buf, offset=offset)
+        view[...] = array
+
+    # Getters in the publishing process attach to the same block
+    _attached[name] = block
+    return SharedMatrices(name, block, matrices)
+
+
+def _fingerprint(database):
+    import brightway2 as bw2
+    names = sorted({database, *bw2.Database(database).find_graph_dependents()})
+    fingerprint = {}
+    for name in names:
+        fp = bw2.Database(name).filepath_processed()
+        stat = os.stat(fp) if os.path.isfile(fp) else None
+        fingerprint[name] = [str(bw2.databases[name].get('processed', '')),
+                             stat.st_size if stat else 0,
+                             stat.st_mtime_ns if stat else 0]
+    return fingerprint
+
+
+def _cache_dir():
+    import appdirs
+    from bw2data import projects
+    return os.path.join(appdirs.user_data_dir(appname='BW2QSD', appauthor='bw2qsd'),
+                        'matrices', projects.current)
+
+
+def load_cached_matrices(database, path='', mmap_mode='r'):
+    '''
+    Load the memory-mapped matrices of the database from the cache,
+    the cache will be (re)built if not found or the database has been
+    processed again since the cache was built.
+
+    Parameters
+    ----------
+    database : str
+        Name of the database.
+    path : str
+        Directory of the cache, will use the user data storage directory
+        (based on :func:`appdirs.user_data_dir`) if not provided.
+    mmap_mode : str
+        Memory-map mode passed to :func:`numpy.load`.
+
+    Tip
+    ---
+    The cache is checked, built, and loaded under a lock file, so that processes
+    starting together build it only once and always load one complete build.
+    '''
+    path = os.path.join(path or _cache_dir(), database)
+    fingerprint = _fingerprint(database)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f'{path}.lock', 'a+') as lock:
+        _lock_file(lock)
+        try:
+            meta_path = os.path.join(path, 'meta.json')
+            if os.path.isfile(meta_path):
+                with open(meta_path, 'r', encoding='utf-8') as f:
+                    fresh = json.load(f).get('fingerprint') == fingerprint
+            else:
+                fresh = False
+            if not fresh:
+                MatrixSet.from_database(database).save(path, fingerprint=fingerprint)
+            # Memory-mapped arrays stay valid even if the files are replaced later
+            return MatrixSet.load(path, mmap_mode=mmap_mode)
+        finally:
+            _unlock_file(lock)
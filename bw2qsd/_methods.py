@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+BW2QSD: Bridging Brightway2 and QSD packages for LCA
+
+This module is developed by:
+    Yalin Li <mailto.yalin.li@gmail.com>
+
+This module is under the University of Illinois/NCSA Open Source License.
+Please refer to https://github.com/QSD-Group/BW2QSD/blob/main/LICENSE.txt
+for license details.
+'''
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from ._logger import get_logger
+from ._profiler import profiler
+
+__all__ = ('validate_methods',)
+
+logger = get_logger('methods')
+
+
+def _check(method):
+    # Return the reason if the method cannot be used, None if it can
+    import brightway2 as bw2
+    if method not in bw2.methods:
+        return 'not registered'
+    try:
+        if not os.path.getsize(bw2.Method(method).filepath_processed()):
+            return 'empty processed data'
+    except OSError:
+        return 'processed data not found'
+    return None
+
+
+def _process(project, method):
+    # Run in the worker processes, which may not have the project set
+    from bw2data import projects, Method
+    if projects.current != project:
+        projects.set_current(project)
+    try:
+        Method(method).process()
+    except Exception as e:
+        return f'reprocessing failed ({type(e).__name__}: {e})'
+    return None
+
+
+def validate_methods(methods, reprocess=False, processes=None):
+    '''
+    Check in one pass that the impact assessment methods are registered and
+    have processed data (i.e., the arrays used in calculating the characterization factors),
+    and optionally reprocess the ones without processed data in parallel.
+
+    Parameters
+    ----------
+    methods : Iterable
+        Keys of the methods.
+    reprocess : bool
+        Whether to reprocess the registered methods without processed data.
+    processes : int
+        Number of processes for reprocessing, defaulted to the number of CPUs,
+        1 to reprocess in the current process.
+
+    Returns
+    -------
+    invalid : dict
+        Reasons why the methods cannot be used, keyed by the methods,
+        empty if all methods are valid.
+    '''
+    with profiler.stage('method validation'):
+        invalid = {}
+        for method in dict.fromkeys(tuple(m) for m in methods):
+            reason = _check(method)
+            if reason is not None:
+                invalid[method] = reason
+
+        missing = [m for m, reason in invalid.items() if reason != 'not registered']
+        if reprocess and missing:
+            from bw2data import projects
+            logger.info(f'Reprocessing {len(missing)} method(s) without processed data.')
+            project = [projects.current] * len(missing)
+            if processes == 1 or len(missing) == 1:
+                errors = list(map(_process, project, missing))
+            else:
+                with ProcessPoolExecutor(max_workers=min(len(missing), processes or os.cpu_count())) \
+                    as executor:
+                    errors = list(executor.map(_process, project, missing))
+            for method, error in zip(missing, errors):
+                reason = error or _check(method)
+                if reason is None:
+                    del invalid[method]
+                else:
+                    invalid[method] = reason
+
+    profiler.count('invalid methods', len(invalid))
+    return invalid
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+BW2QSD: Bridging Brightway2 and QSD packages for LCA
+
+This module is developed by:
+    Yalin Li <mailto.yalin.li@gmail.com>
+
+This module is under the University of Illinois/NCSA Open Source License.
+Please refer to https://github.com/QSD-Group/BW2QSD/blob/main/LICENSE.txt
+for license details.
+'''
+
+import os, atexit, functools, threading, time
+from contextlib import contextmanager, nullcontext
+
+__all__ = ('Profiler', 'ProfileReport', 'profile', 'profiler',)
+
+_ENV_VAR = 'BW2QSD_PROFILE'
+_null = nullcontext()
+
+
+class ProfileReport:
+    '''
+    Timings, counters, and optional cProfile/tracemalloc results
+    collected by :class:`Profiler`.
+
+    Stages are named by their nesting, e.g., "get_CFs/factorization"
+    is the "factorization" stage within :func:`CFgetter.get_CFs`.
+    '''
+
+    __slots__ = ('timings', 'calls', 'counters', 'memory', 'stats')
+
+    def __init__(self):
+        self.timings = {}
+        self.calls = {}
+        self.counters = {}
+        self.memory = {}
+        self.stats = None
+
+    def __repr__(self):
+        return f'<ProfileReport: {len(self.timings)} stages, {len(self.counters)} counters>'
+
+    def to_dict(self):
+        '''Return the report as a dict.'''
+        return {
+            'timings': dict(self.timings),
+            'calls': dict(self.calls),
+            'counters': dict(self.counters),
+            'memory': dict(self.memory),
+            }
+
+    def to_frame(self):
+        '''Return the stage timings as a :class:`pandas.DataFrame`.'''
+        import pandas as pd
+        df = pd.DataFrame({
+            'calls': self.calls,
+            'time [s]': self.timings,
+            'peak memory [MB]': {k: v/1e6 for k, v in self.memory.items()},
+            }, index=list(self.timings.keys()))
+        df.index.name = 'stage'
+        return df
+
+    def show(self, stats=20):
+        '''
+        Print the stage timings, counters, and the top cProfile entries.
+
+        Parameters
+        ----------
+        stats : int
+            Number of cProfile entries (sorted by cumulative time) to print.
+        '''
+        width = max((len(k) for k in self.timings), default=5)
+        lines = [f'{"stage":<{width}}  {"calls":>6}  {"time [s]":>10}']
+        for k, v in self.timings.items():
+            lines.append(f'{k:<{width}}  {self.calls[k]:>6}  {v:>10.4f}')
+        print('\n'.join(lines))
+        if self.counters:
+            print('\n' + '\n'.join(f'{k}: {v}' for k, v in self.counters.items()))
+        if self.stats is not None and stats:
+            self.stats.sort_stats('cumulative').print_stats(stats)
+
+
+class _Stage:
+    __slots__ = ('profiler', 'name', 'path', 'start', 'memory')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        stack = self.profiler._stack
+        stack.append(self.name)
+        self.path = '/'.join(stack)
+        if self.profiler.tracemalloc:
+            import tracemalloc
+            self.memory = tracemalloc.get_traced_memory()[0]
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        dt = time.perf_counter() - self.start
+        report, path = self.profiler.report, self.path
+        with self.profiler._lock:
+            report.timings[path] = report.timings.get(path, 0.) + dt
+            report.calls[path] = report.calls.get(path, 0) + 1
+            if self.profiler.tracemalloc:
+                import tracemalloc
+                peak = tracemalloc.get_traced_memory()[1] - self.memory
+                report.memory[path] = max(report.memory.get(path, 0), peak)
+        self.profiler._stack.pop()
+        return False
+
+
+class Profiler:
+    '''
+    Collect per-stage timings and counters of the BW2QSD hot paths
+    (e.g., :func:`CFgetter.get_CFs`, :func:`DataDownloader.download_ecoinvent`).
+
+    Profiling is disabled by default and can be enabled through the
+    :func:`profile` context manager or the "BW2QSD_PROFILE" environment variable
+    (e.g., "1", or "cprofile,tracemalloc" to also capture cProfile/tracemalloc results).
+    When disabled, all of the instrumentation is a no-op.
+
+    Parameters
+    ----------
+    enabled : bool
+        Whether to collect timings and counters.
+    cprofile : bool
+        Whether to capture :mod:`cProfile` results.
+    tracemalloc : bool
+        Whether to capture peak memory of each stage through :mod:`tracemalloc`.
+    '''
+
+    __slots__ = ('enabled', 'cprofile', 'tracemalloc', 'report',
+                 '_local', '_lock', '_cprofiler')
+
+    def __init__(self, enabled=False, cprofile=False, tracemalloc=False):
+        self.enabled = enabled
+        self.cprofile = cprofile
+        self.tracemalloc = tracemalloc
+        self.report = ProfileReport()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cprofiler = None
+
+    def __repr__(self):
+        status = 'enabled' if self.enabled else 'disabled'
+        return f'<Profiler: {status}>'
+
+    @property
+    def _stack(self):
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = stack = []
+            return stack
+
+    def stage(self, name):
+        '''Context manager to time a stage, no-op if the profiler is disabled.'''
+        return _Stage(self, name) if self.enabled else _null
+
+    def count(self, name, n=1):
+        '''Add `n` to the counter `name`, no-op if the profiler is disabled.'''
+        if self.enabled:
+            with self._lock:
+                counters = self.report.counters
+                counters[name] = counters.get(name, 0) + n
+
+    def start(self):
+        '''Reset the report and start profiling.'''
+        self.report = ProfileReport()
+        self.enabled = True
+        if self.cprofile:
+            import cProfile
+            self._cprofiler = cProfile.Profile()
+            self._cprofiler.enable()
+        if self.tracemalloc:
+            import tracemalloc
+            tracemalloc.start()
+
+    def stop(self):
+        '''Stop profiling and return the report.'''
+        self.enabled = False
+        if self._cprofiler is not None:
+            import pstats
+            self._cprofiler.disable()
+            self.report.stats = pstats.Stats(self._cprofiler)
+            self._cprofiler = None
+        if self.tracemalloc:
+            import tracemalloc
+            tracemalloc.stop()
+        return self.report
+
+
+def _parse_env(value):
+    options = {i.strip().lower() for i in value.split(',') if i.strip()}
+    if not options or options & {'0', 'false', 'no', 'off'}:
+        return None
+    full = 'all' in options
+    return {'cprofile': full or 'cprofile' in options,
+            'tracemalloc': full or 'tracemalloc' in options}
+
+profiler = Profiler()
+
+_env_options = _parse_env(os.environ.get(_ENV_VAR, ''))
+if _env_options is not None:
+    profiler.cprofile = _env_options['cprofile']
+    profiler.tracemalloc = _env_options['tracemalloc']
+    profiler.start()
+    atexit.register(lambda: profiler.stop().show())
+
+
+@contextmanager
+def profile(cprofile=False, tracemalloc=False):
+    '''
+    Context manager to profile the BW2QSD calls within it.
+
+    Parameters
+    ----------
+    cprofile : bool
+        Whether to capture :mod:`cProfile` results.
+    tracemalloc : bool
+        Whether to capture peak memory of each stage through :mod:`tracemalloc`.
+
+    Examples
+    --------
+    >>> from bw2qsd import profile
+    >>> with profile() as report: # doctest: +SKIP
+    ...     df = getter.get_CFs()
+    >>> report.show() # doctest: +SKIP
+    '''
+    previous = (profiler.enabled, profiler.cprofile, profiler.tracemalloc, profiler.report)
+    if previous[0]:
+        profiler.stop()
+    profiler.cprofile, profiler.tracemalloc = cprofile, tracemalloc
+    profiler.start()
+    try:
+        yield profiler.report
+    finally:
+        profiler.stop()
+        enabled, profiler.cprofile, profiler.tracemalloc, report = previous
+        if enabled: # resume the previous (e.g., environment variable) session
+            profiler.enabled = True
+            profiler.report = report
+
+
+def profiled(name):
+    '''Decorator to time a function as a stage.'''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            with profiler.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+BW2QSD: Bridging Brightway2 and QSD packages for LCA
+
+This module is developed by:
+    Yalin Li <mailto.yalin.li@gmail.com>
+
+This module is under the University of Illinois/NCSA Open Source License.
+Please refer to https://github.com/QSD-Group/BW2QSD/blob/main/LICENSE.txt
+for license details.
+'''
+
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from ._logger import get_logger, log_event
+from ._profiler import profiler
+
+__all__ = ('Source', 'register_source', 'available_sources', 'import_sources',)
+
+logger = get_logger('sources')
+
+_registry = {}
+
+
+class Source:
+    '''
+    Base class of the data sources of databases, a source declares the stages of
+    its import, each stage takes the output of the previous stage:
+
+        [1] `fetch`: download the raw data (I/O-bound, run in a thread).
+
+        [2] `extract`: extract the downloaded archive (I/O-bound, run in a thread).
+
+        [3] `parse`: parse the extracted data into datasets (CPU-bound,
+        run in a process if `parse_in_process` is True, otherwise in a thread).
+
+        [4] `write`: write the datasets to the project (run in the main thread).
+
+    Register the subclass through :func:`register_source` to use it by its name.
+
+    Parameters
+    ----------
+    path : str
+        Directory for the downloaded and extracted files,
+        will use the user data storage directory if not provided.
+    '''
+
+    #: [str] Name of the source in the registry.
+    name = ''
+    #: [str] Name of the database written by the source.
+    database = ''
+    #: [bool] Whether to parse in a process instead of a thread.
+    parse_in_process = False
+
+    def __init__(self, path=''):
+        from ._db_downloader import _make_dir
+        self.path = _make_dir(path, self.name) if not path else path
+
+    def __repr__(self):
+        return f'<{type(self).__name__}: {self.database}>'
+
+    def exists(self):
+        '''Whether the database has already been written to the project.'''
+        from bw2data import databases
+        return self.database in databases
+
+    def fetch(self):
+        '''Download the raw data, return the path of the downloaded file.'''
+        return None
+
+    def extract(self, fetched):
+        '''Extract the downloaded file, return the path of the extracted data.'''
+        return fetched
+
+    def parse(self, extracted):
+        '''Parse the extracted data, the return has to be picklable if parsed in a process.'''
+        return extracted
+
+    def write(self, parsed):
+        '''Write the parsed data to the project.'''
+        raise NotImplementedError(f'`write` not implemented for {type(self).__name__}.')
+
+
+def register_source(cls):
+    '''Register a :class:`Source` subclass by its name (can be used as a decorator).'''
+    if not (isinstance(cls, type) and issubclass(cls, Source)):
+        raise TypeError(f'Only subclasses of `Source` can be registered, not {cls}.')
+    if not cls.name:
+        raise ValueError(f'The `name` of {cls.__name__} is not set.')
+    _registry[cls.name.lower()] = cls
+    return cls
+
+
+def available_sources():
+    '''Return the names of the registered sources.'''
+    return tuple(_registry.keys())
+
+
+def _get_source(source, **kwargs):
+    if isinstance(source, Source):
+        return source
+    try:
+        return _registry[source.lower()](**kwargs)
+    except KeyError:
+        raise ValueError(f'Source "{source}" not registered, ' \
+                         f'available ones are {available_sources()}.') from None
+
+
+def _fetch_and_extract(source):
+    with profiler.stage(f'{source.name}/fetch'):
+        fetched = source.fetch()
+    with profiler.stage(f'{source.name}/extract'):
+        return source.extract(fetched)
+
+
+def import_sources(sources, threads=None, processes=None, skip_existing=True):
+    '''
+    Import the databases of multiple sources concurrently.
+
+    Fetching and extraction of all sources run in a thread pool, parsing runs in
+    a process pool (or the thread pool, depending on `parse_in_process` of the source)
+    as soon as the extraction of the source is done, and the parsed data are written
+    in the main thread one source at a time (as the SQLite backend only has one writer),
+    so the total time is roughly that of the slowest source.
+
+    Parameters
+    ----------
+    sources : Iterable
+        :class:`Source` objects or the names of the registered sources.
+    threads : int
+        Maximum number of threads, defaulted to the number of sources.
+    processes : int
+        Maximum number of processes for parsing, defaulted to the number of CPUs.
+    skip_existing : bool
+        Whether to skip the sources whose databases already exist in the project.
+
+    Returns
+    -------
+    databases : list
+        Names of the written databases.
+    '''
+    sources = [_get_source(s) for s in sources]
+    if skip_existing:
+        for source in [s for s in sources if s.exists()]:
+            logger.info(f'Database "{source.database}" already exists, skipped.')
+            sources.remove(source)
+    if not sources:
+        return []
+
+    written, failed = [], {}
+    n_proc = sum(s.parse_in_process for s in sources)
+    process_pool = ProcessPoolExecutor(max_workers=min(n_proc, processes or os.cpu_count())) \
+        if n_proc else None
+    try:
+        _schedule(sources, threads, process_pool, written, failed)
+    finally:
+        if process_pool is not None:
+            process_pool.shutdown()
+
+    if failed:
+        raise RuntimeError(f'Failed to import source(s) {list(failed)}, ' \
+                           f'database(s) {written} have been imported.') from next(iter(failed.values()))
+    return written
+
+
+def _schedule(sources, threads, process_pool, written, failed):
+    with ThreadPoolExecutor(max_workers=threads or len(sources)) as thread_pool:
+        pending = {thread_pool.submit(_fetch_and_extract, s): (s, 'extract') for s in sources}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                source, stage = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.exception(f'Failed to {stage} source "{source.name}".')
+                    failed[source.name] = e
+                    continue
+                if stage == 'extract':
+                    pool = process_pool if source.parse_in_process else thread_pool
+                    pending[pool.submit(source.parse, result)] = (source, 'parse')
+                else:
+                    try:
+                        with profiler.stage(f'{source.name}/write'):
+                            source.write(result)
+                    except Exception as e:
+                        logger.exception(f'Failed to write source "{source.name}".')
+                        failed[source.name] = e
+                        continue
+                    written.append(source.database)
+                    log_event(logger, 'database_imported',
+                              f'Successfully imported {source.name} database as "{source.database}".',
+                              database=source.database)
+
+
+@register_source
+class ForwastSource(Source):
+    '''
+    `FORWAST <https://lca-net.com/projects/show/forwast/>`_ database.
+
+    Parameters
+    ----------
+    path : str
+        Directory for the downloaded and extracted files.
+    url : str
+        FORWAST database downloading url.
+    '''
+
+    name = 'forwast'
+    database = 'forwast'
+    parse_in_process = True
+
+    def __init__(self, path='', url='http://lca-net.com/wp-content/uploads/forwast.bw2package.zip'):
+        super().__init__(path)
+        self.url = url
+
+    #: [str] Name of the package in the download cache.
+    cache_name = 'forwast.bw2package.zip'
+
+    def fetch(self):
+        from ._cache import download_cache
+        from ._db_downloader import _download
+        if os.path.exists(os.path.join(self.path, 'forwast.bw2package')):
+            logger.info(f'Using previously extracted FORWAST package in directory "{self.path}".')
+            return None
+        fp = download_cache.get(self.cache_name)
+        if fp is not None:
+            logger.info(f'Using previously downloaded FORWAST package "{fp}".')
+        else:
+            fp = os.path.join(self.path, 'forwast.package.zip')
+            _download(self.url, fp, desc='Downloading FORWAST')
+            fp = download_cache.put(self.cache_name, fp)
+        return fp
+
+    def extract(self, fetched):
+        from ._db_downloader import _extract_zip
+        fp = os.path.join(self.path, 'forwast.bw2package')
+        if not os.path.exists(fp):
+            _extract_zip(fetched, self.path, desc='Extracting FORWAST')
+        return fp
+
+    def parse(self, extracted):
+        from bw2io import BW2Package
+        return BW2Package.load_file(extracted)
+
+    def write(self, parsed):
+        from bw2io import BW2Package
+        for obj in (parsed if isinstance(parsed, list) else [parsed]):
+            BW2Package._create_obj(obj)
+
+
+@register_source
+class EcoinventSource(Source):
+    '''
+    `ecoinvent <https://www.ecoinvent.org/>`_ database (license and login credentials required),
+    you will be prompted for the credentials, version, and system model if not provided.
+
+    Parameters
+    ----------
+    path : str
+        Directory for the downloaded and extracted files.
+    username : str
+        ecoinvent username.
+    password : str
+        ecoinvent password.
+    version : str
+        ecoinvent version, e.g., "3.8".
+    system_model : str
+        System model, e.g., "cutoff".
+
+    See Also
+    --------
+    :func:`DataDownloader.download_ecoinvent`
+    '''
+
+    name = 'ecoinvent'
+
+    def __init__(self, path='', username=None, password=None, version=None, system_model=None):
+        super().__init__(path)
+        from . import eidl
+        self.downloader = eidl.EcoinventDownloader(
+            username=username, password=password, version=version,
+            system_model=system_model, outdir=self.path)
+
+    @property
+    def database(self):
+        '''[str] Name of the database, known once the version and system model are set.'''
+        if self.downloader.version is None or self.downloader.system_model is None:
+            return ''
+        return 'ecoinvent_' + self.downloader.file_name.replace('.7z', '')
+
+    def fetch(self):
+        self.downloader.run()
+        return self.downloader.out_path
+
+    def extract(self, fetched):
+        import shutil
+        from ._db_downloader import _extract_7z
+        extracted_path = os.path.join(self.path, self.database.replace('ecoinvent_', '', 1))
+        shutil.rmtree(extracted_path, ignore_errors=True)
+        _extract_7z(fetched, extracted_path)
+        return os.path.join(extracted_path, 'datasets')
+
+    def parse(self, extracted):
+        # The extractor already parses the datasets with multiple processes
+        from bw2io import importers
+        from ._db_downloader import _Ecospold2Extractor
+        importer = importers.SingleOutputEcospold2Importer(
+            extracted, self.database, extractor=_Ecospold2Extractor)
+        importer.apply_strategies()
+        return importer
+
+    def write(self, parsed):
+        from ._db_downloader import DataDownloader
+        DataDownloader.inspect(parsed, self.database)
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+BW2QSD: Bridging Brightway2 and QSD packages for LCA
+
+This module is developed by:
+    Yalin Li <mailto.yalin.li@gmail.com>
+
+This module is under the University of Illinois/NCSA Open Source License.
+Please refer to https://github.com/QSD-Group/BW2QSD/blob/main/LICENSE.txt
+for license details.
+'''
+
+import pickle
+from ._logger import get_logger, progress
+from ._profiler import profiler
+
+__all__ = ('bulk_write',)
+
+logger = get_logger('writer')
+
+# Pragmas for the bulk insertion, the original values are restored afterwards
+# (`journal_mode` persists in the database file otherwise)
+_pragmas = {
+    'journal_mode': 'wal',
+    'synchronous': 'off',
+    'temp_store': 'memory',
+    'cache_size': -256000, # in KiB
+    }
+
+
+def _activity_rows(data, exchanges):
+    from bw2data.backends.peewee.utils import dict_as_activitydataset
+    for ds in data:
+        exchanges[0] += len(ds.get('exchanges', ()))
+        row = dict_as_activitydataset({k: v for k, v in ds.items() if k != 'exchanges'})
+        yield (pickle.dumps(row['data'], protocol=4), row['code'], row['database'],
+               row['location'], row['name'], row['product'], row['type'])
+
+
+def _exchange_rows(data):
+    from bw2data.errors import InvalidExchange, UntypedExchange
+    from bw2data.backends.peewee.utils import dict_as_exchangedataset
+    for ds in data:
+        key = (ds['database'], ds['code'])
+        for exc in ds.get('exchanges', ()):
+            if 'input' not in exc or 'amount' not in exc:
+                raise InvalidExchange(f'Exchange {exc} of {key} has no input or amount.')
+            if 'type' not in exc:
+                raise UntypedExchange(f'Exchange {exc} of {key} has no type.')
+            exc['output'] = key
+            row = dict_as_exchangedataset(exc)
+            yield (pickle.dumps(row['data'], protocol=4), row['input_code'], row['input_database'],
+                   row['output_code'], row['output_database'], row['type'])
+
+
+def _insert(cursor, table, columns, rows, batch_size, bar):
+    sql = f'INSERT INTO "{table}" ({", ".join(columns)}) ' \
+          f'VALUES ({", ".join("?"*len(columns))})'
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            cursor.executemany(sql, batch)
+            bar.update(len(batch))
+            batch = []
+    if batch:
+        cursor.executemany(sql, batch)
+        bar.update(len(batch))
+
+
+def bulk_write(data, db_name, process=True, batch_size=50000, **metadata):
+    '''
+    Write datasets (e.g., the `data` of a `bw2io` importer after applying strategies)
+    to the SQLite backend of `Brightway2` as a new or replaced database.
+
+    This is the same as :func:`importer.write_database` in `bw2io`, but
+    rows are inserted through `executemany` in one transaction
+    (with WAL journal and without syncing), indices are only added after
+    all rows are inserted, and the matrices are processed once at the end.
+
+    Parameters
+    ----------
+    data : Iterable
+        Datasets (dict) of the database, exchanges should all be linked.
+    db_name : str
+        Name of the database, all datasets should be of this database.
+    process : bool
+        Whether to process the database (i.e., build the matrices) after writing.
+    batch_size : int
+        Number of rows inserted by each `executemany` call.
+    metadata : kwargs
+        Metadata of the database (e.g., `format`) to be registered.
+
+    Returns
+    -------
+    db : :class:`bw2data.Database`
+        The written database.
+    '''
+    from bw2data import Database, databases, mapping, geomapping
+    from bw2data.errors import WrongDatabase
+    from bw2data.backends.peewee import ActivityDataset as AD, ExchangeDataset as ED, sqlite3_lci_db
+
+    data = list(data.values()) if isinstance(data, dict) else list(data)
+    wrong = {ds['database'] for ds in data}.difference({db_name})
+    if wrong:
+        raise WrongDatabase(f'Datasets of database(s) {sorted(wrong)} ' \
+                            f'cannot be written to "{db_name}".')
+
+    db = Database(db_name)
+    if db_name not in databases:
+        db.register(**metadata)
+    elif metadata:
+        databases[db_name].update(metadata)
+    mapping.add([(ds['database'], ds['code']) for ds in data])
+    geomapping.add({ds['location'] for ds in data if ds.get('location')})
+
+    sql_db = sqlite3_lci_db.db
+    original = {k: sql_db.execute_sql(f'PRAGMA {k}').fetchone()[0] for k in _pragmas}
+    for k, v in _pragmas.items():
+        sql_db.execute_sql(f'PRAGMA {k}={v}')
+
+    a_cols = ('data', 'code', 'database', 'location', 'name', 'product', 'type')
+    e_cols = ('data', 'input_code', 'input_database', 'output_code', 'output_database', 'type')
+    exchanges = [0]
+    db._drop_indices()
+    try:
+        with profiler.stage('bulk writing'), sql_db.atomic():
+            sql_db.execute_sql(f'DELETE FROM "{ED._meta.table_name}" WHERE output_database = ?', (db_name,))
+            sql_db.execute_sql(f'DELETE FROM "{AD._meta.table_name}" WHERE database = ?', (db_name,))
+            cursor = sql_db.cursor()
+            with progress(total=len(data), desc=f'Writing {db_name} activities',
+                          unit='activities', log=logger) as bar:
+                _insert(cursor, AD._meta.table_name, a_cols,
+                        _activity_rows(data, exchanges), batch_size, bar)
+            with progress(total=exchanges[0], desc=f'Writing {db_name} exchanges',
+                          unit='exchanges', log=logger) as bar:
+                _insert(cursor, ED._meta.table_name, e_cols,
+                        _exchange_rows(data), batch_size, bar)
+    finally:
+        with profiler.stage('indexing'):
+            db._add_indices()
+        for k, v in original.items():
+            sql_db.execute_sql(f'PRAGMA {k}={v}')
+
+    profiler.count('activities written', len(data))
+    profiler.count('exchanges written', exchanges[0])
+    databases[db_name]['number'] = len(data)
+    databases.set_modified(db_name)
+
+    with profiler.stage('search indexing'):
+        db.make_searchable(reset=True)
+    if process:
+        with profiler.stage('processing'):
+            db.process()
+
+    logger.info(f'Wrote {len(data)} activities and {exchanges[0]} exchanges ' \
+                f'to database "{db_name}".')
+    return db
@@ -25,6 +25,6 @@ This module is under dual licenses:
 '''
 
 from .storage import eidlstorage
-from .core import EcoinventDownloader, get_ecoinvent
+from .core import EcoinventDownloader, get_ecoinvent, get_session, clear_session_cache
 
-__all__ = ['EcoinventDownloader', 'get_ecoinvent', 'eidlstorage']
\ No newline at end of file
+__all__ = ['EcoinventDownloader', 'get_ecoinvent', 'get_session', 'clear_session_cache', 'eidlstorage']
\ No newline at end of file
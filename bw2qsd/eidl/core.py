@@ -25,46 +25,115 @@ This module is under dual licenses:
 '''
 
 import os
+import time
 import string
 import tempfile
 import getpass
 import subprocess
+import threading
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bw2io import SingleOutputEcospold2Importer, bw2setup
 from bw2data import projects, databases
 
 from .storage import eidlstorage
+from .._logger import get_logger, progress
+
+logger = get_logger('eidl')
+
+# Base URLs of the ecoinvent login and API servers,
+# can be pointed to other (e.g., local stand-in) servers through the environment variables
+SSO_URL = os.environ.get('BW2QSD_ECOINVENT_SSO_URL',
+                         'https://sso.ecoinvent.org/realms/ecoinvent/protocol/openid-connect/token')
+API_URL = os.environ.get('BW2QSD_ECOINVENT_API_URL', 'https://api.ecoquery.ecoinvent.org')
+
+# Seconds before the expiry at which tokens are considered expired
+_EXPIRY_MARGIN = 30
+
+_session = None
+_session_lock = threading.Lock()
+
+# Tokens (by login URL and username) and file listings (by API URL and username)
+# shared by all downloaders until the tokens expire
+_tokens = {}
+_listings = {}
+
+
+def get_session(retries=5, backoff_factor=0.5, pool_maxsize=10):
+    '''
+    Return the shared :class:`requests.Session` for the ecoinvent servers,
+    connections are pooled and failed requests (connection errors,
+    429 and 5xx responses) are retried with exponential backoff.
+    '''
+    global _session
+    with _session_lock:
+        if _session is None:
+            kwargs = dict(total=retries, backoff_factor=backoff_factor,
+                          status_forcelist=(429, 500, 502, 503, 504),
+                          raise_on_status=False)
+            try:
+                retry = Retry(allowed_methods=frozenset(('GET', 'POST')), **kwargs)
+            except TypeError: # urllib3 < 1.26
+                retry = Retry(method_whitelist=frozenset(('GET', 'POST')), **kwargs)
+            adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_maxsize,
+                                  pool_maxsize=pool_maxsize)
+            _session = requests.Session()
+            _session.mount('https://', adapter)
+            _session.mount('http://', adapter)
+        return _session
+
+
+def clear_session_cache():
+    '''Close the shared session and forget the cached tokens and file listings.'''
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+    _tokens.clear()
+    _listings.clear()
 
 
 class EcoinventDownloader:
     def __init__(self, username=None, password=None, version=None,
-                 system_model=None, outdir=None, **kwargs):
+                 system_model=None, outdir=None, cache=True,
+                 sso_url=None, api_url=None, session=None, **kwargs):
         self.username = username
         self.password = password
         self.version = version
         self.system_model = system_model
         self.outdir = outdir
+        self.cache = cache
+        self.sso_url = sso_url or SSO_URL
+        self.api_url = (api_url or API_URL).rstrip('/')
+        self.session = session or get_session()
         self.access_token = None
         self.refresh_token = None
+        self.access_expiry = self.refresh_expiry = 0.
 
     def run(self):
         if self.check_stored():
             return
-        if self.username is None or self.password is None:
-            self.username, self.password = self.get_credentials()
-        print('logging in to ecoinvent homepage...')
-        self.login()
+        if not self.use_cached_tokens():
+            if self.username is None or self.password is None:
+                self.username, self.password = self.get_credentials()
+            logger.info('logging in to ecoinvent homepage...')
+            self.login()
         self.db_dict = self.get_available_files()
-        print('login successful!')
+        logger.info('login successful!')
         if (self.version, self.system_model) not in self.db_dict.keys():
             self.version, self.system_model = self.choose_db()
         if self.check_stored():
             return
 
-        print('downloading {} {} ...'.format(self.system_model, self.version))
+        logger.info('downloading {} {} ...'.format(self.system_model, self.version))
         self.download()
-        print('download finished!: {}\n'.format(self.out_path))
+        if self.cache:
+            self.out_path = eidlstorage.store(
+                self.out_path, version='{} {}'.format(self.version, self.system_model))
+        logger.info('download finished!: {}'.format(self.out_path))
 
     @property
     def file_name(self):
@@ -72,9 +141,10 @@ class EcoinventDownloader:
         return fn
 
     def check_stored(self):
-        if self.file_name in eidlstorage.stored_dbs:
-            self.out_path = eidlstorage.stored_dbs[self.file_name]
-            print('database already downloaded')
+        path = eidlstorage.get(self.file_name)
+        if path is not None:
+            self.out_path = path
+            logger.info('database already downloaded')
             return True
         else:
             return False
@@ -84,52 +154,77 @@ class EcoinventDownloader:
         pw = getpass.getpass('ecoinvent password: ')
         return un, pw
 
+    def use_cached_tokens(self):
+        '''Use the unexpired tokens of a previous login (of the same user, if given).'''
+        now = time.monotonic()
+        for (url, username), tokens in _tokens.items():
+            if url == self.sso_url and self.username in (None, username) \
+                    and tokens['refresh_expiry'] > now:
+                self.username = username
+                self._set_tokens(tokens)
+                return True
+        return False
+
+    def _set_tokens(self, tokens):
+        self.access_token = tokens['access_token']
+        self.refresh_token = tokens['refresh_token']
+        self.access_expiry = tokens['access_expiry']
+        self.refresh_expiry = tokens['refresh_expiry']
+        _tokens[(self.sso_url, self.username)] = tokens
+
+    def _post_tokens(self, post_data):
+        response = self.session.post(self.sso_url, post_data, timeout=20)
+        if response.ok:
+            tokens = json.loads(response.text)
+            now = time.monotonic()
+            # Tokens without expiry information are only used for the current call
+            tokens['access_expiry'] = now + tokens.get('expires_in', 0) - _EXPIRY_MARGIN
+            tokens['refresh_expiry'] = now + tokens.get('refresh_expires_in', 0) - _EXPIRY_MARGIN
+            self._set_tokens(tokens)
+        return response
+
     def login(self):
-        sso_url='https://sso.ecoinvent.org/realms/ecoinvent/protocol/openid-connect/token'
         post_data = {'username': self.username,
                      'password': self.password,
                      'client_id': 'apollo-ui',
                      'grant_type': 'password'}
         try:
-            response = requests.post(sso_url, post_data, timeout=20)
+            response = self._post_tokens(post_data)
         except (requests.ConnectTimeout, requests.ReadTimeout, requests.ConnectionError) as e:
             self.handle_connection_timeout()
             raise e
 
-        if response.ok:
-            tokens = json.loads(response.text)
-            self.access_token = tokens['access_token']
-            self.refresh_token = tokens['refresh_token']
-
         self.login_success(response.ok)
         
     def refresh_tokens(self):
+        '''Refresh the access token if expired, login again if the refresh token is also expired.'''
         if self.refresh_token is None:
             return
+        now = time.monotonic()
+        if self.access_expiry > now:
+            return
 
-        sso_url='https://sso.ecoinvent.org/realms/ecoinvent/protocol/openid-connect/token'
-        post_data = {'client_id': 'apollo-ui',
-                     'grant_type': 'refresh_token',
-                     'refresh_token': self.refresh_token}
-        response = requests.post(sso_url, post_data, timeout=20)
-
-        if response.ok:
-            tokens = json.loads(response.text)
-            self.access_token = tokens['access_token']
-            self.refresh_token = tokens['refresh_token']
-        else:
-            self.login()
+        if self.refresh_expiry > now:
+            post_data = {'client_id': 'apollo-ui',
+                         'grant_type': 'refresh_token',
+                         'refresh_token': self.refresh_token}
+            if self._post_tokens(post_data).ok:
+                return
+        _tokens.pop((self.sso_url, self.username), None)
+        if self.password is None:
+            self.username, self.password = self.get_credentials()
+        self.login()
 
     def login_success(self, success):
         if not success:
-            print('Login failed')
+            logger.warning('Login failed')
             self.username, self.password = self.get_credentials()
             self.login()
 
     def handle_connection_timeout(self):
-        print('The request timed out, please check your internet connection!')
+        logger.error('The request timed out, please check your internet connection!')
         if eidlstorage.stored_dbs:
-            print(
+            logger.info(
                 'You have the following databases stored:\n\t{}\n'.format(
                     '\n\t'.join(eidlstorage.stored_dbs.keys())) +
                 'You can use these offline by adding the corresponding `version` and `system_model` keywords\n' +
@@ -137,11 +232,16 @@ class EcoinventDownloader:
             )
 
     def get_available_files(self):
-        files_url = 'https://api.ecoquery.ecoinvent.org/files'
+        # File listings are cached until the access token expires
+        cached = _listings.get((self.api_url, self.username))
+        if cached is not None and cached[1] > time.monotonic():
+            return cached[0]
+
+        files_url = f'{self.api_url}/files'
         self.refresh_tokens()
         auth_header = {'Authorization': f'Bearer {self.access_token}'}
         try:
-            files_res = requests.get(files_url, headers=auth_header, timeout=20)
+            files_res = self.session.get(files_url, headers=auth_header, timeout=20)
         except (requests.ConnectTimeout, requests.ReadTimeout, requests.ConnectionError) as e:
             self.handle_connection_timeout()
             raise e
@@ -159,6 +259,7 @@ class EcoinventDownloader:
         db_dict = {
             tuple(k.replace('ecoinvent ', '').split('_')[:2:]): v for k, v in link_dict.items()
         }
+        _listings[(self.api_url, self.username)] = (db_dict, self.access_expiry)
         return db_dict
 
     def choose_db(self):
@@ -191,23 +292,27 @@ class EcoinventDownloader:
 
     def download(self):
         db_key = (self.version, self.system_model)
-        url = f'https://api.ecoquery.ecoinvent.org/files/r/{self.db_dict[db_key]}'
+        url = f'{self.api_url}/files/r/{self.db_dict[db_key]}'
         self.refresh_tokens()
         auth_header = {'Authorization': f'Bearer {self.access_token}'}
-        try:
-            s3_link = json.loads(requests.get(url, headers=auth_header, timeout=20).text)
-            file_content = requests.get(s3_link['download_url'], timeout=60).content
-        except (requests.ConnectTimeout, requests.ReadTimeout, requests.ConnectionError) as e:
-            self.handle_connection_timeout()
-            raise e
-
         if self.outdir:
             self.out_path = os.path.join(self.outdir, self.file_name)
         else:
             self.out_path = os.path.join(os.path.abspath('.'), self.file_name)
 
-        with open(self.out_path, 'wb') as out_file:
-            out_file.write(file_content)
+        try:
+            s3_link = json.loads(self.session.get(url, headers=auth_header, timeout=20).text)
+            response = self.session.get(s3_link['download_url'], timeout=60, stream=True)
+            response.raise_for_status()
+            total = int(response.headers.get('content-length', 0)) or None
+            with open(self.out_path, 'wb') as out_file, \
+                progress(total=total, desc=f'Downloading {self.file_name}', unit='B', log=logger) as bar:
+                for chunk in response.iter_content(chunk_size=1024*1024):
+                    out_file.write(chunk)
+                    bar.update(len(chunk))
+        except (requests.ConnectTimeout, requests.ReadTimeout, requests.ConnectionError) as e:
+            self.handle_connection_timeout()
+            raise e
 
     def extract(self, target_dir, **kwargs):
         extract_cmd = ['py7zr', 'x', self.out_path, target_dir]
@@ -216,10 +321,10 @@ class EcoinventDownloader:
             return self.extraction_process.wait()
         except FileNotFoundError as e:
             if "PYCHARM_HOSTED" in os.environ:
-                print('It appears the EcoInventDownLoader is run from PyCharm. ' +
-                      'Please make sure you select the the correct conda environment ' +
-                      'as your project interperter or run your script/command in a ' +
-                      'Python console outside of PyCharm.')
+                logger.error('It appears the EcoInventDownLoader is run from PyCharm. ' +
+                             'Please make sure you select the the correct conda environment ' +
+                             'as your project interperter or run your script/command in a ' +
+                             'Python console outside of PyCharm.')
             raise e
 
 
@@ -244,7 +349,7 @@ def get_ecoinvent(db_name=None, auto_write=False, download_path=None, store_down
             else:
                 download_path = td
 
-        downloader = EcoinventDownloader(outdir=download_path, **kwargs)
+        downloader = EcoinventDownloader(outdir=download_path, cache=store_download, **kwargs)
         downloader.run()
         downloader.extract(target_dir=td)
 
@@ -269,7 +374,7 @@ def get_ecoinvent(db_name=None, auto_write=False, download_path=None, store_down
     datasets, exchanges, unlinked = importer.statistics()
 
     if auto_write and not unlinked:
-        print('\nWriting database {} in project {}'.format(
+        logger.info('Writing database {} in project {}'.format(
             db_name, projects.current))
         importer.write_database()
     else:
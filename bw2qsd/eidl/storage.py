@@ -29,8 +29,12 @@ import glob
 
 import appdirs
 
+from .._cache import download_cache
+
 
 class EidlStorage():
+    '''Downloaded ecoinvent archives, tracked by the BW2QSD download cache.'''
+
     def __init__(self):
         self.eidl_dir = appdirs.user_data_dir(
             appname='EcoInventDownLoader',
@@ -39,16 +43,38 @@ class EidlStorage():
 
         if not os.path.isdir(self.eidl_dir):
             os.makedirs(self.eidl_dir)
+        self._adopted = False
+
+    def _adopt(self):
+        # Track the archives downloaded before the cache was used (only checked once)
+        if self._adopted:
+            return
+        for p in glob.glob(os.path.join(self.eidl_dir, '*.7z')):
+            name = os.path.split(p)[1]
+            if name not in download_cache:
+                download_cache.put(name, p, move=False)
+        self._adopted = True
 
     @property
     def stored_dbs(self):
-        paths = glob.glob(os.path.join(self.eidl_dir, '*.7z'))
-        db_dict = {os.path.split(p)[1]: p for p in paths}
-        return db_dict
+        self._adopt()
+        return {name: path for name, path in download_cache.items() if name.endswith('.7z')}
+
+    def get(self, name):
+        '''Return the path of the stored archive, None if not stored.'''
+        self._adopt()
+        return download_cache.get(name)
+
+    def store(self, fp, version=''):
+        '''Move the downloaded archive into the cache and return its cached path.'''
+        return download_cache.put(os.path.split(fp)[1], fp, version=version)
+
+    def remove(self, name):
+        download_cache.remove(name)
 
     def clear_stored_dbs(self):
-        for db in self.stored_dbs.values():
-            os.remove(db)
+        for name in self.stored_dbs:
+            download_cache.remove(name)
 
 
-eidlstorage = EidlStorage()
\ No newline at end of file
+eidlstorage = EidlStorage()
@@ -12,10 +12,13 @@ Please refer to https://github.com/QSD-Group/BW2QSD/blob/main/LICENSE.txt
 for license details.
 '''
 
-__all__ = ('remove_setups_pickle', 'export_df','format_name',)
+__all__ = ('remove_setups_pickle', 'export_df', 'read_npz', 'format_name',)
 
-import os
+import os, json
 from warnings import warn
+from ._logger import get_logger
+
+logger = get_logger()
 
 def remove_setups_pickle():
     '''
@@ -32,7 +35,7 @@ def remove_setups_pickle():
     setup_path = os.path.join(projects.dir, 'setups.pickle')
     try:
         os.remove(setup_path)
-        print(f'File "setups.pickle" successfully removed from directory "{projects.dir}".')
+        logger.info(f'File "setups.pickle" successfully removed from directory "{projects.dir}".')
     except FileNotFoundError:
         warn(f'"setups.pickle" not found in directory "{projects.dir}", no file removed.',
              stacklevel=2)
@@ -49,15 +52,85 @@ def export_df(df, path, show=False):
             df.to_csv(path)
         elif (path.endswith('.xlsx') or path.endswith('.xls')):
             df.to_excel(path)
+        elif path.endswith('.npz'):
+            _to_npz(df, path)
         else:
             extension = path.split('.')[-1]
-            raise ValueError('Only "tsv", "csv", "xlsx", or "xls" files are supported, ' \
+            raise ValueError('Only "tsv", "csv", "xlsx", "xls", or "npz" files are supported, ' \
                              f'not {extension}.')
 
         file_path, file_name = os.path.split(path)
-        print(f'File "{file_name}" has been exported to "{file_path}".')
+        logger.info(f'File "{file_name}" has been exported to "{file_path}".')
     
 
+def _label(label):
+    return list(label) if isinstance(label, tuple) else label
+
+
+def _numeric_below_head(col):
+    # Values of a column with a text head (e.g., the unit row of `get_CFs` tables)
+    # and numbers below, None if the column is not like this
+    import pandas as pd
+    if len(col) < 2 or not isinstance(col.iloc[0], str):
+        return None
+    try:
+        values = pd.to_numeric(col.iloc[1:], errors='raise')
+    except (ValueError, TypeError):
+        return None
+    return values.to_numpy(dtype=float) if pd.api.types.is_numeric_dtype(values) else None
+
+
+def _to_npz(df, path):
+    # Columns as numpy arrays (categorical ones as codes and categories), no pickling,
+    # numeric columns below a text head (e.g., units) are kept numeric with the head in the meta
+    import numpy as np, pandas as pd
+    arrays, columns, heads = {}, [], {}
+    for n, (label, col) in enumerate(df.items()):
+        columns.append(_label(label))
+        if hasattr(col, 'cat'):
+            arrays[f'{n}_codes'] = col.cat.codes.to_numpy()
+            arrays[f'{n}_categories'] = col.cat.categories.to_numpy().astype(str)
+        elif pd.api.types.is_numeric_dtype(col):
+            arrays[f'{n}'] = col.to_numpy()
+        elif _numeric_below_head(col) is not None:
+            heads[n] = col.iloc[0]
+            arrays[f'{n}'] = _numeric_below_head(col)
+        else:
+            missing = col.isna().to_numpy()
+            arrays[f'{n}'] = col.to_numpy().astype(str)
+            if missing.any():
+                arrays[f'{n}_missing'] = missing
+    index = df.index
+    arrays['index'] = index.to_numpy() if pd.api.types.is_numeric_dtype(index) \
+        else index.to_numpy().astype(str)
+    meta = {'columns': columns, 'column_names': list(df.columns.names), 'heads': heads}
+    np.savez_compressed(path, meta=np.array(json.dumps(meta)), **arrays)
+
+
+def read_npz(path):
+    '''Read the :class:`pandas.DataFrame` exported to a ".npz" file through `export_df`.'''
+    import numpy as np, pandas as pd
+    with np.load(path, allow_pickle=False) as f:
+        meta = json.loads(f['meta'].item())
+        heads = meta.get('heads', {})
+        data = {}
+        for n, label in enumerate(meta['columns']):
+            if f'{n}_codes' in f:
+                col = pd.Categorical.from_codes(f[f'{n}_codes'], categories=f[f'{n}_categories'])
+            elif str(n) in heads:
+                col = np.array([heads[str(n)], *f[f'{n}'].tolist()], dtype=object)
+            else:
+                col = f[f'{n}']
+                if f'{n}_missing' in f:
+                    col = col.astype(object)
+                    col[f[f'{n}_missing']] = np.nan
+            data[tuple(label) if isinstance(label, list) else label] = col
+        df = pd.DataFrame(data, index=f['index'])
+    if len(meta['column_names']) > 1:
+        df.columns = pd.MultiIndex.from_tuples(df.columns, names=meta['column_names'])
+    return df
+
+
 def format_name(name):
     name = name.replace(', ', ' ')
     name = name.replace('-', ' ')
@@ -30,6 +30,13 @@ setup(
         'beautifulsoup4',
         'py7zr',
     ],
+    extras_require={
+        'yaml': ['pyyaml'],
+        'qsdsan': ['qsdsan'],
+    },
+    entry_points={
+        'console_scripts': ['bw2qsd=bw2qsd._cli:main'],
+    },
     package_data=
         {'bw2qsd': [
             'eidl/*',